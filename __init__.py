@@ -1,4 +1,5 @@
 import os
+import atexit
 import json
 import subprocess
 import sys
@@ -6,36 +7,38 @@ import asyncio
 import logging
 import hashlib
 import time
+import uuid
 import aiohttp
 from aiohttp import web
 from server import PromptServer
 
-from PIL import Image, PngImagePlugin
-
+from .downloadScripts.civitai_client import CivitaiClient
+from .downloadScripts.hash_cache import HashCache
 from .downloadScripts.lora_update_service import LoraUpdateService
+from .downloadScripts.example_downloader import ExampleDownloader
+from .downloadScripts.example_plan import plan_manifest_items
+from .downloadScripts.image_metadata import read_metadata_bytes
+from .downloadScripts.download_manifest import (
+    DONE,
+    DOWNLOADING,
+    FAILED,
+    DownloadManifest,
+    save_item_atomically,
+)
 
-# 尝试使用 orjson（比标准 json 快 2-3 倍）
-try:
-    import orjson
-
-    JSON_DUMP = orjson.dumps
-    JSON_LOAD = orjson.loads
-    JSON_ENSURE_ASCII = False
-    ORJSON_AVAILABLE = True
-
-    # 检查 orjson 是否支持 OPT_INDENT_2
-    try:
-        ORJSON_OPT_INDENT = orjson.OPT_INDENT_2
-    except AttributeError:
-        # 旧版本 orjson 不支持 OPT_INDENT_2，禁用 orjson
-        ORJSON_AVAILABLE = False
-        JSON_DUMP = json.dumps
-        JSON_LOAD = json.loads
-except ImportError:
-    JSON_DUMP = json.dumps
-    JSON_LOAD = json.loads
-    JSON_ENSURE_ASCII = False
-    ORJSON_AVAILABLE = False
+from .json_io import save_json_file
+from .prompt_store import PromptStore
+from .lora_catalog import LoraCatalog
+from .reference_index import FACET_FIELDS, ReferenceIndex
+from .fs_watcher import DirectoryWatcher
+from .media_files import (
+    IMAGE_TYPES,
+    MEDIA_TYPES,
+    file_response,
+    resolve_under,
+    serve_media,
+)
+from .thumbnails import THUMBNAIL_TYPES, ThumbnailCache
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +60,8 @@ def is_port_in_use(port: int) -> bool:
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 DATA_FILE = os.path.join(DATA_DIR, "prompts.json")
 DEFAULT_FILE = os.path.join(DATA_DIR, "prompts_default.json")
-CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache", "reference_images")
+CACHE_ROOT = os.path.join(os.path.dirname(__file__), "cache")
+CACHE_DIR = os.path.join(CACHE_ROOT, "reference_images")
 EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), "prompt_example")
 
 # 确保目录和文件存在
@@ -67,107 +71,6 @@ os.makedirs(EXAMPLE_DIR, exist_ok=True)
 
 
 # ===== 图像下载和缓存函数 =====
-def write_png_metadata(image_path, metadata):
-    """将metadata写入PNG文件的tEXt块"""
-    try:
-        from PIL import Image, PngImagePlugin
-        from PIL.PngImagePlugin import PngInfo
-
-        # 打开图像
-        img = Image.open(image_path)
-
-        # 创建PngInfo对象
-        pnginfo = PngInfo()
-
-        # 写入metadata
-        if isinstance(metadata, dict):
-            for key, value in metadata.items():
-                if value is not None:
-                    # 将值转换为字符串
-                    str_value = str(value)
-                    # PNG的tEXt块只支持Latin-1编码，需要处理非ASCII字符
-                    try:
-                        pnginfo.add_text(key, str_value)
-                    except UnicodeEncodeError:
-                        # 对于非ASCII字符，使用UTF-8编码并标记
-                        encoded_value = str_value.encode(
-                            "utf-8", errors="ignore"
-                        ).decode("latin-1")
-                        pnginfo.add_text(key, encoded_value)
-
-        # 保存图像（覆盖原文件）
-        img.save(image_path, format="PNG", pnginfo=pnginfo)
-        return True
-    except ImportError:
-        logger.error("PIL not installed, cannot write PNG metadata")
-        return False
-    except Exception as e:
-        logger.error(f"Error writing PNG metadata: {e}")
-        return False
-
-
-def save_json_metadata(image_path, metadata):
-    """将 metadata 保存为同名的 JSON 文件"""
-    try:
-        json_path = os.path.splitext(image_path)[0] + ".json"
-
-        # 添加提取时间戳
-        json_metadata = metadata.copy()
-        json_metadata["extracted_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
-
-        # 使用优化的 JSON 写入
-        if ORJSON_AVAILABLE:
-            # orjson 返回 bytes，使用 option 参数格式化
-            json_bytes = JSON_DUMP(json_metadata, option=ORJSON_OPT_INDENT)
-            with open(json_path, "wb") as f:
-                f.write(json_bytes)
-        else:
-            # 标准库回退
-            with open(json_path, "w", encoding="utf-8") as f:
-                JSON_DUMP(json_metadata, f, ensure_ascii=JSON_ENSURE_ASCII, indent=2)
-
-        return True
-    except Exception as e:
-        logger.warning(f"Error saving JSON metadata: {e}")
-        return False
-
-
-def load_json_file(file_path, default=None):
-    """优化的 JSON 文件读取函数"""
-    try:
-        if ORJSON_AVAILABLE:
-            # orjson 读取二进制模式
-            with open(file_path, "rb") as f:
-                return JSON_LOAD(f.read())
-        else:
-            # 标准库回退
-            with open(file_path, "r", encoding="utf-8") as f:
-                return JSON_LOAD(f)
-    except FileNotFoundError:
-        return default
-    except Exception as e:
-        logger.warning(f"Error loading JSON file {file_path}: {e}")
-        return default
-
-
-def save_json_file(file_path, data, indent=2):
-    """优化的 JSON 文件写入函数"""
-    try:
-        if ORJSON_AVAILABLE:
-            # orjson 只支持 OPT_INDENT_2（2空格缩进），忽略其他缩进值
-            json_bytes = JSON_DUMP(data, option=ORJSON_OPT_INDENT)
-            with open(file_path, "wb") as f:
-                f.write(json_bytes)
-        else:
-            # 标准库回退
-            with open(file_path, "w", encoding="utf-8") as f:
-                JSON_DUMP(data, f, ensure_ascii=JSON_ENSURE_ASCII, indent=indent)
-        return True
-    except Exception as e:
-        logger.warning(f"Error saving JSON file {file_path}: {e}")
-        return False
-
-
 def get_image_cache_path(url):
     """根据URL生成缓存文件路径"""
     # 使用URL的MD5哈希作为文件名
@@ -209,59 +112,19 @@ async def download_image(url, session):
         return None
 
 
-def is_subset(user_data, default_data):
-    """
-    检查user_data是否是default_data的子集
-    子集定义：user_data中的所有项都在default_data中存在（根据name判断）
-    """
-    if not isinstance(user_data, list) or not isinstance(default_data, list):
-        return False
-
-    default_names = {item.get("name") for item in default_data}
-
-    for item in user_data:
-        name = item.get("name")
-        if name not in default_names:
-            return False
-
-    return True
-
-
-def sync_prompts():
-    """
-    同步prompts.json和prompts_default.json
-    如果prompts.json是prompts_default.json的子集，则更新为最新的default
-    否则不更新
-    """
-    # 确保default文件存在
-    if not os.path.exists(DEFAULT_FILE):
-        save_json_file(DEFAULT_FILE, [], indent=4)
-
-    # 读取default数据
-    default_data = load_json_file(DEFAULT_FILE, [])
-
-    # 如果user文件不存在，创建为default的副本
-    if not os.path.exists(DATA_FILE):
-        save_json_file(DATA_FILE, default_data, indent=4)
-        return
-
-    # 读取user数据
-    user_data = load_json_file(DATA_FILE, [])
-
-    # 检查user_data是否是default_data的子集
-    if is_subset(user_data, default_data):
-        # 如果是子集，同步为最新的default
-        save_json_file(DATA_FILE, default_data, indent=4)
+# 提示词库常驻内存，插件加载时读取一次
+prompt_store = PromptStore(DATA_FILE, DEFAULT_FILE)
+prompt_store.load()
+# 退出时把修改日志折叠进 prompts.json
+atexit.register(prompt_store.close)
 
 
 def load_prompts():
-    # 启动时同步一次
-    sync_prompts()
-    return load_json_file(DATA_FILE, [])
+    return prompt_store.get_all()
 
 
 def save_prompts(data):
-    save_json_file(DATA_FILE, data, indent=4)
+    prompt_store.replace_all(data)
 
 
 # API 路由
@@ -275,288 +138,218 @@ async def save_prompts_api(request):
     return web.Response(text="OK")
 
 
-async def add_prompt(request):
-    item = await request.json()
-    # 确保新项目有完整的字段
+def fill_prompt_defaults(item):
+    """确保新项目有完整的字段"""
     if "direction" not in item:
         item["direction"] = "无"
     if "type" not in item:
         item["type"] = "其它"
-    prompts = load_prompts()
-    prompts.append(item)
-    save_prompts(prompts)
-    return web.json_response(prompts)
+    return item
+
+
+async def add_prompt(request):
+    item = await request.json()
+    prompt_store.add(fill_prompt_defaults(item))
+    return web.json_response(load_prompts())
 
 
 async def delete_prompt(request):
     data = await request.json()
-    index = data["index"]
-    prompts = load_prompts()
-    if 0 <= index < len(prompts):
-        prompts.pop(index)
-        save_prompts(prompts)
-    return web.json_response(prompts)
+    prompt_id = prompt_store.id_at(data["index"])
+    if prompt_id is not None:
+        prompt_store.delete(prompt_id)
+    return web.json_response(load_prompts())
 
 
 async def update_prompt(request):
     data = await request.json()
-    index = data["index"]
-    prompts = load_prompts()
-    if 0 <= index < len(prompts):
-        prompts[index] = {
-            "name": data.get("name", prompts[index].get("name", "")),
-            "direction": data.get("direction", prompts[index].get("direction", "无")),
-            "type": data.get("type", prompts[index].get("type", "其它")),
-            "note": data.get("note", prompts[index].get("note", "")),
-            "text": data.get("text", prompts[index].get("text", "")),
-        }
-        save_prompts(prompts)
-    return web.json_response(prompts)
+    prompt_id = prompt_store.id_at(data["index"])
+    if prompt_id is not None:
+        prompt_store.update(prompt_id, data)
+    return web.json_response(load_prompts())
 
 
-# ===== Lora 数据接口 =====
-def get_lora_data():
-    """
-    扫描ComfyUI/models/loras目录，获取所有Lora文件信息
-    相对路径: ../../models/loras/
-    """
-    # 计算相对于插件目录的路径
-    plugin_dir = os.path.dirname(__file__)
-    lora_dir = os.path.join(plugin_dir, "..", "..", "models", "loras")
-    lora_dir = os.path.normpath(lora_dir)
+# ===== 按 id 的增量接口：只返回变化的条目和库版本号 =====
+async def add_prompt_item(request):
+    """添加提示词，返回新条目"""
+    item = await request.json()
+    change = prompt_store.add(fill_prompt_defaults(item))
+    return web.json_response({"item": change["item"], "version": change["version"]})
 
-    if not os.path.exists(lora_dir):
-        logger.warning(f"Lora directory not found: {lora_dir}")
-        return {"categories": [], "loras": []}
 
-    loras = []
-    categories = set()
+async def update_prompt_item(request):
+    """按 id 更新提示词，返回更新后的条目"""
+    data = await request.json()
+    prompt_id = data.get("id")
+    change = prompt_store.update(prompt_id, data) if prompt_id else None
+    if change is None:
+        return web.json_response(
+            {
+                "error": "Prompt not found",
+                "id": prompt_id,
+                "version": prompt_store.version,
+            },
+            status=404,
+        )
+    return web.json_response({"item": change["item"], "version": change["version"]})
+
+
+async def delete_prompt_item(request):
+    """按 id 删除提示词，支持 {"id": ...} 或批量 {"ids": [...]}"""
+    data = await request.json()
+    ids = data.get("ids") or ([data["id"]] if data.get("id") else [])
+    deleted = [prompt_id for prompt_id in ids if prompt_store.delete(prompt_id)]
+    return web.json_response({"deleted": deleted, "version": prompt_store.version})
+
 
-    # 扫描目录
+async def get_prompt_changes(request):
+    """获取 since 版本之后的变化，版本过旧时返回全量"""
     try:
-        for root, dirs, files in os.walk(lora_dir):
-            for file in files:
-                if file.endswith(".metadata.json"):
-                    metadata_path = os.path.join(root, file)
-
-                    try:
-                        metadata = load_json_file(metadata_path, None)
-                        if metadata is None:
-                            continue
-
-                        # 获取类别（目录名）
-                        rel_dir = os.path.relpath(root, lora_dir)
-                        if rel_dir == ".":
-                            category = "root"
-                        else:
-                            category = rel_dir.replace("\\", "/")
-
-                        categories.add(category)
-
-                        # 从metadata中提取信息
-                        model_name = metadata.get(
-                            "model_name", metadata.get("file_name", "")
-                        )
-                        base_model = metadata.get("base_model", "")
-
-                        # 提取触发词
-                        trigger_words = []
-                        if (
-                            "civitai" in metadata
-                            and "trainedWords" in metadata["civitai"]
-                        ):
-                            trained_words = metadata["civitai"]["trainedWords"]
-                            if (
-                                isinstance(trained_words, list)
-                                and len(trained_words) > 0
-                            ):
-                                # 将所有训练词合并并提取
-                                all_words_str = ", ".join(trained_words)
-                                # 分割并清理
-                                words = [
-                                    w.strip()
-                                    for w in all_words_str.split(",")
-                                    if w.strip()
-                                ]
-                                trigger_words = words[:5]  # 只取前5个触发词
-
-                        # 获取描述
-                        notes = metadata.get("notes", "")
-
-                        # 获取预览图路径
-                        preview_url = metadata.get("preview_url", None)
-
-                        # 获取模型文件路径
-                        model_path = metadata.get("file_path", None)
-
-                        # 如果路径不存在，尝试本地查找
-                        if not model_path or not os.path.exists(model_path):
-                            # 从metadata文件名推断模型文件名
-                            base_name = file.replace(".metadata.json", "")
-                            safetensors_file = os.path.join(
-                                root, base_name + ".safetensors"
-                            )
-                            if os.path.exists(safetensors_file):
-                                model_path = safetensors_file
-
-                        # 如果预览图路径不存在，尝试本地查找
-                        if not preview_url or not os.path.exists(preview_url):
-                            base_name = file.replace(".metadata.json", "")
-                            # 尝试多种图片格式
-                            for ext in [".jpeg", ".jpg", ".png"]:
-                                preview_file = os.path.join(root, base_name + ext)
-                                if os.path.exists(preview_file):
-                                    preview_url = preview_file
-                                    break
-
-                        # 将预览图路径转换为web可访问的相对路径
-                        if preview_url and os.path.exists(preview_url):
-                            try:
-                                # 计算相对于ComfyUI根目录的路径
-                                comfyui_root = os.path.normpath(
-                                    os.path.join(plugin_dir, "..", "..")
-                                )
-                                rel_path = os.path.relpath(preview_url, comfyui_root)
-                                # 使用自定义图片端点
-                                web_url = (
-                                    "/prompt_manage/lora/image?path="
-                                    + rel_path.replace("\\", "/")
-                                )
-                                preview_url = web_url
-                            except Exception as e:
-                                logger.warning(
-                                    f"Failed to convert preview path {preview_url}: {e}"
-                                )
-                                preview_url = None
-
-                        loras.append(
-                            {
-                                "name": model_name,
-                                "base_model": base_model,
-                                "filename": file.replace(".metadata.json", ""),
-                                "category": category,
-                                "trigger_words": trigger_words,
-                                "preview_url": preview_url,
-                                "notes": notes,
-                                "path": model_path,
-                            }
-                        )
+        since = int(request.query.get("since", 0))
+    except ValueError:
+        since = 0
+    return web.json_response(prompt_store.changes_since(since))
 
-                    except json.decoder.JSONDecodeError as e:
-                        logger.warning(f"Failed to parse JSON in {metadata_path}: {e}")
-                    except Exception as e:
-                        logger.warning(f"Error reading metadata {metadata_path}: {e}")
 
-    except Exception as e:
-        logger.error(f"Error scanning lora directory: {e}")
+async def search_prompts(request):
+    """
+    服务端搜索提示词
+
+    参数: q, mode=fuzzy|exact, type, direction, offset, limit（0 表示不限制），
+    fields（逗号分隔，只返回这些字段）
+    """
+    query = request.query.get("q", "")
+    mode = request.query.get("mode", "fuzzy")
+    try:
+        offset = max(int(request.query.get("offset", 0)), 0)
+        limit = int(request.query.get("limit", 50))
+    except ValueError:
+        offset = 0
+        limit = 50
+    result = prompt_store.search(
+        query,
+        mode="exact" if mode == "exact" else "fuzzy",
+        prompt_type=request.query.get("type") or None,
+        direction=request.query.get("direction") or None,
+        offset=offset,
+        limit=limit,
+    )
+    fields = [f for f in request.query.get("fields", "").split(",") if f]
+    if fields:
+        result["results"] = [
+            {field: item.get(field) for field in fields} for item in result["results"]
+        ]
+    return web.json_response(result)
 
-    return {"categories": sorted(list(categories)), "loras": loras}
 
+# ===== Lora 数据接口 =====
+LORA_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "models", "loras")
+)
+COMFYUI_ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", ".."))
 
-async def get_loras(request):
-    """获取Lora列表API"""
-    return web.json_response(get_lora_data())
+# Lora 索引持久化在 cache/ 下，只重新解析有变化的 metadata
+lora_catalog = LoraCatalog(
+    LORA_DIR, COMFYUI_ROOT, os.path.join(CACHE_ROOT, "lora_catalog.json")
+)
 
 
-async def get_lora_image(request):
-    """获取Lora预览图片"""
+def get_lora_data():
+    """
+    获取ComfyUI/models/loras目录下所有Lora文件信息
+    相对路径: ../../models/loras/
+    """
+    return lora_catalog.get_data()
+
+
+async def get_loras(request):
+    """
+    获取Lora列表API
+
+    参数: category, base_model, search, sort（name|filename|base_model|category，
+    前缀 - 表示降序）, offset, limit（0 表示不限制），
+    fields（逗号分隔，只返回这些字段，例如列表视图不需要 notes）
+    """
     try:
-        # 获取相对路径参数
-        rel_path = request.query.get("path", "")
-        if not rel_path:
-            return web.Response(status=400, text="Missing path parameter")
+        offset = max(int(request.query.get("offset", 0)), 0)
+        limit = int(request.query.get("limit", 0))
+    except ValueError:
+        offset = 0
+        limit = 0
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        None,
+        lambda: lora_catalog.query(
+            category=request.query.get("category") or None,
+            base_model=request.query.get("base_model") or None,
+            search=request.query.get("search") or None,
+            sort=request.query.get("sort") or None,
+            offset=offset,
+            limit=limit,
+        ),
+    )
+    fields = [f for f in request.query.get("fields", "").split(",") if f]
+    if fields:
+        result["loras"] = [
+            {field: lora.get(field) for field in fields} for lora in result["loras"]
+        ]
+    return web.json_response(result)
 
-        # 构建完整路径
-        plugin_dir = os.path.dirname(__file__)
-        comfyui_root = os.path.normpath(os.path.join(plugin_dir, "..", ".."))
-        full_path = os.path.normpath(os.path.join(comfyui_root, rel_path.lstrip("/")))
 
-        # 安全检查：确保路径在允许的目录下
-        try:
-            # 规范化路径并检查是否在comfyui根目录下
-            full_path = os.path.abspath(full_path)
-            comfyui_root_abs = os.path.abspath(comfyui_root)
-
-            # 确保路径以comfyui根目录开头
-            if (
-                not full_path.startswith(comfyui_root_abs + os.sep)
-                and full_path != comfyui_root_abs
-            ):
-                logger.warning(f"Access denied: path not under comfyui root")
-                return web.Response(status=403, text="Access denied")
-        except Exception as e:
-            logger.error(f"Path validation error: {e}")
-            return web.Response(status=403, text="Access denied")
-
-        if not os.path.exists(full_path):
-            return web.Response(status=404, text="File not found")
-
-        # 检查文件扩展名
-        allowed_image_exts = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
-        allowed_video_exts = [".mp4", ".avi", ".mov", ".mkv", ".webm"]
-
-        is_image = any(full_path.lower().endswith(ext) for ext in allowed_image_exts)
-        is_video = any(full_path.lower().endswith(ext) for ext in allowed_video_exts)
-
-        if not (is_image or is_video):
-            return web.Response(status=403, text="Invalid file type")
-
-        # 如果是视频文件，返回视频数据
-        if is_video:
-            try:
-                with open(full_path, "rb") as f:
-                    content = f.read()
-
-                # 根据文件扩展名设置Content-Type
-                ext = os.path.splitext(full_path)[1].lower()
-                content_type = {
-                    ".mp4": "video/mp4",
-                    ".avi": "video/avi",
-                    ".mov": "video/quicktime",
-                    ".mkv": "video/x-matroska",
-                    ".webm": "video/webm",
-                }.get(ext, "video/mp4")
-
-                return web.Response(body=content, content_type=content_type)
-            except Exception as e:
-                logger.error(f"Error reading video file: {e}")
-                return web.Response(status=500, text="Error reading video file")
+# 缩略图缓存，大小上限可用环境变量 PROMPT_MANAGE_THUMB_CACHE_MB 调整
+thumbnail_cache = ThumbnailCache(
+    os.path.join(CACHE_ROOT, "thumbnails"),
+    int(os.environ.get("PROMPT_MANAGE_THUMB_CACHE_MB", "512")) * 1024 * 1024,
+)
+atexit.register(thumbnail_cache.close)
 
-        # 处理图片文件
-        with open(full_path, "rb") as f:
-            content = f.read()
 
-        # 根据文件扩展名设置Content-Type
-        ext = os.path.splitext(full_path)[1].lower()
-        content_type = {
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
-            ".webp": "image/webp",
-        }.get(ext, "image/jpeg")
+async def serve_image(request, content_types):
+    """
+    图片接口共用：带 w 参数时返回缩略图（format=webp|jpeg|png，默认 webp），
+    否则返回原图；视频和无法解码的图片也返回原文件
+    """
+    width = request.query.get("w")
+    if width:
+        full_path = resolve_under(COMFYUI_ROOT, request.query.get("path", ""))
+        if (
+            full_path
+            and os.path.splitext(full_path)[1].lower() in IMAGE_TYPES
+            and os.path.isfile(full_path)
+        ):
+            thumb_path = await thumbnail_cache.get(
+                full_path, width, request.query.get("format", "webp")
+            )
+            if thumb_path:
+                return file_response(thumb_path, THUMBNAIL_TYPES)
+    return serve_media(request, COMFYUI_ROOT, content_types)
 
-        return web.Response(body=content, content_type=content_type)
 
-    except Exception as e:
-        logger.error(f"Error serving image: {e}")
-        return web.Response(status=500, text="Internal server error")
+async def get_lora_image(request):
+    """获取Lora预览图片或视频（流式发送，支持 Range 和 304；图片可带 w 获取缩略图）"""
+    return await serve_image(request, MEDIA_TYPES)
 
 
 # ===== 下载任务管理器 =====
+# 示例图下载清单，记录每个条目的状态，用于跳过已完成的条目和继续中断的任务
+EXAMPLE_MANIFEST_FILE = os.path.join(CACHE_ROOT, "example_download_manifest.jsonl")
 _download_task = {
     "running": False,
     "cancelled": False,
     "progress": 0,
     "total": 0,
     "category_progress": {},  # {category: {"completed": 0, "total": 0}}
+    "job_id": None,
+    "job": None,  # 后台 asyncio.Task
+    "status": "idle",  # idle / running / completed / cancelled / failed
+    "message": "",
+    "result": None,
 }
 
 
 def cancel_download():
-    """取消下载任务"""
+    """取消下载任务（后台任务领取完当前条目后停止，结束时清除 running）"""
     _download_task["cancelled"] = True
-    _download_task["running"] = False
 
 
 def is_download_cancelled():
@@ -571,6 +364,9 @@ def reset_download_task():
     _download_task["progress"] = 0
     _download_task["total"] = 0
     _download_task["category_progress"] = {}
+    _download_task["status"] = "idle"
+    _download_task["message"] = ""
+    _download_task["result"] = None
 
 
 def update_category_progress(category, completed, total):
@@ -581,281 +377,38 @@ def update_category_progress(category, completed, total):
     _download_task["category_progress"][category]["total"] = total
 
 
-# ===== 缓存管理 =====
-_reference_cache = {
-    "categories": [],
-    "data_hash": "",
-    "category_cache": {},  # {category: {"hash": "", "data": [], "total": 0}}
-}
-
-
-def get_category_cache_path(category):
-    """获取类别缓存文件的路径"""
-    if not category:
-        category = "all"
-    safe_category = "".join(
-        c for c in category if c.isalnum() or c in ("_", "-")
-    ).strip()
-    return os.path.join(CACHE_DIR, f"reference_cache_{safe_category}.json")
-
-
-def compute_data_hash(data_list):
-    """计算数据列表的哈希值"""
-    if not data_list:
-        return ""
-
-    # 创建一个可哈希的字符串表示
-    hash_input = "|".join(
-        [
-            f"{item['lora_name']}|{item['category']}|{item['prompt'][:50]}"
-            for item in data_list
-        ]
-    )
-    return hashlib.md5(hash_input.encode("utf-8")).hexdigest()
-
-
-def load_category_cache(category):
-    """从磁盘加载类别缓存"""
-    cache_path = get_category_cache_path(category)
-    if os.path.exists(cache_path):
-        return load_json_file(cache_path)
-    return None
-
-
-def save_category_cache(category, cache_data):
-    """保存类别缓存到磁盘"""
-    cache_path = get_category_cache_path(category)
-    try:
-        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-        save_json_file(cache_path, cache_data, indent=2)
-    except Exception as e:
-        logger.warning(f"Failed to save cache for category {category}: {e}")
+# ===== 参考图索引 =====
+# 参考图索引持久化在 cache/ 下，只重新读取有变化的图片和 JSON
+reference_index = ReferenceIndex(
+    EXAMPLE_DIR, COMFYUI_ROOT, os.path.join(CACHE_ROOT, "reference_index.json")
+)
 
 
-async def get_prompt_reference_data(category=None, search=None, offset=0, limit=200):
+async def get_prompt_reference_data(
+    category=None, search=None, offset=0, limit=200, filters=None, sort=None
+):
     """
-    从本地示例图目录读取图像和PNG metadata中的提示词信息
-    支持分页加载，带缓存机制
+    从参考图索引读取示例图和提示词信息（支持分页）
 
     Args:
         category: 类别筛选（None或空字符串表示所有类别）
         search: 搜索关键词（None表示不搜索）
         offset: 偏移量（从第几条开始）
-        limit: 返回数量限制（默认100条）
+        limit: 返回数量限制（0 表示只返回类别、分面和总数）
+        filters: 分面筛选 {分面: [取值]}
+        sort: 排序方式（date / resolution / name，None 表示默认顺序）
     """
-    plugin_dir = os.path.dirname(__file__)
-    comfyui_root = os.path.normpath(os.path.join(plugin_dir, "..", ".."))
-
-    if not os.path.exists(EXAMPLE_DIR):
-        return {"categories": [], "references": [], "total": 0}
-
-    # 使用空字符串表示"全部类别"以避免None和空字符串的混淆
-    category_key = category if category else ""
-
-    # 检查是否有缓存
-    cache_key = category_key
-    if cache_key not in _reference_cache["category_cache"]:
-        # 尝试从磁盘加载缓存
-        disk_cache = load_category_cache(cache_key)
-        if disk_cache:
-            _reference_cache["category_cache"][cache_key] = disk_cache
-
-    # 扫描指定类别的目录
-    scan_dir = EXAMPLE_DIR
-    if category_key:
-        scan_dir = os.path.join(EXAMPLE_DIR, category_key)
-        if not os.path.exists(scan_dir):
-            # 类别目录不存在，返回空结果
-            return {
-                "categories": [],
-                "references": [],
-                "total": 0,
-                "offset": offset,
-                "limit": limit,
-                "has_more": False,
-            }
-
-    all_references = []
-    categories = set()
-
-    try:
-        # 只扫描指定的目录（不递归子目录，因为每个类别是一个独立的目录）
-        for root, dirs, files in os.walk(scan_dir):
-            # 如果指定了类别，不要深入子目录（除非类别本身就是嵌套的）
-            if category_key and root != scan_dir:
-                continue
-
-            for file in files:
-                if file.lower().endswith((".png", ".jpg", ".jpeg")):
-                    image_path = os.path.join(root, file)
-
-                    try:
-                        # 优先尝试读取 JSON 文件
-                        json_path = os.path.splitext(image_path)[0] + ".json"
-                        png_metadata = {}
-
-                        if os.path.exists(json_path):
-                            try:
-                                json_metadata = load_json_file(json_path)
-                                if json_metadata:
-                                    png_metadata = {
-                                        "prompt": json_metadata.get("prompt", ""),
-                                        "negative_prompt": json_metadata.get(
-                                            "negative_prompt", ""
-                                        ),
-                                        "steps": json_metadata.get("steps", ""),
-                                        "sampler": json_metadata.get("sampler", ""),
-                                        "cfg_scale": json_metadata.get("cfg_scale", ""),
-                                        "seed": json_metadata.get("seed", ""),
-                                        "model": json_metadata.get("model", ""),
-                                        "width": json_metadata.get("width", 0),
-                                        "height": json_metadata.get("height", 0),
-                                        "lora_name": json_metadata.get("lora_name", ""),
-                                    }
-                            except Exception as e:
-                                logger.debug(
-                                    f"Failed to read JSON for {file}: {e}, falling back to image"
-                                )
-                                png_metadata = {}
-
-                        # 如果 JSON 不存在或读取失败，从图像提取
-                        if not png_metadata:
-                            # 读取图像和PNG metadata
-                            with Image.open(image_path) as img:
-                                if hasattr(img, "text"):
-                                    png_metadata = img.text.copy()
-
-                                # 获取图像尺寸（如果metadata中没有）
-                                if (
-                                    "width" not in png_metadata
-                                    or "height" not in png_metadata
-                                ):
-                                    png_metadata["width"] = img.width
-                                    png_metadata["height"] = img.height
-
-                        # 提取提示词
-                        prompt = png_metadata.get("prompt", "")
-                        if not prompt:
-                            continue
-
-                        # 获取类别（目录名）
-                        rel_dir = os.path.relpath(root, EXAMPLE_DIR)
-                        if rel_dir == ".":
-                            file_category = "root"
-                        else:
-                            file_category = rel_dir.replace("\\", "/")
-
-                        categories.add(file_category)
-
-                        # 获取Lora名称
-                        lora_name = png_metadata.get("lora_name", file)
-
-                        # 获取负向提示词
-                        negative_prompt = png_metadata.get("negative_prompt", "")
-
-                        # 生成图像URL
-                        try:
-                            rel_path = os.path.relpath(image_path, comfyui_root)
-                            image_url = (
-                                "/prompt_manage/example/image?path="
-                                + rel_path.replace("\\", "/")
-                            )
-                        except Exception as e:
-                            logger.warning(f"Failed to convert image path: {e}")
-                            continue
-
-                        all_references.append(
-                            {
-                                "lora_name": lora_name,
-                                "category": file_category,
-                                "image_url": image_url,
-                                "prompt": prompt,
-                                "negative_prompt": negative_prompt,
-                                "width": png_metadata.get(
-                                    "width", png_metadata["width"]
-                                ),
-                                "height": png_metadata.get(
-                                    "height", png_metadata["height"]
-                                ),
-                                "steps": png_metadata.get("steps", ""),
-                                "sampler": png_metadata.get("sampler", ""),
-                                "cfg_scale": png_metadata.get("cfg_scale", ""),
-                                "seed": png_metadata.get("seed", ""),
-                                "model": png_metadata.get("model", ""),
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"Error reading image {image_path}: {e}")
-                        continue  # 跳过有问题的图像文件
-
-    except Exception as e:
-        logger.error(f"Error scanning for prompt reference: {e}")
-
-    # 计算数据的哈希值
-    current_hash = compute_data_hash(all_references)
-
-    # 检查缓存是否有效
-    cache_data = _reference_cache["category_cache"].get(cache_key)
-    if cache_data and cache_data.get("hash") == current_hash:
-        # 使用缓存的数据
-        filtered_references = cache_data["data"]
-        logger.debug(f"Using cached data for category {cache_key}")
-    else:
-        # 更新缓存
-        # 先应用搜索筛选（因为搜索不影响缓存）
-        if search:
-            search_lower = search.lower()
-            all_references = [
-                ref
-                for ref in all_references
-                if (
-                    search_lower in ref["lora_name"].lower()
-                    or search_lower in ref["prompt"].lower()
-                )
-            ]
-
-        cache_data = {
-            "hash": current_hash,
-            "data": all_references,
-            "total": len(all_references),
-        }
-        _reference_cache["category_cache"][cache_key] = cache_data
-        # 保存到磁盘
-        save_category_cache(cache_key, cache_data)
-        filtered_references = all_references
-
-    # 如果有搜索条件，再次筛选（因为缓存的数据可能不包含搜索筛选）
-    if search and cache_data.get("hash") == current_hash:
-        search_lower = search.lower()
-        filtered_references = [
-            ref
-            for ref in filtered_references
-            if (
-                search_lower in ref["lora_name"].lower()
-                or search_lower in ref["prompt"].lower()
-            )
-        ]
-
-    # 分页
-    total = len(filtered_references)
-    start_idx = offset
-    end_idx = min(offset + limit, total)
-    paginated_references = filtered_references[start_idx:end_idx]
-
-    # 获取所有类别列表（只在category为空时扫描）
-    all_categories = sorted(list(categories))
-    if not category_key and all_categories:
-        # 更新全局类别缓存
-        _reference_cache["categories"] = all_categories
-
-    return {
-        "categories": all_categories,
-        "references": paginated_references,
-        "total": total,
-        "offset": offset,
-        "limit": limit,
-        "has_more": end_idx < total,
-    }
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        lambda: reference_index.query(
+            category=category or None,
+            search=search or None,
+            offset=max(offset, 0),
+            limit=limit,
+            filters=filters,
+            sort=sort or None,
+        ),
+    )
 
 
 async def get_prompt_references(request):
@@ -869,278 +422,165 @@ async def get_prompt_references(request):
     except ValueError:
         offset = 0
         limit = 200
+    # 分面筛选：同一分面可以重复传多个取值，如 ?sampler=euler&sampler=euler_a
+    filters = {
+        field: request.query.getall(field)
+        for field in FACET_FIELDS
+        if field in request.query
+    }
+    sort = request.query.get("sort", None)
 
     return web.json_response(
-        await get_prompt_reference_data(category, search, offset, limit)
+        await get_prompt_reference_data(category, search, offset, limit, filters, sort)
+    )
+
+
+async def get_references_by_ids(request):
+    """
+    按 id 批量获取参考图记录
+
+    查询参数 ids 可以重复传，也可以用逗号分隔，如 ?ids=a&ids=b 或 ?ids=a,b
+    """
+    ids = [
+        ref_id.strip()
+        for value in request.query.getall("ids", [])
+        for ref_id in value.split(",")
+        if ref_id.strip()
+    ]
+    result = await asyncio.get_running_loop().run_in_executor(
+        None, reference_index.get_by_ids, ids
+    )
+    return web.json_response(result)
+
+
+async def get_reference_categories(request):
+    """获取参考图类别和每个类别的数量（只列目录，不读取图片和 JSON）"""
+    categories = await asyncio.get_running_loop().run_in_executor(
+        None, reference_index.categories
+    )
+    return web.json_response(
+        {
+            "categories": categories,
+            "total": sum(category["count"] for category in categories),
+        }
     )
 
 
 async def get_cache_image(request):
     """获取缓存的图像"""
+    return await serve_image(request, IMAGE_TYPES)
+
+
+async def run_example_download(job_id, resume=False):
+    """后台下载任务：扫描、并发下载，进度写入 _download_task，条目状态写入下载清单"""
+    loop = asyncio.get_running_loop()
+    result = {"success_count": 0, "failed_count": 0, "skipped_count": 0}
+    failed_items = []
+    manifest = DownloadManifest(EXAMPLE_MANIFEST_FILE)
+    logger.info(f"Example download job {job_id} started (resume={resume})")
     try:
-        # 获取相对路径参数
-        rel_path = request.query.get("path", "")
-        if not rel_path:
-            return web.Response(status=400, text="Missing path parameter")
+        await loop.run_in_executor(None, manifest.load)
+        items, total, skipped = await loop.run_in_executor(
+            None, plan_manifest_items, manifest, LORA_DIR, EXAMPLE_DIR, resume
+        )
+        result["skipped_count"] = skipped
+        _download_task["total"] = total
+        _download_task["progress"] = max(total - len(items), 0)
+
+        # 按目录统计待下载数量
+        category_totals = {}
+        for item in items:
+            category_totals[item["category"]] = (
+                category_totals.get(item["category"], 0) + 1
+            )
+        category_done = dict.fromkeys(category_totals, 0)
+        for category, count in category_totals.items():
+            update_category_progress(category, 0, count)
 
-        # 构建完整路径
-        plugin_dir = os.path.dirname(__file__)
-        comfyui_root = os.path.normpath(os.path.join(plugin_dir, "..", ".."))
-        full_path = os.path.normpath(os.path.join(comfyui_root, rel_path.lstrip("/")))
+        def on_start(item):
+            manifest.mark(item["save_path"], DOWNLOADING)
 
-        # 安全检查
-        try:
-            full_path = os.path.abspath(full_path)
-            comfyui_root_abs = os.path.abspath(comfyui_root)
-
-            if (
-                not full_path.startswith(comfyui_root_abs + os.sep)
-                and full_path != comfyui_root_abs
-            ):
-                logger.warning(f"Access denied: path not under comfyui root")
-                return web.Response(status=403, text="Access denied")
-        except Exception as e:
-            logger.error(f"Path validation error: {e}")
-            return web.Response(status=403, text="Access denied")
-
-        if not os.path.exists(full_path):
-            return web.Response(status=404, text="File not found")
-
-        # 检查文件扩展名
-        allowed_image_exts = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
-
-        is_image = any(full_path.lower().endswith(ext) for ext in allowed_image_exts)
-
-        if not is_image:
-            return web.Response(status=403, text="Invalid file type")
-
-        # 读取图像文件
-        with open(full_path, "rb") as f:
-            content = f.read()
-
-        # 根据文件扩展名设置Content-Type
-        ext = os.path.splitext(full_path)[1].lower()
-        content_type = {
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
-            ".webp": "image/webp",
-        }.get(ext, "image/jpeg")
-
-        return web.Response(body=content, content_type=content_type)
+        def on_done(item, error):
+            if error is None:
+                result["success_count"] += 1
+                manifest.mark(item["save_path"], DONE, file=item.get("file"))
+            else:
+                result["failed_count"] += 1
+                failed_items.append(item["url"])
+                manifest.mark(item["save_path"], FAILED, error)
+            _download_task["progress"] += 1
+            category = item["category"]
+            category_done[category] += 1
+            update_category_progress(
+                category, category_done[category], category_totals[category]
+            )
+
+        await ExampleDownloader().run(
+            items, save_item_atomically, on_done, is_download_cancelled, on_start
+        )
 
+        if is_download_cancelled():
+            _download_task["status"] = "cancelled"
+            message = "下载已取消"
+        else:
+            _download_task["status"] = "completed"
+            message = "下载完成"
+        logger.info(
+            f"Download {_download_task['status']}: {result['success_count']} success, "
+            f"{result['failed_count']} failed, {result['skipped_count']} skipped"
+        )
+        _download_task["message"] = (
+            f"{message}！成功: {result['success_count']}, "
+            f"失败: {result['failed_count']}, 跳过: {result['skipped_count']}"
+        )
+    except asyncio.CancelledError:
+        _download_task["status"] = "cancelled"
+        raise
     except Exception as e:
-        logger.error(f"Error serving cache image: {e}")
-        return web.Response(status=500, text="Internal server error")
+        logger.error(f"Error downloading prompt examples: {e}")
+        _download_task["status"] = "failed"
+        _download_task["message"] = f"下载失败: {str(e)}"
+    finally:
+        await loop.run_in_executor(None, manifest.close)
+        result["failed_items"] = failed_items[:10]  # 只返回前10个失败的
+        result["manifest"] = manifest.counts()
+        _download_task["result"] = result
+        _download_task["running"] = False
 
 
 async def download_prompt_examples(request):
-    """下载提示词示例图并写入metadata"""
-    import requests
+    """
+    下载提示词示例图并写入metadata
 
+    在后台任务中执行，立即返回 job_id，进度通过 /prompt_manage/reference/status 查询。
+    ?resume=1 继续上次取消或中断的任务（只下载清单中未完成的条目）
+    """
     # 检查是否有正在运行的任务
     if _download_task["running"]:
         return web.json_response(
-            {"success": False, "message": "已有下载任务正在运行"}, status=400
+            {
+                "success": False,
+                "message": "已有下载任务正在运行",
+                "job_id": _download_task.get("job_id"),
+            },
+            status=400,
         )
-    plugin_dir = os.path.dirname(__file__)
-    lora_dir = os.path.normpath(os.path.join(plugin_dir, "..", "..", "models", "loras"))
-    comfyui_root = os.path.normpath(os.path.join(plugin_dir, "..", ".."))
-    if not os.path.exists(lora_dir):
+    if not os.path.exists(LORA_DIR):
         return web.json_response(
-            {"success": False, "message": f"Lora目录不存在: {lora_dir}"}, status=400
+            {"success": False, "message": f"Lora目录不存在: {LORA_DIR}"}, status=400
         )
+
     # 初始化任务状态
     reset_download_task()
+    job_id = uuid.uuid4().hex
     _download_task["running"] = True
-    success_count = 0
-    failed_count = 0
-    skipped_count = 0
-    failed_items = []
-    total_images = 0
-    processed_images = 0
-    # 先统计总图像数
-    for root, dirs, files in os.walk(lora_dir):
-        for file in files:
-            if file.endswith(".metadata.json"):
-                metadata_path = os.path.join(root, file)
-                try:
-                    metadata = load_json_file(metadata_path)
-                    if (
-                        metadata
-                        and "civitai" in metadata
-                        and "images" in metadata["civitai"]
-                    ):
-                        images = metadata["civitai"].get("images", [])
-                        for img in images:
-                            if "meta" in img and "prompt" in img["meta"]:
-                                prompt = img["meta"]["prompt"]
-                                if prompt and prompt.strip():
-                                    total_images += 1
-                except Exception:
-                    pass
-    _download_task["total"] = total_images
-    # 创建requests会话，带User-Agent头避免403
-    session = requests.Session()
-    session.headers.update(
-        {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-    )
-
-    try:
-        for root, dirs, files in os.walk(lora_dir):
-            # 检查是否被取消
-            if is_download_cancelled():
-                logger.info("Download cancelled by user")
-                break
-            for file in files:
-                if file.endswith(".metadata.json"):
-                    metadata_path = os.path.join(root, file)
-                    try:
-                        metadata = load_json_file(metadata_path)
-                        if metadata is None:
-                            continue
-                        # 获取类别（目录名）
-                        rel_dir = os.path.relpath(root, lora_dir)
-                        if rel_dir == ".":
-                            category = "root"
-                        else:
-                            category = rel_dir.replace("\\", "/")
-                        # 创建示例图目录
-                        example_category_dir = os.path.join(EXAMPLE_DIR, category)
-                        os.makedirs(example_category_dir, exist_ok=True)
-                        # 获取模型名称
-                        model_name = metadata.get(
-                            "model_name", metadata.get("file_name", "")
-                        )
-
-                        # 检查civitai数据中是否有图像和提示词
-                        if "civitai" in metadata and "images" in metadata["civitai"]:
-                            civitai_data = metadata["civitai"]
-                            images = civitai_data.get("images", [])
-                            # 遍历所有图像，下载有提示词的图像
-                            for idx, img in enumerate(images):
-                                # 检查是否被取消
-                                if is_download_cancelled():
-                                    logger.info("Download cancelled by user")
-                                    break
-                                if "meta" in img and "prompt" in img["meta"]:
-                                    prompt = img["meta"]["prompt"]
-                                    # 检查提示词是否为空
-                                    if not prompt or not prompt.strip():
-                                        skipped_count += 1
-                                        continue
-                                    image_url = img.get("url", "")
-                                    if not image_url:
-                                        skipped_count += 1
-                                        continue
-                                    # 生成文件名
-                                    base_name = file.replace(".metadata.json", "")
-                                    safe_model_name = "".join(
-                                        c
-                                        for c in model_name
-                                        if c.isalnum() or c in (" ", "-", "_")
-                                    ).strip()
-                                    filename = f"{safe_model_name}_{idx}.png"
-                                    save_path = os.path.join(
-                                        example_category_dir, filename
-                                    )
-
-                                    # 检查同名文件是否存在
-                                    if os.path.exists(save_path):
-                                        skipped_count += 1
-                                        continue
-                                    # 下载图像
-                                    try:
-                                        response = session.get(image_url, timeout=60)
-                                        if response.status_code == 200:
-                                            content = response.content
-                                            # 保存图像
-                                            with open(save_path, "wb") as f:
-                                                f.write(content)
-                                            # 准备metadata
-                                            png_metadata = {
-                                                "prompt": prompt,
-                                                "negative_prompt": img["meta"].get(
-                                                    "negativePrompt", ""
-                                                ),
-                                                "steps": img["meta"].get("steps", ""),
-                                                "sampler": img["meta"].get(
-                                                    "sampler", ""
-                                                ),
-                                                "cfg_scale": img["meta"].get(
-                                                    "cfgScale", ""
-                                                ),
-                                                "seed": img["meta"].get("seed", ""),
-                                                "width": img.get("width", ""),
-                                                "height": img.get("height", ""),
-                                                "model": img["meta"].get("Model", ""),
-                                                "lora_name": model_name,
-                                                "lora_category": category,
-                                            }
-
-                                            # 写入PNG metadata和JSON文件
-                                            write_png_metadata(save_path, png_metadata)
-                                            save_json_metadata(save_path, png_metadata)
-                                            success_count += 1
-                                            processed_images += 1
-                                            _download_task["progress"] = (
-                                                processed_images
-                                            )
-                                        else:
-                                            logger.warning(
-                                                f"Failed to download: HTTP {response.status_code}"
-                                            )
-                                            failed_count += 1
-                                            processed_images += 1
-                                            _download_task["progress"] = (
-                                                processed_images
-                                            )
-                                            failed_items.append(image_url)
-                                    except requests.exceptions.Timeout:
-                                        logger.warning(
-                                            f"Timeout downloading: {image_url}"
-                                        )
-                                        failed_count += 1
-                                        processed_images += 1
-                                        _download_task["progress"] = processed_images
-                                        failed_items.append(image_url)
-                                    except Exception as e:
-                                        logger.error(
-                                            f"Error downloading {image_url}: {e}"
-                                        )
-                                        failed_count += 1
-                                        processed_images += 1
-                                        _download_task["progress"] = processed_images
-                                        failed_items.append(image_url)
-                    except json.decoder.JSONDecodeError as e:
-                        logger.warning(f"Failed to parse JSON in {metadata_path}: {e}")
-                    except Exception as e:
-                        logger.warning(f"Error processing {metadata_path}: {e}")
-    except Exception as e:
-        logger.error(f"Error scanning for prompt examples: {e}")
-        return web.json_response(
-            {"success": False, "message": f"扫描失败: {str(e)}"}, status=500
-        )
-    finally:
-        session.close()
-        _download_task["running"] = False
-
-    logger.info(
-        f"Download completed: {success_count} success, {failed_count} failed, {skipped_count} skipped"
-    )
+    _download_task["job_id"] = job_id
+    _download_task["status"] = "running"
+    resume = request.query.get("resume", "").lower() in ("1", "true")
+    _download_task["job"] = asyncio.create_task(run_example_download(job_id, resume))
 
     return web.json_response(
-        {
-            "success": True,
-            "message": f"下载完成！成功: {success_count}, 失败: {failed_count}, 跳过: {skipped_count}",
-            "success_count": success_count,
-            "failed_count": failed_count,
-            "skipped_count": skipped_count,
-            "failed_items": failed_items[:10],  # 只返回前10个失败的
-        }
+        {"success": True, "message": "下载任务已开始", "job_id": job_id}
     )
 
 
@@ -1148,11 +588,15 @@ async def get_download_status(request):
     """获取下载状态"""
     return web.json_response(
         {
+            "job_id": _download_task.get("job_id"),
+            "status": _download_task.get("status", "idle"),
             "running": _download_task["running"],
             "cancelled": _download_task["cancelled"],
             "progress": _download_task["progress"],
             "total": _download_task["total"],
             "category_progress": _download_task.get("category_progress", {}),
+            "message": _download_task.get("message", ""),
+            "result": _download_task.get("result"),
         }
     )
 
@@ -1170,201 +614,254 @@ async def cancel_download_api(request):
 
 async def get_example_image(request):
     """获取示例图图像"""
-    try:
-        # 获取相对路径参数
-        rel_path = request.query.get("path", "")
-        if not rel_path:
-            return web.Response(status=400, text="Missing path parameter")
-
-        # 构建完整路径
-        plugin_dir = os.path.dirname(__file__)
-        comfyui_root = os.path.normpath(os.path.join(plugin_dir, "..", ".."))
-        full_path = os.path.normpath(os.path.join(comfyui_root, rel_path.lstrip("/")))
-
-        # 安全检查
-        try:
-            full_path = os.path.abspath(full_path)
-            comfyui_root_abs = os.path.abspath(comfyui_root)
-
-            if (
-                not full_path.startswith(comfyui_root_abs + os.sep)
-                and full_path != comfyui_root_abs
-            ):
-                logger.warning(f"Access denied: path not under comfyui root")
-                return web.Response(status=403, text="Access denied")
-        except Exception as e:
-            logger.error(f"Path validation error: {e}")
-            return web.Response(status=403, text="Access denied")
-
-        if not os.path.exists(full_path):
-            return web.Response(status=404, text="File not found")
-
-        # 检查文件扩展名
-        allowed_image_exts = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
-
-        is_image = any(full_path.lower().endswith(ext) for ext in allowed_image_exts)
-
-        if not is_image:
-            return web.Response(status=403, text="Invalid file type")
-
-        # 读取图像文件
-        with open(full_path, "rb") as f:
-            content = f.read()
-
-        # 根据文件扩展名设置Content-Type
-        ext = os.path.splitext(full_path)[1].lower()
-        content_type = {
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
-            ".webp": "image/webp",
-        }.get(ext, "image/jpeg")
-
-        return web.Response(body=content, content_type=content_type)
-
-    except Exception as e:
-        logger.error(f"Error serving example image: {e}")
-        return web.Response(status=500, text="Internal server error")
+    return await serve_image(request, IMAGE_TYPES)
 
 
 # ===== Lora更新功能 =====
-# 用于跟踪正在进行的更新任务
+# 刷新任务登记表 {task_id: 任务状态}，只保留最近的若干个已结束任务
 _lora_update_tasks = {}
+MAX_FINISHED_REFRESH_TASKS = 20
+# 正在被某个刷新任务处理的文件，同一文件同时只允许一个任务处理
+_lora_files_in_progress = set()
 
 
-async def refresh_lora_metadata(request):
-    """
-    刷新Lora元数据 - 从CivitAI获取信息并保存metadata和预览图像
+async def close_civitai_client(app):
+    """服务器关闭时释放 CivitAI 客户端的连接池"""
+    await CivitaiClient.shutdown()
 
-    支持两种模式：
-    1. ?mode=all - 更新所有未有metadata的Lora文件
-    2. ?file=<file_path> - 更新指定的Lora文件
-    """
-    try:
-        plugin_dir = os.path.dirname(__file__)
-        lora_dir = os.path.normpath(
-            os.path.join(plugin_dir, "..", "..", "models", "loras")
-        )
 
-        if not os.path.exists(lora_dir):
-            return web.json_response(
-                {"success": False, "message": f"Lora目录不存在: {lora_dir}"}, status=400
-            )
+PromptServer.instance.app.on_shutdown.append(close_civitai_client)
 
-        # 初始化更新服务
-        service = LoraUpdateService(lora_dir)
-        await service.initialize()
-
-        mode = request.query.get("mode", "file").lower()
-
-        if mode == "all":
-            # 批量更新模式 - 更新所有未有metadata的Lora
-            lora_files = service.scan_local_loras()
-
-            if not lora_files:
-                return web.json_response(
-                    {
-                        "success": True,
-                        "message": "没有需要更新的Lora文件（所有文件都已有metadata）",
-                        "updated": 0,
-                        "failed": 0,
-                        "total": 0,
-                    }
-                )
+# Lora 文件的 SHA256 缓存，重复刷新和重试时未修改的文件不再重新计算
+lora_hash_cache = HashCache(os.path.join(CACHE_ROOT, "lora_hashes.jsonl"))
+atexit.register(lora_hash_cache.close)
 
-            logger.info(f"开始批量更新 {len(lora_files)} 个Lora文件的metadata")
 
-            # 创建异步任务进行更新
-            async def batch_update():
-                success_count, failed_count, failed_files = (
-                    await service.batch_update_lora_metadata(
-                        lora_files, progress_callback=None
-                    )
-                )
-                return success_count, failed_count, failed_files
+def prune_refresh_tasks():
+    """删除较早的已结束任务"""
+    finished = [
+        task_id
+        for task_id, task in _lora_update_tasks.items()
+        if task["status"] != "running"
+    ]
+    for task_id in finished[:-MAX_FINISHED_REFRESH_TASKS]:
+        del _lora_update_tasks[task_id]
 
-            success_count, failed_count, failed_files = await batch_update()
 
-            return web.json_response(
-                {
-                    "success": True,
-                    "message": f"更新完成：成功 {success_count} 个，失败 {failed_count} 个",
-                    "updated": success_count,
-                    "failed": failed_count,
-                    "total": len(lora_files),
-                    "failed_files": [os.path.basename(f) for f in failed_files],
-                }
-            )
+async def run_lora_refresh(task_id, service, lora_files, force=False):
+    """后台刷新任务：逐个文件更新进度，结束时释放文件占用"""
+    task = _lora_update_tasks[task_id]
 
+    def on_result(lora_file, success, message):
+        task["files"][lora_file] = {
+            "status": "done" if success else "failed",
+            "message": message,
+        }
+        task["completed"] += 1
+        if success:
+            task["updated"] += 1
         else:
-            # 单个文件更新模式
-            file_path = request.query.get("file", "")
+            task["failed"] += 1
+        task["progress"] = round(task["completed"] * 100 / max(task["total"], 1))
+        # 不等监视器的事件合并，前端随后拉取列表时就能看到新 metadata
+        lora_catalog.mark_stale()
 
-            if not file_path:
-                return web.json_response(
-                    {"success": False, "message": "缺少 file 参数"}, status=400
-                )
+    try:
+        for lora_file in lora_files:
+            task["files"][lora_file] = {"status": "pending", "message": ""}
+        await service.batch_update_lora_metadata(
+            lora_files, on_result=on_result, force=force
+        )
+        task["status"] = "completed"
+        task["message"] = (
+            f"更新完成：成功 {task['updated']} 个，失败 {task['failed']} 个"
+        )
+    except asyncio.CancelledError:
+        task["status"] = "cancelled"
+        task["message"] = (
+            f"更新已取消：成功 {task['updated']} 个，失败 {task['failed']} 个"
+        )
+        # 继续抛出：服务器关闭时取消的任务不能报告为正常结束
+        raise
+    except Exception as e:
+        logger.error(f"Lora更新失败: {e}", exc_info=True)
+        task["status"] = "failed"
+        task["message"] = f"更新失败: {str(e)}"
+    finally:
+        _lora_files_in_progress.difference_update(lora_files)
+        for info in task["files"].values():
+            if info["status"] == "pending":
+                info["status"] = "cancelled"
+        task["finished_at"] = time.time()
+        task["job"] = None
+        logger.info(f"Lora refresh task {task_id} {task['status']}")
 
-            # 验证文件路径
-            file_path = os.path.normpath(file_path)
-            if not os.path.isabs(file_path):
-                # 如果是相对路径，相对于lora目录
-                file_path = os.path.join(lora_dir, file_path)
 
-            if not os.path.exists(file_path):
-                return web.json_response(
-                    {"success": False, "message": f"文件不存在: {file_path}"},
-                    status=400,
-                )
+def resolve_lora_file(lora_dir, file_path):
+    """
+    解析 ?file= 参数
+
+    Returns:
+        (绝对路径, 错误信息)
+    """
+    if not file_path:
+        return None, "缺少 file 参数"
+    file_path = os.path.normpath(file_path)
+    if not os.path.isabs(file_path):
+        # 如果是相对路径，相对于lora目录
+        file_path = os.path.join(lora_dir, file_path)
+    if not os.path.exists(file_path):
+        return None, f"文件不存在: {file_path}"
+    if not file_path.endswith(".safetensors"):
+        return None, "只支持.safetensors格式的文件"
+    return file_path, None
 
-            if not file_path.endswith(".safetensors"):
-                return web.json_response(
-                    {"success": False, "message": "只支持.safetensors格式的文件"},
-                    status=400,
-                )
 
-            logger.info(f"开始更新Lora: {file_path}")
+async def refresh_lora_metadata(request):
+    """
+    刷新Lora元数据 - 从CivitAI获取信息并保存metadata和预览图像
 
-            success, message = await service.update_lora_metadata(file_path)
+    在后台任务中执行，立即返回 task_id，进度通过 /prompt_manage/lora/refresh-status 查询，
+    /prompt_manage/lora/refresh-cancel 取消。
 
-            return web.json_response(
-                {
-                    "success": success,
-                    "message": message,
-                    "file": os.path.basename(file_path),
-                }
-            )
+    支持两种模式：
+    1. ?mode=all - 更新所有未有metadata的Lora文件
+    2. ?file=<file_path> - 更新指定的Lora文件
 
-    except asyncio.CancelledError:
+    其他任务正在处理的文件会被跳过（单文件模式返回 409）。
+    CivitAI 查询结果有本地缓存，?force=1 忽略缓存重新查询。
+    """
+    lora_dir = LORA_DIR
+    if not os.path.exists(lora_dir):
         return web.json_response(
-            {"success": False, "message": "更新已取消"}, status=400
+            {"success": False, "message": f"Lora目录不存在: {lora_dir}"}, status=400
         )
-    except Exception as e:
-        logger.error(f"Lora更新失败: {e}", exc_info=True)
+
+    # 初始化更新服务
+    service = LoraUpdateService(lora_dir, hash_cache=lora_hash_cache)
+    await service.initialize()
+
+    mode = request.query.get("mode", "file").lower()
+    force = request.query.get("force", "").lower() in ("1", "true")
+    if mode == "all":
+        # 批量更新模式 - 更新所有未有metadata的Lora
+        try:
+            candidates = await asyncio.get_running_loop().run_in_executor(
+                None, service.scan_local_loras
+            )
+        except OSError as e:
+            logger.error(f"扫描Lora目录失败: {e}")
+            return web.json_response(
+                {"success": False, "message": f"扫描Lora目录失败: {str(e)}"},
+                status=500,
+            )
+    else:
+        # 单个文件更新模式
+        file_path, error = resolve_lora_file(lora_dir, request.query.get("file", ""))
+        if error:
+            return web.json_response({"success": False, "message": error}, status=400)
+        if file_path in _lora_files_in_progress:
+            return web.json_response(
+                {"success": False, "message": "该文件正在被其他刷新任务更新"},
+                status=409,
+            )
+        candidates = [file_path]
+
+    lora_files = [f for f in candidates if f not in _lora_files_in_progress]
+    skipped = len(candidates) - len(lora_files)
+    if not lora_files:
         return web.json_response(
-            {"success": False, "message": f"更新失败: {str(e)}"}, status=500
+            {
+                "success": True,
+                "message": (
+                    "没有需要更新的Lora文件（所有文件都已有metadata）"
+                    if not skipped
+                    else "所有待更新的Lora文件都在其他刷新任务中"
+                ),
+                "task_id": None,
+                "updated": 0,
+                "failed": 0,
+                "skipped": skipped,
+                "total": 0,
+            }
         )
 
+    logger.info(f"开始更新 {len(lora_files)} 个Lora文件的metadata")
+    _lora_files_in_progress.update(lora_files)
+    task_id = uuid.uuid4().hex
+    _lora_update_tasks[task_id] = {
+        "status": "running",
+        "mode": mode,
+        "message": "",
+        "total": len(lora_files),
+        "completed": 0,
+        "progress": 0,
+        "updated": 0,
+        "failed": 0,
+        "skipped": skipped,
+        "files": {},  # {文件路径: {"status": pending/done/failed/cancelled, "message"}}
+        "started_at": time.time(),
+        "finished_at": None,
+        "job": None,
+    }
+    prune_refresh_tasks()
+    _lora_update_tasks[task_id]["job"] = asyncio.create_task(
+        run_lora_refresh(task_id, service, lora_files, force=force)
+    )
+
+    return web.json_response(
+        {
+            "success": True,
+            "message": "更新任务已开始",
+            "task_id": task_id,
+            "total": len(lora_files),
+            "skipped": skipped,
+        }
+    )
+
 
 async def get_refresh_status(request):
-    """获取刷新状态"""
+    """获取刷新状态（?task_id=，加 &files=1 返回每个文件的状态）"""
     task_id = request.query.get("task_id", "")
 
     if task_id not in _lora_update_tasks:
         return web.json_response({"status": "unknown", "message": "任务不存在"})
 
     task_data = _lora_update_tasks[task_id]
-
-    return web.json_response(
-        {
-            "status": task_data.get("status", "running"),
-            "progress": task_data.get("progress", 0),
-            "message": task_data.get("message", ""),
-            "total": task_data.get("total", 0),
-            "completed": task_data.get("completed", 0),
+    status = {
+        "task_id": task_id,
+        "status": task_data["status"],
+        "progress": task_data["progress"],
+        "message": task_data["message"],
+        "total": task_data["total"],
+        "completed": task_data["completed"],
+        "updated": task_data["updated"],
+        "failed": task_data["failed"],
+        "skipped": task_data["skipped"],
+        "failed_files": [
+            os.path.basename(f)
+            for f, info in task_data["files"].items()
+            if info["status"] == "failed"
+        ][:10],
+    }
+    if request.query.get("files", "").lower() in ("1", "true"):
+        status["files"] = {
+            os.path.relpath(f, LORA_DIR).replace("\\", "/"): info
+            for f, info in task_data["files"].items()
         }
-    )
+    return web.json_response(status)
+
+
+async def cancel_lora_refresh(request):
+    """取消刷新任务（?task_id=），进行中的文件一并取消"""
+    task_id = request.query.get("task_id", "")
+    task_data = _lora_update_tasks.get(task_id)
+    if not task_data or task_data["status"] != "running" or not task_data["job"]:
+        return web.json_response(
+            {"success": False, "message": "没有正在运行的刷新任务"}, status=400
+        )
+    task_data["job"].cancel()
+    return web.json_response({"success": True, "message": "刷新任务已取消"})
 
 
 # 注册路由
@@ -1373,17 +870,34 @@ PromptServer.instance.routes.post("/prompt_manage/save")(save_prompts_api)
 PromptServer.instance.routes.post("/prompt_manage/add")(add_prompt)
 PromptServer.instance.routes.post("/prompt_manage/delete")(delete_prompt)
 PromptServer.instance.routes.post("/prompt_manage/update")(update_prompt)
+PromptServer.instance.routes.post("/prompt_manage/prompt/add")(add_prompt_item)
+PromptServer.instance.routes.post("/prompt_manage/prompt/update")(update_prompt_item)
+PromptServer.instance.routes.post("/prompt_manage/prompt/delete")(delete_prompt_item)
+PromptServer.instance.routes.get("/prompt_manage/changes")(get_prompt_changes)
+PromptServer.instance.routes.get("/prompt_manage/search")(search_prompts)
 PromptServer.instance.routes.get("/prompt_manage/lora/list")(get_loras)
 PromptServer.instance.routes.get("/prompt_manage/lora/image")(get_lora_image)
 PromptServer.instance.routes.get("/prompt_manage/lora/refresh")(refresh_lora_metadata)
 PromptServer.instance.routes.get("/prompt_manage/lora/refresh-status")(
     get_refresh_status
 )
+PromptServer.instance.routes.post("/prompt_manage/lora/refresh-cancel")(
+    cancel_lora_refresh
+)
 PromptServer.instance.routes.get("/prompt_manage/reference/list")(get_prompt_references)
+PromptServer.instance.routes.get("/prompt_manage/reference/get_by_ids")(
+    get_references_by_ids
+)
+PromptServer.instance.routes.get("/prompt_manage/reference/categories")(
+    get_reference_categories
+)
 PromptServer.instance.routes.get("/prompt_manage/reference/download")(
     download_prompt_examples
 )
 PromptServer.instance.routes.get("/prompt_manage/reference/cancel")(cancel_download_api)
+PromptServer.instance.routes.post("/prompt_manage/reference/cancel")(
+    cancel_download_api
+)
 PromptServer.instance.routes.get("/prompt_manage/reference/status")(get_download_status)
 PromptServer.instance.routes.get("/prompt_manage/example/image")(get_example_image)
 PromptServer.instance.routes.get("/prompt_manage/cache/image")(get_cache_image)
@@ -1593,14 +1107,9 @@ def extract_workflow_metadata(image_data: bytes):
     from PIL import Image
 
     try:
-        img = Image.open(io.BytesIO(image_data))
-
-        if not hasattr(img, "text"):
-            return None
-
-        text_data = img.text
-        workflow_str = text_data.get("workflow", "")
-        prompt_str = text_data.get("prompt", "")
+        # 只读取文件头获取尺寸，没有 metadata 的图片也返回尺寸
+        with Image.open(io.BytesIO(image_data)) as img:
+            width, height = img.width, img.height
 
         # 初始化结果
         result = {
@@ -1611,10 +1120,16 @@ def extract_workflow_metadata(image_data: bytes):
             "cfg_scale": "",
             "seed": "",
             "model": "",
-            "width": str(img.width),
-            "height": str(img.height),
+            "width": str(width),
+            "height": str(height),
         }
 
+        text_data = read_metadata_bytes(image_data)
+        if not text_data:
+            return result
+        workflow_str = text_data.get("workflow", "")
+        prompt_str = text_data.get("prompt", "")
+
         # 尝试解析 workflow JSON
         workflow = None
         if workflow_str:
@@ -1702,8 +1217,8 @@ def extract_workflow_metadata(image_data: bytes):
             result["cfg_scale"] = params.get("cfg_scale", "")
             result["seed"] = params.get("seed", "")
             result["model"] = params.get("model", "")
-            result["width"] = params.get("width", str(img.width))
-            result["height"] = params.get("height", str(img.height))
+            result["width"] = params.get("width", str(width))
+            result["height"] = params.get("height", str(height))
         else:
             # 如果没有 workflow，尝试从 prompt 字段解析（与 workflow2js.py 一致）
             if prompt_str:
@@ -1852,6 +1367,9 @@ async def upload_images(request):
                     f"Error processing uploaded file {file_info.get('name')}: {e}"
                 )
 
+        # 图片和 JSON 可能在同一时钟周期内写入，目录 mtime 不足以区分
+        reference_index.mark_stale()
+
         result = {
             "success": True,
             "success_count": success_count,
@@ -1874,6 +1392,40 @@ async def upload_images(request):
 # 添加上传图像路由
 PromptServer.instance.routes.post("/prompt_manage/upload_images")(upload_images)
 
+# ===== 目录监视：文件变化时刷新索引并推送给前端 =====
+# 设置环境变量 PROMPT_MANAGE_FS_WATCHER=0 可关闭
+FS_WATCHER_ENABLED = os.environ.get("PROMPT_MANAGE_FS_WATCHER", "1") != "0"
+
+
+def on_lora_dir_changed(key):
+    """Lora 目录有变化：在监视线程中增量刷新索引，再通知前端重新拉取列表"""
+    lora_catalog.mark_stale()
+    lora_catalog.get_data()
+    PromptServer.instance.send_sync("prompt_manage.lora_changed", {})
+
+
+def on_example_dir_changed(key):
+    """示例图目录有变化：在监视线程中增量刷新索引，再通知前端重新拉取参考图列表"""
+    reference_index.mark_stale()
+    reference_index.get_data()
+    PromptServer.instance.send_sync("prompt_manage.reference_changed", {})
+
+
+fs_watcher = None
+if FS_WATCHER_ENABLED:
+    try:
+        fs_watcher = DirectoryWatcher()
+        fs_watcher.watch("lora", LORA_DIR, on_lora_dir_changed)
+        fs_watcher.watch("example", EXAMPLE_DIR, on_example_dir_changed)
+        fs_watcher.start()
+        # 轮询模式和网络文件系统只能发现目录内容变化，原地修改的 metadata 仍需按请求扫描
+        lora_catalog.watched = fs_watcher.event_driven("lora")
+        reference_index.watched = fs_watcher.event_driven("example")
+        atexit.register(fs_watcher.stop)
+    except Exception as e:
+        logger.warning(f"Failed to start directory watcher: {e}")
+        fs_watcher = None
+
 # 静态文件服务
 web_dir = os.path.join(os.path.dirname(__file__), "web")
 PromptServer.instance.app.add_routes([web.static("/prompt_manage_web", web_dir)])
@@ -6,14 +6,84 @@ CivitAI API客户端 - 从CivitAI获取模型信息、下载预览图像和元
 import asyncio
 import logging
 import os
-import json
-import hashlib
+import time
 import aiohttp
-from typing import Optional, Dict, Tuple
-from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Tuple
+
+from .hash_cache import file_sha256
+from .response_cache import ResponseCache
+from .retry_policy import MAX_RETRY_AFTER, retry_delay
 
 logger = logging.getLogger(__name__)
 
+# API 限速：平均每秒请求数和允许的突发数量（所有请求共享）
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+# 429 和 5xx 的最多重试次数，没有 Retry-After 时按指数退避，
+# Retry-After 超过 retry_policy.MAX_RETRY_AFTER 时不再重试
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 连接池：总连接数和单主机连接数，空闲连接保持一段时间供后续请求复用
+MAX_CONNECTIONS = 16
+MAX_CONNECTIONS_PER_HOST = 8
+KEEPALIVE_TIMEOUT = 60
+# API 地址，可用环境变量指向镜像或本地测试服务
+DEFAULT_BASE_URL = os.environ.get(
+    "PROMPT_MANAGE_CIVITAI_API_URL", "https://civitai.com/api/v1"
+)
+# 批量 hash 查询：每个请求最多的 hash 数；返回这些状态码说明接口不存在，
+# 之后都改为并发单个查询（其它失败只让这一批改为单个查询）
+BULK_LOOKUP_SIZE = 100
+BULK_FALLBACK_STATUSES = {404, 405, 501}
+# 查询结果缓存：成功结果和 404 结果的有效期（秒），可用环境变量覆盖，0 表示不缓存
+RESPONSE_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "cache",
+    "civitai_responses",
+)
+RESPONSE_CACHE_TTL = float(
+    os.environ.get("PROMPT_MANAGE_CIVITAI_CACHE_TTL", 7 * 24 * 3600)
+)
+RESPONSE_CACHE_NEGATIVE_TTL = float(
+    os.environ.get("PROMPT_MANAGE_CIVITAI_NEGATIVE_TTL", 24 * 3600)
+)
+
+
+class TokenBucket:
+    """令牌桶限速器；收到 429 时调用 pause() 让所有请求一起等待"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """等待并取走一个令牌"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """暂停发放令牌 seconds 秒，之后从空桶开始恢复"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
 
 class CivitaiClient:
     """CivitAI API 客户端 - 获取Lora模型信息"""
@@ -29,13 +99,102 @@ class CivitaiClient:
                 cls._instance = cls()
             return cls._instance
 
+    @classmethod
+    async def shutdown(cls):
+        """关闭单例持有的会话（服务器退出时调用）"""
+        if cls._instance is not None:
+            await cls._instance.close()
+
     def __init__(self):
         """初始化CivitAI客户端"""
         if hasattr(self, "_initialized"):
             return
         self._initialized = True
-        self.base_url = "https://civitai.com/api/v1"
+        self.base_url = DEFAULT_BASE_URL.rstrip("/")
         self.timeout = aiohttp.ClientTimeout(total=30)
+        self.rate_limiter = TokenBucket(DEFAULT_RATE, DEFAULT_BURST)
+        self.bulk_lookup_supported = True
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.response_cache = ResponseCache(
+            RESPONSE_CACHE_DIR, RESPONSE_CACHE_TTL, RESPONSE_CACHE_NEGATIVE_TTL
+        )
+
+    # ===== 会话 =====
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """所有请求共用一个长期会话（连接池 + keep-alive），第一次使用时创建"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=MAX_CONNECTIONS,
+                limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+        return self._session
+
+    async def close(self):
+        """关闭会话和连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @asynccontextmanager
+    async def _request(
+        self,
+        url: str,
+        rate_limited: bool = True,
+        method: str = "GET",
+        json_body=None,
+    ):
+        """
+        发起请求，429 和 5xx 按 Retry-After 或指数退避重试，Retry-After 过长时不再等待
+
+        Args:
+            url: 请求地址
+            rate_limited: 是否经过令牌桶（API 请求限速，图片 CDN 下载不限速）
+            method: HTTP 方法
+            json_body: 请求体（JSON）
+
+        Yields:
+            最终的响应（重试用尽或 Retry-After 过长时为最后一次的响应）
+        """
+        session = self._get_session()
+        for attempt in range(MAX_RETRIES + 1):
+            if rate_limited:
+                await self.rate_limiter.acquire()
+            resp = await session.request(method, url, json=json_body)
+            delay = None
+            if resp.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+                delay = retry_delay(resp.headers, attempt, RETRY_BACKOFF)
+                if delay is None:
+                    logger.warning(
+                        f"CivitAI 返回 HTTP {resp.status}，Retry-After "
+                        f"{resp.headers.get('Retry-After')} 秒过长，不再重试: {url}"
+                    )
+                    if rate_limited and resp.status == 429:
+                        # 其它 API 请求最多暂停 MAX_RETRY_AFTER 秒
+                        self.rate_limiter.pause(MAX_RETRY_AFTER)
+            if delay is not None:
+                resp.release()
+                logger.warning(
+                    f"CivitAI 返回 HTTP {resp.status}，{delay:.1f} 秒后重试: {url}"
+                )
+                if rate_limited and resp.status == 429:
+                    # 限流时所有 API 请求一起暂停
+                    self.rate_limiter.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                continue
+            try:
+                yield resp
+            finally:
+                resp.release()
+            return
+
+    # ===== 下载 =====
 
     async def download_file(
         self, url: str, save_path: str, progress_callback=None
@@ -54,15 +213,14 @@ class CivitaiClient:
         try:
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(url) as resp:
-                    if resp.status != 200:
-                        logger.warning(f"Failed to download file: HTTP {resp.status}")
-                        return False, f"HTTP {resp.status}"
+            async with self._request(url, rate_limited=False) as resp:
+                if resp.status != 200:
+                    logger.warning(f"Failed to download file: HTTP {resp.status}")
+                    return False, f"HTTP {resp.status}"
 
-                    content = await resp.read()
-                    with open(save_path, "wb") as f:
-                        f.write(content)
+                with open(save_path, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(1024 * 1024):
+                        f.write(chunk)
 
             return True, save_path
         except asyncio.TimeoutError:
@@ -77,35 +235,174 @@ class CivitaiClient:
                     pass
             return False, str(e)
 
+    async def _cached_get_json(
+        self, cache_key: str, url: str, not_found_message: str, force: bool
+    ) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        查询 JSON 接口，200 和 404 结果写入响应缓存
+
+        Args:
+            cache_key: 缓存 key
+            url: 请求地址
+            not_found_message: 404 时返回的错误信息
+            force: 忽略缓存重新查询（结果仍会写入缓存）
+        """
+        loop = asyncio.get_running_loop()
+        if not force:
+            hit, data = await loop.run_in_executor(
+                None, self.response_cache.get, cache_key
+            )
+            if hit:
+                logger.debug(f"CivitAI 响应缓存命中: {cache_key}")
+                return (data, None) if data is not None else (None, not_found_message)
+
+        try:
+            async with self._request(url) as resp:
+                if resp.status == 404:
+                    await loop.run_in_executor(
+                        None, self.response_cache.put, cache_key, None
+                    )
+                    return None, not_found_message
+                if resp.status != 200:
+                    return None, f"API错误: HTTP {resp.status}"
+
+                data = await resp.json()
+            await loop.run_in_executor(None, self.response_cache.put, cache_key, data)
+            return data, None
+        except asyncio.TimeoutError:
+            return None, "请求超时"
+        except Exception as e:
+            logger.error(f"获取模型信息失败: {e}")
+            return None, str(e)
+
     async def get_model_by_hash(
-        self, model_hash: str
+        self, model_hash: str, force: bool = False
     ) -> Tuple[Optional[Dict], Optional[str]]:
         """
         通过SHA256 hash获取模型信息
 
         Args:
             model_hash: 模型的SHA256 hash值
+            force: 忽略响应缓存，重新查询 CivitAI
 
         Returns:
             (model_data, error_message)
         """
+        model_hash = model_hash.lower()
+        return await self._cached_get_json(
+            f"hash:{model_hash}",
+            f"{self.base_url}/model-versions/by-hash/{model_hash}",
+            "模型在CivitAI上未找到",
+            force,
+        )
+
+    async def get_models_by_hashes(
+        self, hashes: List[str], force: bool = False
+    ) -> Dict[str, Tuple[Optional[Dict], Optional[str]]]:
+        """
+        批量通过SHA256 hash获取模型信息
+
+        先查响应缓存，未命中的 hash 每 BULK_LOOKUP_SIZE 个合并为一个
+        POST /model-versions/by-hash 请求；批量接口不可用或请求失败时，
+        这一批改为并发的单个查询（仍受令牌桶限速）。
+
+        Args:
+            hashes: SHA256 hash 列表
+            force: 忽略响应缓存，重新查询 CivitAI
+
+        Returns:
+            {hash（小写）: (model_data, error_message)}
+        """
+        hashes = list(dict.fromkeys(h.lower() for h in hashes))
+        results: Dict[str, Tuple[Optional[Dict], Optional[str]]] = {}
+        loop = asyncio.get_running_loop()
+
+        missing = hashes
+        if not force:
+            missing = []
+            for model_hash in hashes:
+                hit, data = await loop.run_in_executor(
+                    None, self.response_cache.get, f"hash:{model_hash}"
+                )
+                if not hit:
+                    missing.append(model_hash)
+                elif data is not None:
+                    results[model_hash] = (data, None)
+                else:
+                    results[model_hash] = (None, "模型在CivitAI上未找到")
+
+        for start in range(0, len(missing), BULK_LOOKUP_SIZE):
+            chunk = missing[start : start + BULK_LOOKUP_SIZE]
+            found = None
+            if self.bulk_lookup_supported and len(chunk) > 1:
+                found = await self._bulk_lookup(chunk)
+            if found is None:
+                singles = await asyncio.gather(
+                    *(self.get_model_by_hash(h, force=True) for h in chunk)
+                )
+                results.update(zip(chunk, singles))
+                continue
+            for model_hash in chunk:
+                data = found.get(model_hash)
+                await loop.run_in_executor(
+                    None, self.response_cache.put, f"hash:{model_hash}", data
+                )
+                results[model_hash] = (
+                    (data, None)
+                    if data is not None
+                    else (None, "模型在CivitAI上未找到")
+                )
+        return results
+
+    async def _bulk_lookup(self, hashes: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        一次请求查询多个 hash
+
+        Returns:
+            {hash（小写）: 模型版本信息}，没有返回的 hash 即未找到；请求失败时返回 None
+        """
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(
-                    f"{self.base_url}/model-versions/by-hash/{model_hash}"
-                ) as resp:
-                    if resp.status == 404:
-                        return None, "模型在CivitAI上未找到"
-                    if resp.status != 200:
-                        return None, f"API错误: HTTP {resp.status}"
-
-                    data = await resp.json()
-                    return data, None
+            async with self._request(
+                f"{self.base_url}/model-versions/by-hash",
+                method="POST",
+                json_body=hashes,
+            ) as resp:
+                if resp.status in BULK_FALLBACK_STATUSES:
+                    logger.info(
+                        f"CivitAI 批量查询接口不可用 (HTTP {resp.status})，改为单个查询"
+                    )
+                    self.bulk_lookup_supported = False
+                    return None
+                if resp.status != 200:
+                    logger.warning(f"CivitAI 批量查询失败: HTTP {resp.status}")
+                    return None
+                versions = await resp.json()
+                if not isinstance(versions, list):
+                    # 错误对象或接口格式变化：不能当作"全部未找到"写入缓存
+                    logger.warning(
+                        f"CivitAI 批量查询返回了无法识别的内容: {str(versions)[:200]}"
+                    )
+                    return None
         except asyncio.TimeoutError:
-            return None, "请求超时"
+            logger.warning("CivitAI 批量查询超时")
+            return None
         except Exception as e:
-            logger.error(f"获取模型信息失败: {e}")
-            return None, str(e)
+            logger.error(f"CivitAI 批量查询失败: {e}")
+            return None
+
+        # 按每个版本下文件的 SHA256 对应回请求的 hash
+        wanted = set(hashes)
+        found = {}
+        for version in versions:
+            if not isinstance(version, dict):
+                continue
+            for file_info in version.get("files") or []:
+                file_hash = (
+                    (file_info.get("hashes") or {}).get("SHA256") or ""
+                ).lower()
+                if file_hash in wanted:
+                    found[file_hash] = version
+        return found
 
     async def download_preview_image(self, image_url: str, save_path: str) -> bool:
         """
@@ -121,16 +418,17 @@ class CivitaiClient:
         try:
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(image_url) as resp:
-                    if resp.status == 200:
-                        content = await resp.read()
-                        with open(save_path, "wb") as f:
-                            f.write(content)
-                        return True
-                    else:
-                        logger.warning(f"Failed to download preview image: HTTP {resp.status}")
-                        return False
+            async with self._request(image_url, rate_limited=False) as resp:
+                if resp.status == 200:
+                    content = await resp.read()
+                    with open(save_path, "wb") as f:
+                        f.write(content)
+                    return True
+                else:
+                    logger.warning(
+                        f"Failed to download preview image: HTTP {resp.status}"
+                    )
+                    return False
         except asyncio.TimeoutError:
             logger.warning(f"Timeout downloading preview image: {image_url}")
             return False
@@ -139,38 +437,26 @@ class CivitaiClient:
             return False
 
     async def get_model_info(
-        self, model_id: int
+        self, model_id: int, force: bool = False
     ) -> Tuple[Optional[Dict], Optional[str]]:
         """
         获取模型完整信息
 
         Args:
             model_id: CivitAI模型ID
+            force: 忽略响应缓存，重新查询 CivitAI
 
         Returns:
             (model_data, error_message)
         """
-        try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(f"{self.base_url}/models/{model_id}") as resp:
-                    if resp.status == 404:
-                        return None, "模型不存在"
-                    if resp.status != 200:
-                        return None, f"API错误: HTTP {resp.status}"
-
-                    data = await resp.json()
-                    return data, None
-        except asyncio.TimeoutError:
-            return None, "请求超时"
-        except Exception as e:
-            logger.error(f"获取模型信息失败: {e}")
-            return None, str(e)
+        return await self._cached_get_json(
+            f"model:{model_id}",
+            f"{self.base_url}/models/{model_id}",
+            "模型不存在",
+            force,
+        )
 
 
 def calculate_sha256(file_path: str) -> str:
-    """计算文件的SHA256 hash"""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+    """计算文件的SHA256 hash（不经过缓存，需要缓存时使用 HashCache.sha256）"""
+    return file_sha256(file_path)
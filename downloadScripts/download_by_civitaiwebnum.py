@@ -1,12 +1,11 @@
 """
 CivitAI图像下载工具
-从selected_img_list.txt读取图像ID列表，使用Selenium下载图像并将元数据写入PNG文件和JSON文件
+从selected_img_list.txt读取图像ID列表，使用Selenium下载图像并将元数据写入图像文件（不重新编码）和JSON文件
 """
 
 import os
 import json
 import requests
-from PIL import Image, PngImagePlugin
 from pathlib import Path
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -14,6 +13,11 @@ from selenium.webdriver.chrome.service import Service
 import time
 import sys
 
+try:
+    from .image_metadata import write_image_metadata
+except ImportError:
+    from image_metadata import write_image_metadata
+
 # 配置
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent  # 项目根目录
@@ -126,10 +130,8 @@ def download_image(image_url: str, save_path: str) -> bool:
 
 
 def write_metadata_to_image(image_path: str, gen_data: dict, image_info: dict):
-    """将元数据写入PNG图像文件和JSON文件"""
+    """将元数据写入图像文件（PNG 文本块 / JPEG XMP，保留原始格式）和JSON文件"""
     try:
-        img = Image.open(image_path)
-
         # 安全获取 meta 数据
         meta = gen_data.get("meta") if gen_data else None
         if meta is None:
@@ -155,14 +157,9 @@ def write_metadata_to_image(image_path: str, gen_data: dict, image_info: dict):
             lora_names = ", ".join([lora.get("modelName", "") for lora in loras])
             metadata["lora_name"] = lora_names
 
-        # 使用PngImagePlugin写入metadata
-        pnginfo = PngImagePlugin.PngInfo()
-        for key, value in metadata.items():
-            pnginfo.add_text(key, str(value))
-
-        # 保存图像（覆盖原文件）
-        img.save(image_path, "PNG", pnginfo=pnginfo)
-        print(f"  Metadata written to PNG successfully")
+        # 直接插入到原始字节流中，不重新编码；扩展名与实际格式不符时会改名
+        image_path = write_image_metadata(image_path, metadata)
+        print(f"  Metadata written to image successfully")
         
         # 同时保存 JSON 文件
         save_json_metadata(image_path, metadata)
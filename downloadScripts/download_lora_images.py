@@ -1,22 +1,45 @@
 #!/usr/bin/env python3
 """
 独立的 Lora 图像下载脚本
-从 ComfyUI 的 Lora metadata 文件中读取提示词信息，下载示例图并写入 PNG metadata
+从 ComfyUI 的 Lora metadata 文件中读取提示词信息，下载示例图并写入图像 metadata
+（PNG 文本块 / JPEG XMP，不重新编码，保留原始格式）
 
 使用方法:
-    python download_images.py [--lora-dir PATH] [--output-dir PATH]
+    python download_images.py [--lora-dir PATH] [--output-dir PATH] [--resume]
 
 参数:
     --lora-dir: Lora 模型目录路径 (默认: ComfyUI/models/loras)
     --output-dir: 输出目录路径 (默认: lora_prompts)
+    --resume: 继续上次中断的下载（只下载清单中未完成的条目，不重新扫描）
+
+下载状态记录在输出目录的 .download_manifest.jsonl 中，重复运行只会下载缺少的图像
 """
 
 import os
-import json
 import argparse
 import logging
 import sys
-from pathlib import Path
+
+try:
+    from .download_manifest import (
+        DONE,
+        DOWNLOADING,
+        FAILED,
+        DownloadManifest,
+        save_item_atomically,
+    )
+    from .example_plan import plan_manifest_items
+except ImportError:
+    from download_manifest import (
+        DONE,
+        DOWNLOADING,
+        FAILED,
+        DownloadManifest,
+        save_item_atomically,
+    )
+    from example_plan import plan_manifest_items
+
+MANIFEST_NAME = ".download_manifest.jsonl"
 
 # 配置日志
 logging.basicConfig(
@@ -26,70 +49,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def write_png_metadata(image_path, metadata):
-    """将 metadata 写入 PNG 文件的 tEXt 块"""
-    try:
-        from PIL import Image, PngImagePlugin
-        from PIL.PngImagePlugin import PngInfo
-
-        # 打开图像
-        img = Image.open(image_path)
-
-        # 创建 PngInfo 对象
-        pnginfo = PngInfo()
-
-        # 写入 metadata
-        if isinstance(metadata, dict):
-            for key, value in metadata.items():
-                if value is not None:
-                    # 将值转换为字符串
-                    str_value = str(value)
-                    # PNG 的 tEXt 块只支持 Latin-1 编码，需要处理非 ASCII 字符
-                    try:
-                        pnginfo.add_text(key, str_value)
-                    except UnicodeEncodeError:
-                        # 对于非 ASCII 字符，使用 UTF-8 编码并标记
-                        encoded_value = str_value.encode(
-                            "utf-8", errors="ignore"
-                        ).decode("latin-1")
-                        pnginfo.add_text(key, encoded_value)
-
-        # 保存图像（覆盖原文件）
-        img.save(image_path, format="PNG", pnginfo=pnginfo)
-        return True
-    except ImportError:
-        logger.error("PIL not installed, cannot write PNG metadata")
-        return False
-    except Exception as e:
-        logger.error(f"Error writing PNG metadata: {e}")
-        return False
-
-
-def save_json_metadata(image_path, metadata):
-    """将 metadata 保存为同名的 JSON 文件"""
-    try:
-        json_path = Path(image_path).with_suffix('.json')
-        
-        # 添加提取时间戳
-        json_metadata = metadata.copy()
-        import time
-        json_metadata["extracted_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
-        
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_metadata, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving JSON metadata: {e}")
-        return False
-
-
-def download_image(image_url, save_path):
-    """下载图像并保存到指定路径"""
+def download_image(image_url):
+    """下载图像，返回图像内容，失败时返回 None"""
     try:
         import requests
     except ImportError:
         logger.error("requests not installed, run: pip install requests")
-        return False
+        return None
 
     try:
         # 创建会话，带 User-Agent 头避免 403
@@ -100,26 +66,42 @@ def download_image(image_url, save_path):
 
         response = session.get(image_url, timeout=60)
         if response.status_code == 200:
-            with open(save_path, "wb") as f:
-                f.write(response.content)
-            return True
+            return response.content
         else:
             logger.warning(f"Failed to download image: HTTP {response.status_code}")
-            return False
+            return None
     except Exception as e:
         logger.error(f"Error downloading image {image_url}: {e}")
-        return False
+        return None
     finally:
         session.close()
 
 
-def scan_and_download(lora_dir, output_dir):
+def download_item(item):
+    """
+    下载一个条目并保存（写入 metadata 后原子重命名，见 save_item_atomically）
+
+    Returns:
+        (实际保存的路径, 错误信息)，成功时错误信息为 None
+    """
+    content = download_image(item["url"])
+    if content is None:
+        return None, "下载失败"
+    try:
+        return save_item_atomically(item, content), None
+    except (OSError, ValueError) as e:
+        logger.error(f"Error writing image metadata: {e}")
+        return None, "写入 metadata 失败"
+
+
+def scan_and_download(lora_dir, output_dir, resume=False):
     """
     扫描 Lora 目录，下载提示词示例图并写入 metadata
 
     Args:
         lora_dir: Lora 模型目录路径
         output_dir: 输出目录路径
+        resume: 继续上次中断的下载，只处理清单中未完成的条目
     """
     lora_dir = os.path.normpath(lora_dir)
     output_dir = os.path.normpath(output_dir)
@@ -131,132 +113,41 @@ def scan_and_download(lora_dir, output_dir):
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
 
+    manifest = DownloadManifest(os.path.join(output_dir, MANIFEST_NAME)).load()
+
     success_count = 0
     failed_count = 0
     skipped_count = 0
     failed_items = []
 
-    logger.info(f"开始扫描 Lora 目录: {lora_dir}")
-
-    # 先统计总图像数
-    total_images = 0
-    for root, dirs, files in os.walk(lora_dir):
-        for file in files:
-            if file.endswith(".metadata.json"):
-                metadata_path = os.path.join(root, file)
-                try:
-                    with open(metadata_path, "r", encoding="utf-8") as f:
-                        metadata = json.load(f)
-                    if "civitai" in metadata and "images" in metadata["civitai"]:
-                        images = metadata["civitai"].get("images", [])
-                        for img in images:
-                            if "meta" in img and "prompt" in img["meta"]:
-                                prompt = img["meta"]["prompt"]
-                                if prompt and prompt.strip():
-                                    total_images += 1
-                except Exception:
-                    pass
-
-    logger.info(f"找到 {total_images} 个带提示词的图像")
-
-    processed_images = 0
-
-    for root, dirs, files in os.walk(lora_dir):
-        for file in files:
-            if file.endswith(".metadata.json"):
-                metadata_path = os.path.join(root, file)
-
-                try:
-                    with open(metadata_path, "r", encoding="utf-8") as f:
-                        metadata = json.load(f)
-
-                    # 获取类别（目录名）
-                    rel_dir = os.path.relpath(root, lora_dir)
-                    if rel_dir == ".":
-                        category = "root"
-                    else:
-                        category = rel_dir.replace("\\", "/")
-
-                    # 创建示例图目录
-                    example_category_dir = os.path.join(output_dir, category)
-                    os.makedirs(example_category_dir, exist_ok=True)
-
-                    # 获取模型名称
-                    model_name = metadata.get("model_name", metadata.get("file_name", ""))
-
-                    # 检查 civitai 数据中是否有图像和提示词
-                    if "civitai" in metadata and "images" in metadata["civitai"]:
-                        civitai_data = metadata["civitai"]
-                        images = civitai_data.get("images", [])
-
-                        # 遍历所有图像，下载有提示词的图像
-                        for idx, img in enumerate(images):
-                            if "meta" in img and "prompt" in img["meta"]:
-                                prompt = img["meta"]["prompt"]
-
-                                # 检查提示词是否为空
-                                if not prompt or not prompt.strip():
-                                    skipped_count += 1
-                                    continue
-
-                                image_url = img.get("url", "")
-                                if not image_url:
-                                    skipped_count += 1
-                                    continue
-
-                                # 生成文件名
-                                base_name = file.replace(".metadata.json", "")
-                                safe_model_name = "".join(
-                                    c for c in model_name if c.isalnum() or c in (" ", "-", "_")
-                                ).strip()
-                                filename = f"{safe_model_name}_{idx}.png"
-                                save_path = os.path.join(example_category_dir, filename)
-
-                                # 检查同名文件是否存在
-                                if os.path.exists(save_path):
-                                    logger.debug(f"文件已存在，跳过: {save_path}")
-                                    skipped_count += 1
-                                    continue
-
-                                # 下载图像
-                                logger.info(f"[{processed_images + 1}/{total_images}] 下载: {filename}")
-                                if download_image(image_url, save_path):
-                                    # 准备 metadata
-                                    png_metadata = {
-                                        "prompt": prompt,
-                                        "negative_prompt": img["meta"].get("negativePrompt", ""),
-                                        "steps": img["meta"].get("steps", ""),
-                                        "sampler": img["meta"].get("sampler", ""),
-                                        "cfg_scale": img["meta"].get("cfgScale", ""),
-                                        "seed": img["meta"].get("seed", ""),
-                                        "width": img.get("width", ""),
-                                        "height": img.get("height", ""),
-                                        "model": img["meta"].get("Model", ""),
-                                        "lora_name": model_name,
-                                        "lora_category": category,
-                                    }
-
-                                    # 写入 PNG metadata 和 JSON 文件
-                                    if write_png_metadata(save_path, png_metadata):
-                                        # 同时保存 JSON 文件
-                                        save_json_metadata(save_path, png_metadata)
-                                        success_count += 1
-                                        logger.info(f"  成功: {filename}")
-                                    else:
-                                        logger.warning(f"  写入 metadata 失败: {filename}")
-                                        failed_count += 1
-                                        failed_items.append(image_url)
-                                else:
-                                    logger.warning(f"  下载失败: {image_url}")
-                                    failed_count += 1
-                                    failed_items.append(image_url)
-
-                                processed_images += 1
-
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse JSON in {metadata_path}: {e}")
-                except Exception as e:
-                    logger.warning(f"Error processing {metadata_path}: {e}")
+    try:
+        if not resume:
+            logger.info(f"开始扫描 Lora 目录: {lora_dir}")
+        items, total_images, skipped_count = plan_manifest_items(
+            manifest, lora_dir, output_dir, resume
+        )
+        if resume:
+            logger.info(f"继续上次的下载: {len(items)} 个未完成的图像")
+        else:
+            logger.info(f"找到 {total_images} 个带提示词的图像")
+
+        for processed_images, item in enumerate(items):
+            filename = os.path.basename(item["save_path"])
+            logger.info(f"[{processed_images + 1}/{len(items)}] 下载: {filename}")
+
+            manifest.mark(item["save_path"], DOWNLOADING)
+            file, error = download_item(item)
+            if error is None:
+                manifest.mark(item["save_path"], DONE, file=file)
+                success_count += 1
+                logger.info(f"  成功: {filename}")
+            else:
+                manifest.mark(item["save_path"], FAILED, error)
+                logger.warning(f"  {error}: {item['url']}")
+                failed_count += 1
+                failed_items.append(item["url"])
+    finally:
+        manifest.close()
 
     # 打印总结
     logger.info("=" * 50)
@@ -273,7 +164,7 @@ def scan_and_download(lora_dir, output_dir):
 
 def main():
     parser = argparse.ArgumentParser(
-        description="从 Lora metadata 下载提示词示例图并写入 PNG metadata"
+        description="从 Lora metadata 下载提示词示例图并写入图像 metadata"
     )
     parser.add_argument(
         "--lora-dir",
@@ -287,6 +178,11 @@ def main():
         default=None,
         help="输出目录路径 (默认: lora_prompts)"
     )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="继续上次中断的下载，只下载清单中未完成的条目"
+    )
 
     args = parser.parse_args()
 
@@ -309,7 +205,7 @@ def main():
     logger.info(f"输出目录: {output_dir}")
 
     # 执行下载
-    scan_and_download(lora_dir, output_dir)
+    scan_and_download(lora_dir, output_dir, resume=args.resume)
 
 
 if __name__ == "__main__":
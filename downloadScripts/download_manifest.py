@@ -0,0 +1,267 @@
+"""
+下载清单 - 记录示例图下载任务中每个条目的状态，支持中断后继续
+
+清单是追加写的 JSON Lines 文件：
+- {"key": ..., "item": {...}}                    新增条目（url、目标路径、metadata 等）
+- {"key": ..., "state": ..., "attempts": ..., "error": ..., "file": ...}   状态变化
+加载时按顺序重放并压缩为每个条目一行；上次中断时处于 downloading 的条目恢复为 pending。
+
+条目以计划的目标文件路径为 key，状态为 pending / downloading / done / failed。
+图像按原始格式保存，实际文件的扩展名可能与 key 不同，完成时记录在 file 字段中。
+只用标准库，独立脚本和插件都可以导入。
+"""
+
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+
+try:
+    from .image_metadata import FORMAT_EXTENSIONS, embed_metadata, output_path
+except ImportError:
+    from image_metadata import FORMAT_EXTENSIONS, embed_metadata, output_path
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+
+# PNG 文件结尾的 IEND 块（长度 + 类型 + CRC）
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+
+# JPEG 文件结尾的 EOI 标记
+JPEG_EOI = b"\xff\xd9"
+
+
+def is_complete_image(path: str) -> bool:
+    """
+    文件存在且完整（写了一半的文件不算）
+
+    PNG 以 IEND 块结尾，JPEG 以 EOI 结尾，WebP 的 RIFF 长度与文件大小一致
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            size = f.seek(0, os.SEEK_END)
+            if head.startswith(b"\x89PNG"):
+                f.seek(-len(PNG_IEND), os.SEEK_END)
+                return f.read() == PNG_IEND
+            if head.startswith(b"\xff\xd8"):
+                f.seek(-len(JPEG_EOI), os.SEEK_END)
+                return f.read() == JPEG_EOI
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                return int.from_bytes(head[4:8], "little") + 8 == size
+            return False
+    except OSError:
+        return False
+
+
+def find_complete_image(path: str) -> Optional[str]:
+    """查找目标路径（或同名的其他图像扩展名）下已完整存在的文件"""
+    base = os.path.splitext(path)[0]
+    candidates = [path] + [base + ext for ext in FORMAT_EXTENSIONS.values()]
+    for candidate in dict.fromkeys(candidates):
+        if is_complete_image(candidate):
+            return candidate
+    return None
+
+
+def part_path(path: str) -> str:
+    """下载中的临时文件路径，完成后原子重命名为 path"""
+    return f"{path}.part"
+
+
+def save_json_metadata(image_path: str, metadata: Dict) -> bool:
+    """将 metadata 保存为同名的 JSON 文件（加上提取时间），失败时返回 False"""
+    json_metadata = dict(metadata)
+    json_metadata["extracted_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    json_path = os.path.splitext(image_path)[0] + ".json"
+    try:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(json_metadata, f, ensure_ascii=False, indent=2)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Error saving JSON metadata {json_path}: {e}")
+        return False
+
+
+def save_item_atomically(item: Dict, content: bytes) -> str:
+    """
+    保存下载的示例图并写入图像内 metadata 和同名 JSON 文件
+
+    metadata 直接插入原始字节流，不重新编码；扩展名按实际格式确定（JPEG 保存为 .jpg）。
+    先写入 .part 临时文件，metadata 写好后再原子重命名，中断时不会留下不完整的图片。
+    插件在线程池中调用，独立脚本直接调用。
+
+    Returns:
+        实际保存的路径，同时记录在 item["file"] 中
+
+    Raises:
+        ValueError: 无法识别的图像格式或 metadata 无法写入
+        OSError: 写文件失败
+    """
+    content, fmt = embed_metadata(content, item["metadata"])
+    save_path = output_path(item["save_path"], fmt)
+    tmp_path = part_path(save_path)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        save_json_metadata(save_path, item["metadata"])
+        os.replace(tmp_path, save_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    item["file"] = save_path
+    return save_path
+
+
+class DownloadManifest:
+    """持久化的下载清单"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._file = None
+
+    # ===== 读写 =====
+
+    def load(self):
+        """读取并压缩清单，之后的变化追加写入"""
+        self.entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时最后一行可能没写完
+                        continue
+                    key = record.get("key")
+                    if not key:
+                        continue
+                    if "item" in record:
+                        self.entries[key] = record["item"]
+                    elif key in self.entries:
+                        entry = self.entries[key]
+                        for field in ("state", "attempts", "error", "file"):
+                            if field in record:
+                                entry[field] = record[field]
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Error reading download manifest {self.path}: {e}")
+
+        for entry in self.entries.values():
+            if entry.get("state") == DOWNLOADING:
+                entry["state"] = PENDING
+
+        self._rewrite()
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def _rewrite(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, entry in self.entries.items():
+                f.write(json.dumps({"key": key, "item": entry}, ensure_ascii=False))
+                f.write("\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, record):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """关闭并压缩清单"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._rewrite()
+
+    # ===== 条目 =====
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+
+    def add(self, key: str, item: Dict) -> Dict:
+        """登记一个待下载条目；已有条目时更新 url/metadata 并保留尝试次数"""
+        old = self.entries.get(key)
+        entry = dict(item)
+        entry["state"] = PENDING
+        entry["attempts"] = old.get("attempts", 0) if old else 0
+        entry["error"] = None
+        if old != entry:
+            self.entries[key] = entry
+            self._append({"key": key, "item": entry})
+        return entry
+
+    def mark(
+        self,
+        key: str,
+        state: str,
+        error: Optional[str] = None,
+        file: Optional[str] = None,
+    ):
+        """
+        更新条目状态，进入 downloading 时尝试次数加一
+
+        Args:
+            file: 实际保存的文件路径（扩展名与 key 不同时传入）
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry["state"] = state
+        entry["error"] = error
+        if state == DOWNLOADING:
+            entry["attempts"] = entry.get("attempts", 0) + 1
+        record = {
+            "key": key,
+            "state": state,
+            "attempts": entry["attempts"],
+            "error": error,
+        }
+        if file is not None:
+            entry["file"] = file
+            record["file"] = file
+        self._append(record)
+
+    def output_file(self, key: str) -> str:
+        """条目实际保存的文件路径"""
+        entry = self.entries.get(key) or {}
+        return entry.get("file") or key
+
+    def is_done(self, key: str) -> bool:
+        """清单记录为完成且实际文件仍然存在"""
+        entry = self.entries.get(key)
+        return (
+            bool(entry)
+            and entry.get("state") == DONE
+            and os.path.exists(self.output_file(key))
+        )
+
+    def unfinished(self) -> List[Dict]:
+        """上次中断时还没完成的条目（pending / downloading）"""
+        return [
+            entry
+            for entry in self.entries.values()
+            if entry.get("state") in (PENDING, DOWNLOADING)
+        ]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PENDING: 0, DOWNLOADING: 0, DONE: 0, FAILED: 0}
+        for entry in self.entries.values():
+            state = entry.get("state", PENDING)
+            counts[state] = counts.get(state, 0) + 1
+        return counts
@@ -0,0 +1,157 @@
+"""
+示例图下载引擎 - 在后台任务中并发下载 CivitAI 示例图
+
+- 所有下载共用一个 aiohttp 会话，总并发数和单主机并发数都有上限
+- 超时、连接错误、429 和 5xx 按指数退避重试（429 优先使用 Retry-After，过长时不再重试）
+- 等待重试期间也会检查取消，不会因为长时间等待而无法停止
+- 写文件和写 metadata 在线程池中执行，不阻塞 ComfyUI 的事件循环
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+from .retry_policy import retry_delay
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    # 带浏览器 User-Agent 避免 403
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+# 这些状态码可以重试，其余 4xx 直接失败
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# 重试等待期间检查取消的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.5
+
+
+class DownloadError(Exception):
+    """下载失败（已用尽重试次数或不可重试的错误）"""
+
+
+class DownloadCancelled(Exception):
+    """等待重试时任务被取消"""
+
+
+class ExampleDownloader:
+    """并发下载一组示例图"""
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        per_host: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 60,
+    ):
+        """
+        Args:
+            concurrency: 同时进行的下载数
+            per_host: 单个主机的最大连接数
+            retries: 失败后的重试次数
+            backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+            timeout: 单次请求超时（秒）
+        """
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def _wait(self, delay: float, is_cancelled: Callable[[], bool]):
+        """分段等待 delay 秒，期间任务被取消时抛出 DownloadCancelled"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        while not is_cancelled():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, CANCEL_POLL_INTERVAL))
+        raise DownloadCancelled()
+
+    async def fetch(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        is_cancelled: Callable[[], bool] = lambda: False,
+    ) -> bytes:
+        """下载一个 URL 的内容，按需重试；每次重试前检查是否已取消"""
+        last_error = ""
+        for attempt in range(self.retries + 1):
+            headers = None
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return await response.read()
+                    last_error = f"HTTP {response.status}"
+                    if response.status not in RETRY_STATUSES:
+                        raise DownloadError(last_error)
+                    headers = response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = str(e) or type(e).__name__
+
+            if attempt < self.retries:
+                delay = retry_delay(headers, attempt, self.backoff)
+                if delay is None:
+                    retry_after = headers.get("Retry-After")
+                    raise DownloadError(f"{last_error} (Retry-After {retry_after}s)")
+                logger.debug(f"Retrying {url} in {delay:.1f}s: {last_error}")
+                await self._wait(delay, is_cancelled)
+        raise DownloadError(last_error)
+
+    async def run(
+        self,
+        items: List[Dict],
+        save_item: Callable[[Dict, bytes], None],
+        on_done: Callable[[Dict, Optional[str]], None],
+        is_cancelled: Callable[[], bool] = lambda: False,
+        on_start: Optional[Callable[[Dict], None]] = None,
+    ):
+        """
+        下载所有条目
+
+        Args:
+            items: 下载条目，至少包含 "url"
+            save_item: save_item(item, content)，在线程池中执行，负责写文件和 metadata
+            on_done: on_done(item, error)，每个条目结束时在事件循环中调用，成功时 error 为 None；
+                等待重试时被取消的条目不调用
+            is_cancelled: 返回 True 时停止领取新的条目，正在等待重试的条目也会停止
+            on_start: on_start(item)，开始下载一个条目前在事件循环中调用
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        async def worker(session):
+            while not is_cancelled():
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if on_start is not None:
+                    on_start(item)
+                try:
+                    content = await self.fetch(session, item["url"], is_cancelled)
+                    await loop.run_in_executor(None, save_item, item, content)
+                except asyncio.CancelledError:
+                    raise
+                except DownloadCancelled:
+                    return
+                except Exception as e:
+                    logger.warning(f"Error downloading {item['url']}: {e}")
+                    on_done(item, str(e) or type(e).__name__)
+                else:
+                    on_done(item, None)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.per_host
+        )
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=self.timeout, headers=DEFAULT_HEADERS
+        ) as session:
+            workers = min(self.concurrency, len(items))
+            await asyncio.gather(*(worker(session) for _ in range(workers)))
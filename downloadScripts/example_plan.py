@@ -0,0 +1,192 @@
+"""
+示例图下载计划 - 一次扫描生成完整的下载列表
+
+只遍历一次 Lora 目录收集 .metadata.json 路径，然后在线程池中并行解析，
+生成 (URL, 目标路径, metadata) 条目列表供下载阶段使用。
+插件的 /reference/download 和独立脚本 download_lora_images.py 共用。
+"""
+
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .download_manifest import DONE, find_complete_image
+except ImportError:
+    from download_manifest import DONE, find_complete_image
+
+# 优先使用 orjson 解析（metadata 中的 CivitAI 描述往往很大）
+try:
+    import orjson
+
+    def _load_json(path):
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+
+except ImportError:
+
+    def _load_json(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+logger = logging.getLogger(__name__)
+
+METADATA_SUFFIX = ".metadata.json"
+
+
+def find_metadata_files(lora_dir: str) -> List[Tuple[str, str]]:
+    """遍历 Lora 目录，返回 [(metadata 路径, 类别)]，类别为相对目录（根目录为 root）"""
+    found = []
+    for root, dirs, files in os.walk(lora_dir):
+        rel_dir = os.path.relpath(root, lora_dir)
+        category = "root" if rel_dir == "." else rel_dir.replace("\\", "/")
+        for file in files:
+            if file.endswith(METADATA_SUFFIX):
+                found.append((os.path.join(root, file), category))
+    return found
+
+
+def plan_metadata_file(
+    metadata_path: str, category: str, output_dir: str
+) -> Tuple[List[Dict], int, int]:
+    """
+    解析一个 metadata 文件
+
+    Returns:
+        (items, total, skipped): 有提示词和 URL 的条目、有提示词的图像数、提示词为空或缺少 URL 的图像数
+    """
+    try:
+        metadata = _load_json(metadata_path)
+    except Exception as e:
+        logger.warning(f"Error processing {metadata_path}: {e}")
+        return [], 0, 0
+    if not isinstance(metadata, dict):
+        return [], 0, 0
+
+    civitai = metadata.get("civitai") or {}
+    images = civitai.get("images") if isinstance(civitai, dict) else None
+    if not images:
+        return [], 0, 0
+
+    model_name = metadata.get("model_name", metadata.get("file_name", ""))
+    safe_model_name = "".join(
+        c for c in model_name if c.isalnum() or c in (" ", "-", "_")
+    ).strip()
+    example_category_dir = os.path.join(output_dir, category)
+
+    items = []
+    total = 0
+    skipped = 0
+    # 遍历所有图像，只保留有提示词的图像
+    for idx, img in enumerate(images):
+        meta = img.get("meta") or {}
+        if "prompt" not in meta:
+            continue
+        prompt = meta["prompt"]
+        # 提示词为空的图像跳过
+        if not prompt or not prompt.strip():
+            skipped += 1
+            continue
+        total += 1
+        image_url = img.get("url", "")
+        if not image_url:
+            skipped += 1
+            continue
+        items.append(
+            {
+                "url": image_url,
+                # 计划的路径，保存时扩展名按实际格式调整（JPEG 为 .jpg）
+                "save_path": os.path.join(
+                    example_category_dir, f"{safe_model_name}_{idx}.png"
+                ),
+                "category": category,
+                "metadata": {
+                    "prompt": prompt,
+                    "negative_prompt": meta.get("negativePrompt", ""),
+                    "steps": meta.get("steps", ""),
+                    "sampler": meta.get("sampler", ""),
+                    "cfg_scale": meta.get("cfgScale", ""),
+                    "seed": meta.get("seed", ""),
+                    "width": img.get("width", ""),
+                    "height": img.get("height", ""),
+                    "model": meta.get("Model", ""),
+                    "lora_name": model_name,
+                    "lora_category": category,
+                },
+            }
+        )
+    return items, total, skipped
+
+
+def plan_example_items(
+    lora_dir: str, output_dir: str, workers: Optional[int] = None
+) -> Tuple[List[Dict], int, int]:
+    """
+    扫描 Lora 目录生成完整的下载列表（目录只遍历一次，metadata 在线程池中解析）
+
+    Args:
+        lora_dir: Lora 模型目录
+        output_dir: 示例图输出目录（按类别分子目录）
+        workers: 解析线程数，默认按 CPU 数
+
+    Returns:
+        (items, total, skipped): 全部条目（按目录顺序）、有提示词的图像总数、跳过的数量
+    """
+    metadata_files = find_metadata_files(lora_dir)
+    if workers is None:
+        workers = min(8, (os.cpu_count() or 1) + 2)
+
+    items = []
+    total = 0
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            lambda entry: plan_metadata_file(entry[0], entry[1], output_dir),
+            metadata_files,
+        )
+        for file_items, file_total, file_skipped in results:
+            items.extend(file_items)
+            total += file_total
+            skipped += file_skipped
+    return items, total, skipped
+
+
+def plan_manifest_items(
+    manifest, lora_dir: str, output_dir: str, resume: bool = False
+) -> Tuple[List[Dict], int, int]:
+    """
+    确定本次要下载的条目，新条目登记到下载清单中
+
+    resume 为 True 时直接继续清单中未完成的条目，不重新扫描 metadata；
+    否则重新扫描，清单中已完成且文件仍在的条目跳过，失败的条目重新下载。
+
+    Args:
+        manifest: 已加载的 DownloadManifest
+
+    Returns:
+        (items, total, skipped): 待下载的清单条目、条目总数、跳过的数量
+    """
+    if resume:
+        items = manifest.unfinished()
+        total = len(manifest.entries)
+        return items, total, total - len(items)
+
+    candidates, total, skipped = plan_example_items(lora_dir, output_dir)
+    items = []
+    for item in candidates:
+        key = item["save_path"]
+        if manifest.is_done(key):
+            skipped += 1
+            continue
+        entry = manifest.add(key, item)
+        # 清单之前下载的完整文件直接记为完成；写了一半的文件会重新下载
+        existing = find_complete_image(key) if entry["attempts"] == 0 else None
+        if existing:
+            manifest.mark(key, DONE, file=existing)
+            skipped += 1
+            continue
+        items.append(entry)
+    return items, total, skipped
@@ -0,0 +1,317 @@
+"""
+Lora 文件 SHA256 缓存 - 未修改的文件不再重复计算 hash
+
+缓存以文件路径为 key，记录 (size, mtime_ns, inode) 和 hash；
+文件的任何一项变化都会重新计算。持久化为追加写的 JSON Lines 文件：
+- {"path": ..., "size": ..., "mtime_ns": ..., "inode": ..., "sha256": ...}
+加载时按顺序重放（后写的覆盖先写的），去掉已不存在的文件后压缩为每个文件一行。
+
+插件和命令行工具可以同时使用同一个缓存文件：缓存未命中时会先读取其它进程追加的行，
+追加前发现文件已被其它进程压缩（inode 变化）时重新读取并改为追加到新文件，
+压缩前也会先合并文件中其它进程写入的内容，因此 ComfyUI 运行时也可以预先计算。
+
+也可以作为命令行工具并行预先计算整个 Lora 目录的 hash：
+    python hash_cache.py [--lora-dir PATH] [--cache-file PATH] [--workers N]
+
+只用标准库，插件和独立脚本都可以导入。
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 读取块大小；hashlib 处理大块数据时会释放 GIL，多个线程可以并行计算
+HASH_BLOCK_SIZE = 1024 * 1024
+MODEL_EXTENSIONS = (".safetensors",)
+
+
+def file_sha256(file_path: str) -> str:
+    """计算文件的 SHA256（Python 3.11+ 使用 hashlib.file_digest）"""
+    with open(file_path, "rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256_hash = hashlib.sha256()
+        buffer = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            sha256_hash.update(view[:size])
+        return sha256_hash.hexdigest()
+
+
+def file_stamp(file_path: str) -> Tuple[int, int, int]:
+    """(size, mtime_ns, inode)，任何一项变化都视为文件已修改"""
+    st = os.stat(file_path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+class HashCache:
+    """持久化的文件 hash 缓存（线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._loaded = False
+        # 已读取的缓存文件 (st_dev, st_ino) 和读取到的位置
+        self._file_id = None
+        self._offset = 0
+
+    # ===== 读写 =====
+
+    def load(self):
+        """读取并压缩缓存文件，之后的新 hash 追加写入"""
+        with self._lock:
+            if self._loaded:
+                return self
+            lines = self._sync()
+            self.entries = {
+                path: record
+                for path, record in self.entries.items()
+                if os.path.exists(path)
+            }
+            if lines > len(self.entries):
+                self._rewrite()
+            self._loaded = True
+        return self
+
+    def _sync(self) -> int:
+        """
+        读取其它进程追加或重写的内容（调用方持有锁），返回读取的行数
+
+        缓存文件被其它进程重写（inode 变化）时从头读取并重新打开追加句柄，
+        否则只读取上次读到的位置之后追加的行
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        except OSError as e:
+            logger.warning(f"Error reading hash cache {self.path}: {e}")
+            return 0
+
+        file_id = (st.st_dev, st.st_ino) if st else None
+        if file_id != self._file_id:
+            self._file_id = file_id
+            self._offset = 0
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        lines = 0
+        if st and st.st_size > self._offset:
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            # 崩溃时或其它进程正在写入的最后一行可能不完整
+                            break
+                        self._offset += len(line)
+                        lines += 1
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if record.get("path") and record.get("sha256"):
+                            self.entries[record["path"]] = record
+            except OSError as e:
+                logger.warning(f"Error reading hash cache {self.path}: {e}")
+        return lines
+
+    def _append(self, record: Dict):
+        """追加一条记录（调用方持有锁），文件被其它进程重写后追加到新文件"""
+        self._sync()
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+            st = os.fstat(self._file.fileno())
+            self._file_id = (st.st_dev, st.st_ino)
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        # 之前已读到文件末尾时，自己写入的行不需要再读回来
+        if os.fstat(self._file.fileno()).st_size == self._offset + len(data):
+            self._offset += len(data)
+
+    def _rewrite(self):
+        """
+        压缩缓存文件（调用方持有锁）
+
+        先合并其它进程追加的内容再替换文件；其它进程下次写入前会发现 inode 变化，
+        重新读取并追加到新文件，不会写进已被替换的旧文件
+        """
+        self._sync()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self.entries.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._file_id = (st.st_dev, st.st_ino)
+        self._offset = st.st_size
+
+    def close(self):
+        """合并其它进程写入的 hash 后关闭并压缩缓存文件"""
+        with self._lock:
+            if self._loaded:
+                self._rewrite()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._loaded = False
+
+    # ===== 查询 =====
+
+    def get(self, file_path: str) -> Optional[str]:
+        """文件未修改时返回缓存的 hash，否则返回 None"""
+        if not self._loaded:
+            self.load()
+        key = os.path.abspath(file_path)
+        try:
+            size, mtime_ns, inode = file_stamp(key)
+        except OSError:
+            return None
+        with self._lock:
+            record = self.entries.get(key)
+            if not self._matches(record, size, mtime_ns, inode):
+                # 可能由其它进程（如命令行预先计算）刚写入
+                self._sync()
+                record = self.entries.get(key)
+        if self._matches(record, size, mtime_ns, inode):
+            return record["sha256"]
+        return None
+
+    @staticmethod
+    def _matches(record, size, mtime_ns, inode) -> bool:
+        return bool(
+            record
+            and record.get("size") == size
+            and record.get("mtime_ns") == mtime_ns
+            and record.get("inode") == inode
+        )
+
+    def sha256(self, file_path: str) -> str:
+        """
+        返回文件的 SHA256，只在缓存缺失或文件已修改时计算
+
+        文件 stat 在计算前获取，计算期间文件被修改时下次会重新计算
+        """
+        cached = self.get(file_path)
+        if cached:
+            return cached
+
+        key = os.path.abspath(file_path)
+        size, mtime_ns, inode = file_stamp(key)
+        digest = file_sha256(key)
+        record = {
+            "path": key,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "inode": inode,
+            "sha256": digest,
+        }
+        with self._lock:
+            self.entries[key] = record
+            if self._loaded:
+                try:
+                    self._append(record)
+                except OSError as e:
+                    logger.warning(f"Error writing hash cache {self.path}: {e}")
+        return digest
+
+    def warm(self, file_paths: Iterable[str], workers: int = 4) -> Dict[str, int]:
+        """
+        并行计算一批文件的 hash 写入缓存
+
+        Returns:
+            {"hashed": 新计算的数量, "cached": 命中缓存的数量, "failed": 失败数量}
+        """
+        stats = {"hashed": 0, "cached": 0, "failed": 0}
+        stats_lock = threading.Lock()
+
+        def warm_one(file_path):
+            try:
+                status = "cached" if self.get(file_path) else "hashed"
+                self.sha256(file_path)
+            except OSError as e:
+                logger.warning(f"Error hashing {file_path}: {e}")
+                status = "failed"
+            with stats_lock:
+                stats[status] += 1
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(warm_one, file_paths))
+        return stats
+
+
+def find_model_files(lora_dir: str):
+    """遍历目录下所有模型文件"""
+    for root, _, files in os.walk(lora_dir):
+        for name in files:
+            if name.endswith(MODEL_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    plugin_dir = os.path.dirname(script_dir)
+
+    parser = argparse.ArgumentParser(
+        description="预先计算 Lora 文件的 SHA256 并写入缓存"
+    )
+    parser.add_argument(
+        "--lora-dir",
+        default=os.path.normpath(
+            os.path.join(plugin_dir, "..", "..", "models", "loras")
+        ),
+        help="Lora 模型目录路径 (默认: ComfyUI/models/loras)",
+    )
+    parser.add_argument(
+        "--cache-file",
+        default=os.path.join(plugin_dir, "cache", "lora_hashes.jsonl"),
+        help="hash 缓存文件 (默认: 插件目录下 cache/lora_hashes.jsonl)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="并行计算的文件数 (默认: 4)"
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.lora_dir):
+        logger.error(f"Lora directory not found: {args.lora_dir}")
+        sys.exit(1)
+
+    cache = HashCache(args.cache_file).load()
+    start = time.time()
+    try:
+        files = list(find_model_files(args.lora_dir))
+        logger.info(f"找到 {len(files)} 个模型文件，开始计算 hash")
+        stats = cache.warm(files, workers=args.workers)
+    finally:
+        cache.close()
+    logger.info(
+        f"完成: 新计算 {stats['hashed']} 个, 命中缓存 {stats['cached']} 个, "
+        f"失败 {stats['failed']} 个, 耗时 {time.time() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+图像 metadata 编解码 - 直接在文件字节流上读写元数据，不解码、不重新编码图像
+
+写入：
+- PNG：在第一个 IDAT 块之前插入 tEXt 块（纯 ASCII 的值）或 iTXt 块（UTF-8，
+  压缩后更小时使用压缩），同名的旧文本块会被替换
+- JPEG：在 JFIF/EXIF 段之后插入 XMP（APP1）段，保持原始 JPEG 数据
+- WebP：不修改文件，只依赖同名的 JSON 文件
+
+读取（read_image_metadata / read_metadata_bytes）：
+- PNG：只读取 IDAT 之前的文本块，tEXt / zTXt / iTXt（压缩或不压缩）都按规范解码；
+  旧版本把 UTF-8 字节当作 Latin-1 写进 tEXt 的乱码值会还原（本模块写入的非 ASCII 值
+  都在 iTXt 中，不会被误当作乱码）
+- JPEG：读取本模块写入的 XMP 字段
+
+CivitAI 的示例图大多是 JPEG，保存时保留原始格式，扩展名按实际内容确定（见 output_path）。
+只用标准库，插件、独立脚本和 prompt_reader 共用。
+"""
+
+import io
+import os
+import zlib
+import struct
+import logging
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Dict, Optional, Tuple
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_TEXT_CHUNKS = (b"tEXt", b"iTXt", b"zTXt")
+
+JPEG_SOI = b"\xff\xd8"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+# APP1 段长度字段是 16 位（含自身 2 字节）
+JPEG_MAX_SEGMENT = 0xFFFF - 2
+XMP_NAMESPACE = "urn:simplepromptmanage:metadata:1.0"
+
+# 实际格式 -> 保存时使用的扩展名
+FORMAT_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+EXTENSION_FORMATS = {
+    ".png": "png",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".webp": "webp",
+}
+
+
+def detect_format(data: bytes) -> Optional[str]:
+    """根据文件头判断图像格式：png / jpeg / webp，无法识别时返回 None"""
+    if data.startswith(PNG_SIGNATURE):
+        return "png"
+    if data.startswith(JPEG_SOI):
+        return "jpeg"
+    if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def output_path(path: str, fmt: Optional[str]) -> str:
+    """按实际格式调整扩展名（已是该格式的扩展名时保持不变，如 .jpeg）"""
+    base, ext = os.path.splitext(path)
+    if fmt not in FORMAT_EXTENSIONS or EXTENSION_FORMATS.get(ext.lower()) == fmt:
+        return path
+    return base + FORMAT_EXTENSIONS[fmt]
+
+
+def _text_items(metadata: Dict):
+    for key, value in metadata.items():
+        if value is None:
+            continue
+        yield str(key), str(value)
+
+
+# ===== PNG 写入 =====
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+    )
+
+
+def png_text_chunk(key: str, value: str) -> bytes:
+    """
+    生成一个文本块：纯 ASCII 用 tEXt，否则用 UTF-8 的 iTXt
+
+    非 ASCII 的 Latin-1 值也写 iTXt：读取时 tEXt 中恰好是合法 UTF-8 的字节
+    （如 "Ã©"）会被当作旧版本的乱码还原
+    """
+    keyword = key.encode("latin-1")
+    if value.isascii():
+        return _png_chunk(b"tEXt", keyword + b"\x00" + value.encode("ascii"))
+
+    text = value.encode("utf-8")
+    compressed = zlib.compress(text)
+    flag = b"\x01" if len(compressed) < len(text) else b"\x00"
+    if flag == b"\x01":
+        text = compressed
+    # 关键字、压缩标志、压缩方法（deflate）、空语言标签、空翻译关键字
+    header = keyword + b"\x00" + flag + b"\x00\x00\x00"
+    return _png_chunk(b"iTXt", header + text)
+
+
+def _png_chunk_keyword(chunk_type: bytes, data: bytes) -> Optional[str]:
+    if chunk_type not in PNG_TEXT_CHUNKS:
+        return None
+    return data.split(b"\x00", 1)[0].decode("latin-1")
+
+
+def insert_png_text(data: bytes, metadata: Dict) -> bytes:
+    """在 PNG 字节流中插入文本块（放在第一个 IDAT 之前），替换同名的旧文本块"""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("not a PNG file")
+
+    items = list(_text_items(metadata))
+    keys = {key for key, _ in items}
+    new_chunks = b"".join(png_text_chunk(key, value) for key, value in items)
+
+    out = [PNG_SIGNATURE]
+    pos = len(PNG_SIGNATURE)
+    inserted = False
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos : pos + 8])
+        end = pos + 12 + length
+        if end > len(data):
+            raise ValueError("truncated PNG chunk")
+        if chunk_type in (b"IDAT", b"IEND") and not inserted:
+            out.append(new_chunks)
+            inserted = True
+        keyword = _png_chunk_keyword(chunk_type, data[pos + 8 : pos + 8 + length])
+        if keyword not in keys:
+            out.append(data[pos:end])
+        pos = end
+        if chunk_type == b"IEND":
+            break
+    if not inserted:
+        raise ValueError("PNG has no image data")
+    return b"".join(out)
+
+
+# ===== JPEG 写入 =====
+
+
+def build_xmp(metadata: Dict) -> bytes:
+    """生成包含 metadata 的 XMP 包（每个键一个元素）"""
+    fields = "".join(
+        f"<pm:{key}>{escape(value)}</pm:{key}>"
+        for key, value in _text_items(metadata)
+        if key.isidentifier()
+    )
+    packet = (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        f'<rdf:Description rdf:about="" xmlns:pm="{XMP_NAMESPACE}">'
+        f"{fields}"
+        "</rdf:Description></rdf:RDF></x:xmpmeta>"
+        '<?xpacket end="w"?>'
+    )
+    return packet.encode("utf-8")
+
+
+def insert_jpeg_xmp(data: bytes, metadata: Dict) -> bytes:
+    """
+    在 JPEG 字节流中插入 XMP 段（放在 JFIF/EXIF 等 APP 段之后），替换已有的 XMP 段
+
+    XMP 超过单个 APP1 段的上限时不写入，metadata 只保存在 JSON 文件中
+    """
+    if not data.startswith(JPEG_SOI):
+        raise ValueError("not a JPEG file")
+
+    payload = XMP_HEADER + build_xmp(metadata)
+    if len(payload) > JPEG_MAX_SEGMENT:
+        logger.warning("XMP metadata too large for a JPEG segment, skipped")
+        return data
+    segment = b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+    out = [JPEG_SOI]
+    pos = 2
+    # 只遍历开头的 APPn 段，之后的数据原样保留
+    while pos + 4 <= len(data) and data[pos] == 0xFF and 0xE0 <= data[pos + 1] <= 0xEF:
+        (length,) = struct.unpack(">H", data[pos + 2 : pos + 4])
+        end = pos + 2 + length
+        is_xmp = (
+            data[pos + 1] == 0xE1
+            and data[pos + 4 : pos + 4 + len(XMP_HEADER)] == XMP_HEADER
+        )
+        if not is_xmp:
+            out.append(data[pos:end])
+        pos = end
+    out.append(segment)
+    out.append(data[pos:])
+    return b"".join(out)
+
+
+# ===== 读取 =====
+
+
+def _repair_mojibake(value: str) -> str:
+    """还原旧版本把 UTF-8 字节按 Latin-1 写入 tEXt 产生的乱码，不是乱码时原样返回"""
+    if value.isascii():
+        return value
+    try:
+        return value.encode("latin-1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return value
+
+
+def decode_png_text_chunk(chunk_type: bytes, data: bytes) -> Tuple[str, str]:
+    """
+    解码一个 tEXt / zTXt / iTXt 块
+
+    Returns:
+        (关键字, 文本)
+    """
+    keyword, _, rest = data.partition(b"\x00")
+    key = keyword.decode("latin-1")
+    if chunk_type == b"tEXt":
+        return key, _repair_mojibake(rest.decode("latin-1"))
+    if chunk_type == b"zTXt":
+        # 压缩方法（1 字节）+ 压缩文本
+        return key, _repair_mojibake(zlib.decompress(rest[1:]).decode("latin-1"))
+
+    # iTXt：压缩标志、压缩方法、语言标签\0、翻译关键字\0、UTF-8 文本
+    flag = rest[0]
+    _, _, rest = rest[2:].partition(b"\x00")
+    _, _, text = rest.partition(b"\x00")
+    if flag:
+        text = zlib.decompress(text)
+    return key, text.decode("utf-8", errors="replace")
+
+
+def _read_png_text(f: BinaryIO) -> Dict[str, str]:
+    """读取 IDAT 之前的全部文本块，图像数据不读取"""
+    metadata = {}
+    f.seek(len(PNG_SIGNATURE))
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+        if chunk_type not in PNG_TEXT_CHUNKS:
+            f.seek(length + 4, os.SEEK_CUR)
+            continue
+        data = f.read(length)
+        f.seek(4, os.SEEK_CUR)
+        try:
+            key, value = decode_png_text_chunk(chunk_type, data)
+        except (IndexError, ValueError, zlib.error) as e:
+            logger.debug(f"Skipping malformed {chunk_type!r} chunk: {e}")
+            continue
+        metadata[key] = value
+    return metadata
+
+
+def parse_xmp(packet: bytes) -> Dict[str, str]:
+    """从 XMP 包中取出本模块写入的字段"""
+    start = packet.find(b"<x:xmpmeta")
+    end = packet.rfind(b"</x:xmpmeta>")
+    if start < 0 or end < 0:
+        return {}
+    try:
+        root = ET.fromstring(packet[start : end + len(b"</x:xmpmeta>")])
+    except ET.ParseError:
+        return {}
+    prefix = "{" + XMP_NAMESPACE + "}"
+    return {
+        element.tag[len(prefix) :]: element.text or ""
+        for element in root.iter()
+        if element.tag.startswith(prefix)
+    }
+
+
+def _read_jpeg_xmp(f: BinaryIO) -> Dict[str, str]:
+    """遍历 JPEG 开头的段查找 XMP，遇到图像数据（SOS）即停止"""
+    f.seek(len(JPEG_SOI))
+    while True:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF or header[1] == 0xDA:
+            return {}
+        (length,) = struct.unpack(">H", header[2:])
+        if length < 2:
+            return {}
+        if header[1] == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(XMP_HEADER):
+                return parse_xmp(data[len(XMP_HEADER) :])
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_metadata(f: BinaryIO) -> Dict[str, str]:
+    fmt = detect_format(f.read(12))
+    if fmt == "png":
+        return _read_png_text(f)
+    if fmt == "jpeg":
+        return _read_jpeg_xmp(f)
+    return {}
+
+
+def read_image_metadata(image_path) -> Dict[str, str]:
+    """
+    读取图像文件内的文本 metadata（只读取文件头部，不解码图像）
+
+    不支持的格式或没有 metadata 时返回空字典
+    """
+    with open(image_path, "rb") as f:
+        return _read_metadata(f)
+
+
+def read_metadata_bytes(data: bytes) -> Dict[str, str]:
+    """read_image_metadata 的内存版本（上传的图像数据）"""
+    return _read_metadata(io.BytesIO(data))
+
+
+# ===== 写入入口 =====
+
+
+def embed_metadata(data: bytes, metadata: Dict) -> Tuple[bytes, Optional[str]]:
+    """
+    把 metadata 写入图像字节流（不重新编码）
+
+    Returns:
+        (新的字节流, 格式)；WebP 原样返回
+
+    Raises:
+        ValueError: 不是可识别的图像（例如服务器返回了错误页面）
+    """
+    fmt = detect_format(data)
+    if fmt == "png":
+        return insert_png_text(data, metadata), fmt
+    if fmt == "jpeg":
+        return insert_jpeg_xmp(data, metadata), fmt
+    if fmt is None:
+        raise ValueError("unsupported image format")
+    return data, fmt
+
+
+def write_image_metadata(image_path: str, metadata: Dict) -> str:
+    """
+    把 metadata 写入已保存的图像文件（原子替换），扩展名与实际格式不符时一并改名
+
+    Returns:
+        写入后的文件路径
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    new_data, fmt = embed_metadata(data, metadata)
+    target = output_path(image_path, fmt)
+    if new_data is data and target == image_path:
+        return image_path
+
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(new_data)
+    os.replace(tmp_path, target)
+    if target != image_path:
+        os.remove(image_path)
+    return target
@@ -7,32 +7,129 @@ import json
 import logging
 import asyncio
 import hashlib
-from typing import Optional, Dict, List, Tuple
+from typing import Callable, Optional, Dict, List, Tuple
 from pathlib import Path
-from .civitai_client import CivitaiClient, calculate_sha256
+from .civitai_client import BULK_LOOKUP_SIZE, CivitaiClient, calculate_sha256
+from .hash_cache import HashCache
 
 logger = logging.getLogger(__name__)
 
+# 每张 Lora 最多下载的预览图数量
+MAX_PREVIEW_IMAGES = 3
+# 批量更新时 hash 查询的合并：凑满一个批量请求或等待这么久后发出
+LOOKUP_BATCH_LINGER = 0.2
+
+
+class HashLookupBatcher:
+    """
+    把各文件陆续算出的 hash 合并为 CivitAI 批量查询
+
+    凑满 BULK_LOOKUP_SIZE 个或等待 LOOKUP_BATCH_LINGER 秒后发出一批，
+    hash 计算和 API 查询仍然是流水线。
+    """
+
+    def __init__(
+        self, client: CivitaiClient, api_slots: asyncio.Semaphore, force: bool
+    ):
+        self.client = client
+        self.api_slots = api_slots
+        self.force = force
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes = set()
+
+    async def lookup(self, file_hash: str) -> Tuple[Optional[Dict], Optional[str]]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(file_hash.lower(), []).append(future)
+        if len(self._pending) >= BULK_LOOKUP_SIZE:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                LOOKUP_BATCH_LINGER, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._run(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: Dict[str, List[asyncio.Future]]):
+        try:
+            async with self.api_slots:
+                logger.info(f"从CivitAI批量查询 {len(batch)} 个模型")
+                results = await self.client.get_models_by_hashes(
+                    list(batch), force=self.force
+                )
+        except Exception as e:
+            logger.error(f"CivitAI 批量查询失败: {e}")
+            results = {}
+            error = str(e)
+        else:
+            error = "CivitAI查询失败"
+        for file_hash, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(file_hash, (None, error)))
+
+    async def close(self):
+        """取消未发出和进行中的查询"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = {}
+        for task in list(self._flushes):
+            task.cancel()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
 
 class LoraUpdateService:
     """Lora模型更新服务"""
 
-    def __init__(self, lora_dir: str):
+    def __init__(
+        self,
+        lora_dir: str,
+        hash_cache: Optional[HashCache] = None,
+        hash_workers: int = 2,
+        api_concurrency: int = 4,
+        download_concurrency: int = 8,
+    ):
         """
         初始化Lora更新服务
 
+        批量更新时各阶段并行，每个阶段单独限制并发数：
+        一个文件在下载预览图时，后面的文件已经在查询 API 或计算 hash。
+
         Args:
             lora_dir: Lora模型目录路径
+            hash_cache: 持久化的 hash 缓存，未修改的文件不再重复计算
+            hash_workers: 同时计算 hash 的文件数（在线程池中执行，受磁盘速度限制）
+            api_concurrency: 同时进行的 CivitAI API 查询数（另受客户端限速）
+            download_concurrency: 同时下载的预览图数
         """
         self.lora_dir = lora_dir
         self.civitai_client = None
+        self.hash_cache = hash_cache
+        self._hash_slots = asyncio.Semaphore(hash_workers)
+        self._api_slots = asyncio.Semaphore(api_concurrency)
+        self._download_slots = asyncio.Semaphore(download_concurrency)
 
     async def initialize(self):
         """初始化CivitAI客户端"""
         self.civitai_client = await CivitaiClient.get_instance()
 
     async def update_lora_metadata(
-        self, lora_file_path: str, progress_callback=None
+        self,
+        lora_file_path: str,
+        progress_callback=None,
+        force: bool = False,
+        batcher: Optional[HashLookupBatcher] = None,
     ) -> Tuple[bool, str]:
         """
         更新单个Lora模型的元数据
@@ -42,6 +139,8 @@ class LoraUpdateService:
         Args:
             lora_file_path: Lora文件完整路径
             progress_callback: 进度回调函数（已废弃，保留用于兼容）
+            force: 忽略 CivitAI 响应缓存，重新查询
+            batcher: 批量更新时合并 hash 查询，为 None 时单独查询
 
         Returns:
             (success, message)
@@ -53,14 +152,25 @@ class LoraUpdateService:
             await self.initialize()
 
         try:
-            # 1. 计算文件hash
-            logger.info(f"计算 {os.path.basename(lora_file_path)} 的SHA256...")
-            file_hash = calculate_sha256(lora_file_path)
+            # 1. 计算文件hash（线程池中执行，不阻塞事件循环；未修改的文件直接用缓存）
+            name = os.path.basename(lora_file_path)
+            hasher = self.hash_cache.sha256 if self.hash_cache else calculate_sha256
+            async with self._hash_slots:
+                logger.info(f"计算 {name} 的SHA256...")
+                file_hash = await asyncio.get_running_loop().run_in_executor(
+                    None, hasher, lora_file_path
+                )
             logger.info(f"SHA256: {file_hash}")
 
             # 2. 从CivitAI获取模型信息
-            logger.info(f"从CivitAI查询模型信息...")
-            model_data, error = await self.civitai_client.get_model_by_hash(file_hash)
+            if batcher is not None:
+                model_data, error = await batcher.lookup(file_hash)
+            else:
+                async with self._api_slots:
+                    logger.info(f"从CivitAI查询模型信息: {name}")
+                    model_data, error = await self.civitai_client.get_model_by_hash(
+                        file_hash, force=force
+                    )
 
             if error:
                 return False, f"CivitAI查询失败: {error}"
@@ -71,26 +181,25 @@ class LoraUpdateService:
             # 3. 保存metadata
             metadata = self._prepare_metadata(lora_file_path, model_data, file_hash)
             metadata_path = self._get_metadata_path(lora_file_path)
-
-            os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
-            with open(metadata_path, "w", encoding="utf-8") as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._save_metadata, metadata_path, metadata
+            )
 
             logger.info(f"已保存metadata: {metadata_path}")
 
-            # 4. 下载预览图像
-            success_count = 0
-            if model_data.get("images") and len(model_data["images"]) > 0:
-                for idx, image in enumerate(
-                    model_data["images"][:3]
-                ):  # 最多下载3张图像
-                    image_url = image.get("url")
-                    if image_url:
-                        success = await self._download_preview_image(
-                            image_url, lora_file_path, idx
-                        )
-                        if success:
-                            success_count += 1
+            # 4. 并发下载预览图像（最多3张）
+            image_urls = [
+                image.get("url")
+                for image in (model_data.get("images") or [])[:MAX_PREVIEW_IMAGES]
+            ]
+            results = await asyncio.gather(
+                *(
+                    self._download_preview_image(image_url, lora_file_path, idx)
+                    for idx, image_url in enumerate(image_urls)
+                    if image_url
+                )
+            )
+            success_count = sum(1 for success in results if success)
 
             logger.info(f"已下载 {success_count} 张预览图像")
 
@@ -103,41 +212,77 @@ class LoraUpdateService:
             return False, f"更新失败: {str(e)}"
 
     async def batch_update_lora_metadata(
-        self, lora_files: List[str], progress_callback=None
+        self,
+        lora_files: List[str],
+        progress_callback=None,
+        on_result: Optional[Callable[[str, bool, str], None]] = None,
+        force: bool = False,
     ) -> Tuple[int, int, List[str]]:
         """
         批量更新Lora模型元数据
 
+        多个文件时 hash 查询合并为 CivitAI 批量请求（HashLookupBatcher），减少请求次数；
+        任务被取消时，还在进行中的文件一并取消（已写入的 metadata 和预览图都是完整文件）
+
         Args:
             lora_files: Lora文件路径列表
             progress_callback: 进度回调函数（已废弃，保留用于兼容）
+            on_result: on_result(lora_file, success, message)，每个文件结束时调用
+            force: 忽略 CivitAI 响应缓存，重新查询
 
         Returns:
             (成功数, 失败数, 失败文件列表)
         """
+        if not self.civitai_client:
+            await self.initialize()
+
         success_count = 0
         failed_files = []
-
-        for idx, lora_file in enumerate(lora_files):
+        finished = 0
+        batcher = (
+            HashLookupBatcher(self.civitai_client, self._api_slots, force)
+            if len(lora_files) > 1
+            else None
+        )
+
+        async def update_one(lora_file):
             try:
                 success, message = await self.update_lora_metadata(
-                    lora_file, progress_callback
+                    lora_file, progress_callback, force=force, batcher=batcher
                 )
+                return lora_file, success, message
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"处理 {lora_file} 时出错: {e}")
+                return lora_file, False, str(e)
 
+        # 所有文件同时进入流水线，各阶段的并发数由信号量限制
+        tasks = [asyncio.create_task(update_one(f)) for f in lora_files]
+        try:
+            for future in asyncio.as_completed(tasks):
+                lora_file, success, message = await future
+                finished += 1
                 if success:
                     success_count += 1
                     logger.info(
-                        f"[{idx+1}/{len(lora_files)}] ✓ {os.path.basename(lora_file)}"
+                        f"[{finished}/{len(lora_files)}] ✓ {os.path.basename(lora_file)}"
                     )
                 else:
                     failed_files.append(lora_file)
                     logger.warning(
-                        f"[{idx+1}/{len(lora_files)}] ✗ {os.path.basename(lora_file)}: {message}"
+                        f"[{finished}/{len(lora_files)}] ✗ {os.path.basename(lora_file)}: {message}"
                     )
-
-            except Exception as e:
-                failed_files.append(lora_file)
-                logger.error(f"处理 {lora_file} 时出错: {e}")
+                if on_result is not None:
+                    on_result(lora_file, success, message)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            if batcher is not None:
+                await batcher.close()
 
         return success_count, len(lora_files) - success_count, failed_files
 
@@ -195,6 +340,12 @@ class LoraUpdateService:
 
         return metadata
 
+    @staticmethod
+    def _save_metadata(metadata_path: str, metadata: Dict):
+        os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
+        with open(metadata_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
     def _get_metadata_path(self, lora_file_path: str) -> str:
         """获取metadata文件路径"""
         base = os.path.splitext(lora_file_path)[0]
@@ -235,10 +386,11 @@ class LoraUpdateService:
             else:
                 preview_path = base + f"_preview{index}" + ext
 
-            logger.info(f"下载预览图像: {image_url} -> {preview_path}")
-            success = await self.civitai_client.download_preview_image(
-                image_url, preview_path
-            )
+            async with self._download_slots:
+                logger.info(f"下载预览图像: {image_url} -> {preview_path}")
+                success = await self.civitai_client.download_preview_image(
+                    image_url, preview_path
+                )
 
             if success:
                 logger.info(f"已保存预览图像: {preview_path}")
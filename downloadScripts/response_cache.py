@@ -0,0 +1,81 @@
+"""
+CivitAI 响应缓存 - 按 hash / 模型 ID 缓存 API 结果，避免重复请求
+
+- 每个 key 一个 JSON 文件（按 sha1 分目录），写入时先写临时文件再原子替换
+- 成功结果和"未找到"（404）结果分别有各自的有效期；非 CivitAI 的 Lora 每次刷新都会查询，
+  404 的有效期较短，模型上传到 CivitAI 后不久就能查到
+- 网络错误、5xx 等不缓存
+
+只用标准库，插件和独立脚本都可以导入。
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """磁盘上的 API 响应缓存（线程安全）"""
+
+    def __init__(self, cache_dir: str, ttl: float, negative_ttl: float):
+        """
+        Args:
+            cache_dir: 缓存目录
+            ttl: 成功结果的有效期（秒），0 表示不缓存
+            negative_ttl: 未找到结果的有效期（秒），0 表示不缓存
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def get(self, key: str) -> Tuple[bool, Optional[Any]]:
+        """
+        Returns:
+            (是否命中, 数据)；命中未找到结果时数据为 None
+        """
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return False, None
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable response cache for {key}: {e}")
+            return False, None
+
+        data = record.get("data")
+        ttl = self.ttl if data is not None else self.negative_ttl
+        if time.time() - record.get("fetched_at", 0) > ttl:
+            return False, None
+        return True, data
+
+    def put(self, key: str, data: Optional[Any]):
+        """保存结果；data 为 None 表示未找到"""
+        if (self.ttl if data is not None else self.negative_ttl) <= 0:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"key": key, "fetched_at": time.time(), "data": data},
+                    f,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Error writing response cache for {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
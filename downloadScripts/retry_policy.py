@@ -0,0 +1,33 @@
+"""
+重试等待时间 - CivitAI API 客户端和示例图下载引擎共用
+
+429 和 5xx 优先按 Retry-After 等待，没有时按指数退避。Retry-After 超过
+MAX_RETRY_AFTER 时不再重试：服务器要求等待几十分钟时，与其让任务一直挂起，
+不如让本次请求失败。
+"""
+
+from typing import Mapping, Optional
+
+# 愿意等待的最长 Retry-After（秒）
+MAX_RETRY_AFTER = 60.0
+
+
+def retry_delay(
+    headers: Optional[Mapping[str, str]], attempt: int, backoff: float
+) -> Optional[float]:
+    """
+    第 attempt 次（从 0 开始）失败后的等待时间
+
+    Args:
+        headers: 响应头，连接错误等没有响应时为 None
+        attempt: 已失败的次数减一
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+
+    Returns:
+        等待秒数；Retry-After 超过 MAX_RETRY_AFTER 时返回 None，表示不再重试
+    """
+    retry_after = headers.get("Retry-After", "") if headers is not None else ""
+    if retry_after.isdigit():
+        delay = float(retry_after)
+        return delay if delay <= MAX_RETRY_AFTER else None
+    return backoff * (2**attempt)
@@ -0,0 +1,328 @@
+"""
+目录监视器 - 在文件变化时通知插件内的各个索引
+
+- Linux 上通过 ctypes 直接使用 inotify（无需额外依赖），递归监视所有子目录
+- 其他平台或 inotify 不可用时回退为轮询：只 stat 目录的 mtime，
+  只有 mtime 变化的目录才重新列出子目录
+- 同一个监视根目录的连续事件会合并（debounce），回调在监视线程中执行
+- inotify 事件队列溢出时，所有根目录都视为有变化并重新添加监视
+- inotify 看不到其它主机对网络文件系统（NFS、SMB 等）的修改，
+  位于网络文件系统上的根目录同时按轮询间隔检查目录 mtime
+
+不依赖插件内其他模块，独立脚本（prompt_reader）也可以直接导入
+"""
+
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# inotify 事件掩码
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# inotify 收不到其它主机修改通知的文件系统类型（/proc/self/mounts 中的类型）
+NETWORK_FS_TYPES = {
+    "nfs",
+    "nfs4",
+    "cifs",
+    "smb3",
+    "smbfs",
+    "9p",
+    "afs",
+    "ceph",
+    "glusterfs",
+    "lustre",
+    "davfs",
+    "fuse.sshfs",
+    "fuse.rclone",
+    "fuse.s3fs",
+}
+
+
+def _load_inotify():
+    """加载 libc 中的 inotify 函数，不可用时返回 None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def _is_network_path(path: str) -> bool:
+    """路径是否位于网络文件系统上（按 /proc/self/mounts 中最长匹配的挂载点判断）"""
+    path = os.path.realpath(path)
+    best_mount = ""
+    best_type = ""
+    try:
+        with open("/proc/self/mounts", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # 挂载点中的空格等字符以八进制转义
+                mount = fields[1].encode().decode("unicode_escape")
+                # 同一个挂载点挂载多次时后面的生效
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) and len(
+                    mount
+                ) >= len(best_mount):
+                    best_mount, best_type = mount, fields[2]
+    except OSError:
+        return False
+    return best_type in NETWORK_FS_TYPES
+
+
+class DirectoryWatcher:
+    """递归监视若干目录，变化时按根目录回调"""
+
+    def __init__(self, poll_interval: float = 5.0, debounce: float = 1.0):
+        """
+        Args:
+            poll_interval: 轮询模式的扫描间隔（秒），inotify 模式下用于重试尚不存在的目录
+            debounce: 事件合并时间（秒），最后一个事件之后安静这么久才回调
+        """
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._roots: Dict[str, str] = {}
+        self._callbacks: Dict[str, Callable[[str], None]] = {}
+        self._pending: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._libc = None
+        self._fd = -1
+        self._wd_paths: Dict[int, tuple] = {}
+        # 轮询模式：key -> {dir: mtime_ns}，key -> {dir: [subdirs]}
+        self._dir_mtimes: Dict[str, Dict[str, int]] = {}
+        self._dir_subdirs: Dict[str, Dict[str, list]] = {}
+        # inotify 模式下位于网络文件系统、需要同时轮询的根目录
+        self._network_roots = set()
+        self.backend = None
+
+    def watch(self, key: str, path: str, callback: Callable[[str], None]):
+        """添加监视根目录，必须在 start() 之前调用"""
+        self._roots[key] = os.path.normpath(path)
+        self._callbacks[key] = callback
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._libc = _load_inotify()
+        if self._libc is not None:
+            self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if self._fd < 0:
+                self._libc = None
+        self.backend = "inotify" if self._libc is not None else "polling"
+
+        for key, root in self._roots.items():
+            if self.backend == "inotify":
+                self._add_tree(key, root)
+                if _is_network_path(root):
+                    self._network_roots.add(key)
+                    self._poll_root(key, notify=False)
+            else:
+                self._poll_root(key, notify=False)
+
+        self._thread = threading.Thread(
+            target=self._run, name="PromptManageWatcher", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Directory watcher started ({self.backend}): {list(self._roots)}")
+        if self._network_roots:
+            logger.info(
+                f"Also polling network filesystem roots: {sorted(self._network_roots)}"
+            )
+
+    def event_driven(self, key: str) -> bool:
+        """
+        根目录的所有变化（包括文件原地修改）是否都会通过事件通知
+
+        为 False 时（轮询模式或网络文件系统）只能发现目录内容的变化，
+        使用方仍需在请求时检查文件
+        """
+        return self.backend == "inotify" and key not in self._network_roots
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    # ===== inotify =====
+
+    def _add_watch(self, key, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            import ctypes
+
+            if ctypes.get_errno() == errno.ENOSPC:
+                logger.warning(
+                    "inotify watch limit reached, raise fs.inotify.max_user_watches"
+                )
+            return False
+        self._wd_paths[wd] = (key, path)
+        return True
+
+    def _add_tree(self, key, root):
+        """为目录及其所有子目录添加监视"""
+        if not os.path.isdir(root):
+            return
+        for current, _, _ in os.walk(root):
+            self._add_watch(key, current)
+
+    def _watched_roots(self):
+        return {key for key, _ in self._wd_paths.values()}
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        now = time.monotonic()
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[
+                offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length
+            ]
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件丢失（wd 为 -1）：所有根目录都视为有变化，补充可能漏掉的子目录监视
+                logger.warning(
+                    "inotify event queue overflowed, rescanning all watched directories"
+                )
+                for key, root in self._roots.items():
+                    self._add_tree(key, root)
+                    self._pending[key] = now
+                continue
+
+            watched = self._wd_paths.get(wd)
+            if mask & IN_IGNORED:
+                self._wd_paths.pop(wd, None)
+            if watched is None:
+                continue
+            key, path = watched
+            self._pending[key] = now
+
+            # 新建或移入的子目录需要补充监视
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                name = os.fsdecode(name.rstrip(b"\0"))
+                self._add_tree(key, os.path.join(path, name))
+
+    # ===== 轮询 =====
+
+    def _poll_root(self, key, notify=True):
+        """只 stat 目录 mtime；mtime 变化的目录才重新列出子目录"""
+        root = self._roots[key]
+        old_mtimes = self._dir_mtimes.get(key, {})
+        old_subdirs = self._dir_subdirs.get(key, {})
+        mtimes = {}
+        subdirs = {}
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime = os.stat(current).st_mtime_ns
+            except OSError:
+                continue
+            mtimes[current] = mtime
+            if old_mtimes.get(current) == mtime and current in old_subdirs:
+                children = old_subdirs[current]
+            else:
+                try:
+                    with os.scandir(current) as it:
+                        children = [e.path for e in it if e.is_dir()]
+                except OSError:
+                    children = []
+            subdirs[current] = children
+            stack.extend(children)
+
+        self._dir_mtimes[key] = mtimes
+        self._dir_subdirs[key] = subdirs
+        if notify and mtimes != old_mtimes:
+            self._pending[key] = time.monotonic()
+
+    # ===== 主循环 =====
+
+    def _run(self):
+        last_poll = time.monotonic()
+        while not self._stop.is_set():
+            if self.backend == "inotify":
+                timeout = self.debounce / 2
+                try:
+                    readable, _, _ = select.select([self._fd], [], [], timeout)
+                except (OSError, ValueError):
+                    break
+                if readable:
+                    self._read_events()
+            else:
+                self._stop.wait(min(self.poll_interval, self.debounce))
+
+            now = time.monotonic()
+            if now - last_poll >= self.poll_interval:
+                last_poll = now
+                if self.backend == "inotify":
+                    # 启动时还不存在的根目录，创建后补充监视
+                    watched = self._watched_roots()
+                    for key, root in self._roots.items():
+                        if key not in watched and os.path.isdir(root):
+                            self._add_tree(key, root)
+                            self._pending[key] = now
+                    for key in self._network_roots:
+                        self._poll_root(key)
+                else:
+                    for key in self._roots:
+                        self._poll_root(key)
+
+            for key, stamp in list(self._pending.items()):
+                if now - stamp >= self.debounce:
+                    del self._pending[key]
+                    try:
+                        self._callbacks[key](key)
+                    except Exception as e:
+                        logger.error(
+                            f"Directory watcher callback failed for {key}: {e}"
+                        )
@@ -0,0 +1,92 @@
+"""
+JSON 读写工具 - 插件各模块共用
+优先使用 orjson（比标准 json 快 2-3 倍），不可用时回退到标准库
+"""
+
+import os
+import json
+import logging
+import threading
+
+# 尝试使用 orjson（比标准 json 快 2-3 倍）
+try:
+    import orjson
+
+    JSON_DUMP = orjson.dumps
+    JSON_LOAD = orjson.loads
+    JSON_ENSURE_ASCII = False
+    ORJSON_AVAILABLE = True
+
+    # 检查 orjson 是否支持 OPT_INDENT_2
+    try:
+        ORJSON_OPT_INDENT = orjson.OPT_INDENT_2
+    except AttributeError:
+        # 旧版本 orjson 不支持 OPT_INDENT_2，禁用 orjson
+        ORJSON_AVAILABLE = False
+        JSON_DUMP = json.dumps
+        JSON_LOAD = json.loads
+except ImportError:
+    JSON_DUMP = json.dumps
+    JSON_LOAD = json.loads
+    JSON_ENSURE_ASCII = False
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def load_json_file(file_path, default=None):
+    """优化的 JSON 文件读取函数"""
+    try:
+        if ORJSON_AVAILABLE:
+            # orjson 读取二进制模式
+            with open(file_path, "rb") as f:
+                return JSON_LOAD(f.read())
+        else:
+            # 标准库回退
+            with open(file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        logger.warning(f"Error loading JSON file {file_path}: {e}")
+        return default
+
+
+def save_json_file(file_path, data, indent=2):
+    """优化的 JSON 文件写入函数（先写临时文件再原子替换，中途崩溃不会截断原文件）"""
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if ORJSON_AVAILABLE:
+            # orjson 只支持 OPT_INDENT_2（2空格缩进），忽略其他缩进值
+            json_bytes = JSON_DUMP(data, option=ORJSON_OPT_INDENT)
+            with open(tmp_path, "wb") as f:
+                f.write(json_bytes)
+        else:
+            # 标准库回退
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=JSON_ENSURE_ASCII, indent=indent)
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception as e:
+        logger.warning(f"Error saving JSON file {file_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def dump_json_line(data):
+    """序列化为单行 JSON（bytes，以换行结尾），用于追加写日志文件"""
+    if ORJSON_AVAILABLE:
+        return JSON_DUMP(data) + b"\n"
+    return (json.dumps(data, ensure_ascii=JSON_ENSURE_ASCII) + "\n").encode("utf-8")
+
+
+def file_stamp(path):
+    """返回文件的 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
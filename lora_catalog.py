@@ -0,0 +1,368 @@
+"""
+Lora 目录索引 - 持久化、增量更新的 Lora 列表
+
+索引保存在 cache/lora_catalog.json，按 .metadata.json 的相对路径记录 mtime/size
+和解析结果，每次刷新时：
+- 目录 mtime 未变：不重新列目录，只 stat 已知的 metadata 文件
+- 目录 mtime 变化：重新列目录，新增/删除的文件和预览图在这里被发现
+- metadata 文件 mtime/size 变化：才重新解析 JSON
+"""
+
+import os
+import logging
+import threading
+
+from .json_io import file_stamp, load_json_file, save_json_file
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+METADATA_SUFFIX = ".metadata.json"
+PREVIEW_EXTS = [".jpeg", ".jpg", ".png"]
+
+# 可排序的字段，未指定时按目录顺序（相对路径）
+SORT_FIELDS = ("name", "filename", "base_model", "category")
+
+
+def parse_lora_metadata(metadata):
+    """从 metadata.json 内容中提取列表需要的字段"""
+    # 提取触发词
+    trigger_words = []
+    if "civitai" in metadata and "trainedWords" in metadata["civitai"]:
+        trained_words = metadata["civitai"]["trainedWords"]
+        if isinstance(trained_words, list) and len(trained_words) > 0:
+            # 将所有训练词合并并提取
+            all_words_str = ", ".join(trained_words)
+            # 分割并清理
+            words = [w.strip() for w in all_words_str.split(",") if w.strip()]
+            trigger_words = words[:5]  # 只取前5个触发词
+
+    return {
+        "name": metadata.get("model_name", metadata.get("file_name", "")),
+        "base_model": metadata.get("base_model", ""),
+        "trigger_words": trigger_words,
+        "notes": metadata.get("notes", ""),
+        "preview_url": metadata.get("preview_url", None),
+        "file_path": metadata.get("file_path", None),
+    }
+
+
+class LoraCatalog:
+    """持久化的 Lora 目录索引"""
+
+    def __init__(self, lora_dir: str, comfyui_root: str, index_file: str):
+        """
+        Args:
+            lora_dir: Lora 模型目录
+            comfyui_root: ComfyUI 根目录（用于生成图片 URL）
+            index_file: 索引文件路径
+        """
+        self.lora_dir = os.path.normpath(lora_dir)
+        self.comfyui_root = os.path.normpath(comfyui_root)
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        # rel_dir -> {"mtime": ns, "subdirs": [...], "metadata": [...]}
+        self._dirs = {}
+        # rel_path -> {"stamp": [mtime_ns, size], "parsed": {...}, "record": {...}}
+        self._entries = {}
+        self._loaded = False
+        self._dirty = False
+        self._result = None
+        # 由目录监视器维护时，只有收到变化通知后才重新扫描
+        self.watched = False
+        self._stale = True
+
+    def mark_stale(self):
+        """目录有变化，下次 get_data() 时重新扫描"""
+        self._stale = True
+
+    # ===== 索引读写 =====
+
+    def _load_index(self):
+        data = load_json_file(self.index_file, None)
+        if (
+            isinstance(data, dict)
+            and data.get("version") == INDEX_VERSION
+            and data.get("lora_dir") == self.lora_dir
+        ):
+            self._dirs = data.get("dirs", {})
+            self._entries = data.get("entries", {})
+        self._loaded = True
+
+    def _save_index(self):
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        save_json_file(
+            self.index_file,
+            {
+                "version": INDEX_VERSION,
+                "lora_dir": self.lora_dir,
+                "dirs": self._dirs,
+                "entries": self._entries,
+            },
+        )
+
+    # ===== 扫描 =====
+
+    def _abs_path(self, rel_path):
+        if rel_path == ".":
+            return self.lora_dir
+        return os.path.join(self.lora_dir, *rel_path.split("/"))
+
+    @staticmethod
+    def _join(rel_dir, name):
+        return name if rel_dir == "." else f"{rel_dir}/{name}"
+
+    def _list_dir(self, abs_dir, mtime):
+        """列出目录中的子目录和 metadata 文件"""
+        subdirs = []
+        metadata = []
+        names = set()
+        with os.scandir(abs_dir) as it:
+            for entry in it:
+                names.add(entry.name)
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif entry.name.endswith(METADATA_SUFFIX):
+                        metadata.append(entry.name)
+                except OSError:
+                    continue
+        info = {
+            "mtime": mtime,
+            "subdirs": sorted(subdirs),
+            "metadata": sorted(metadata),
+        }
+        return info, names
+
+    def _exists(self, path, abs_dir, names):
+        """同目录的文件用目录列表判断，避免逐个 stat"""
+        if not path:
+            return False
+        if os.path.dirname(os.path.normpath(path)) == abs_dir:
+            return os.path.basename(path) in names
+        return os.path.exists(path)
+
+    def _build_record(self, parsed, file, abs_dir, category, names):
+        """根据解析结果和同目录文件生成列表记录"""
+        base_name = file[: -len(METADATA_SUFFIX)]
+
+        # 获取模型文件路径，如果路径不存在，尝试本地查找
+        model_path = parsed["file_path"]
+        if not self._exists(model_path, abs_dir, names):
+            if base_name + ".safetensors" in names:
+                model_path = os.path.join(abs_dir, base_name + ".safetensors")
+
+        # 如果预览图路径不存在，尝试本地查找
+        preview_url = parsed["preview_url"]
+        preview_exists = self._exists(preview_url, abs_dir, names)
+        if not preview_exists:
+            for ext in PREVIEW_EXTS:
+                if base_name + ext in names:
+                    preview_url = os.path.join(abs_dir, base_name + ext)
+                    preview_exists = True
+                    break
+
+        # 将预览图路径转换为web可访问的相对路径
+        if preview_url and preview_exists:
+            try:
+                rel_path = os.path.relpath(preview_url, self.comfyui_root)
+                preview_url = "/prompt_manage/lora/image?path=" + rel_path.replace(
+                    "\\", "/"
+                )
+            except Exception as e:
+                logger.warning(f"Failed to convert preview path {preview_url}: {e}")
+                preview_url = None
+
+        return {
+            "name": parsed["name"],
+            "base_model": parsed["base_model"],
+            "filename": base_name,
+            "category": category,
+            "trigger_words": parsed["trigger_words"],
+            "preview_url": preview_url,
+            "notes": parsed["notes"],
+            "path": model_path,
+        }
+
+    def refresh(self):
+        """增量刷新索引，返回是否有变化"""
+        if not self._loaded:
+            self._load_index()
+
+        changed = False
+        seen_dirs = set()
+        seen_entries = set()
+        stack = ["."]
+
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = self._abs_path(rel_dir)
+            try:
+                mtime = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+            seen_dirs.add(rel_dir)
+
+            info = self._dirs.get(rel_dir)
+            names = None
+            dir_changed = info is None or info.get("mtime") != mtime
+            if dir_changed:
+                try:
+                    info, names = self._list_dir(abs_dir, mtime)
+                except OSError as e:
+                    logger.warning(f"Error listing lora directory {abs_dir}: {e}")
+                    continue
+                self._dirs[rel_dir] = info
+                changed = True
+
+            stack.extend(self._join(rel_dir, sub) for sub in reversed(info["subdirs"]))
+            category = "root" if rel_dir == "." else rel_dir
+
+            for file in info["metadata"]:
+                rel_path = self._join(rel_dir, file)
+                abs_path = os.path.join(abs_dir, file)
+                stamp = file_stamp(abs_path)
+                if stamp is None:
+                    continue
+
+                entry = self._entries.get(rel_path)
+                file_changed = entry is None or tuple(entry["stamp"]) != stamp
+                if not file_changed and not dir_changed:
+                    seen_entries.add(rel_path)
+                    continue
+
+                if names is None:
+                    try:
+                        names = set(os.listdir(abs_dir))
+                    except OSError:
+                        names = set()
+
+                if file_changed:
+                    try:
+                        metadata = load_json_file(abs_path, None)
+                        if metadata is None:
+                            continue
+                        parsed = parse_lora_metadata(metadata)
+                    except Exception as e:
+                        logger.warning(f"Error reading metadata {abs_path}: {e}")
+                        continue
+                else:
+                    parsed = entry["parsed"]
+
+                record = self._build_record(parsed, file, abs_dir, category, names)
+                seen_entries.add(rel_path)
+                if file_changed or entry.get("record") != record:
+                    self._entries[rel_path] = {
+                        "stamp": list(stamp),
+                        "parsed": parsed,
+                        "record": record,
+                    }
+                    changed = True
+
+        for rel_dir in set(self._dirs) - seen_dirs:
+            del self._dirs[rel_dir]
+            changed = True
+        for rel_path in set(self._entries) - seen_entries:
+            del self._entries[rel_path]
+            changed = True
+
+        if changed:
+            self._dirty = True
+            self._result = None
+        return changed
+
+    def get_data(self):
+        """获取 Lora 列表，只重新解析有变化的 metadata"""
+        with self._lock:
+            if not os.path.exists(self.lora_dir):
+                logger.warning(f"Lora directory not found: {self.lora_dir}")
+                return {"categories": [], "loras": []}
+
+            try:
+                if self._stale or not self.watched:
+                    self._stale = False
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Error scanning lora directory: {e}")
+
+            if self._dirty:
+                self._save_index()
+                self._dirty = False
+
+            if self._result is None:
+                # id 为 metadata 文件去掉后缀的相对路径，列表刷新后保持不变
+                loras = [
+                    dict(self._entries[key]["record"], id=key[: -len(METADATA_SUFFIX)])
+                    for key in sorted(self._entries)
+                ]
+                categories = sorted({lora["category"] for lora in loras})
+                base_models = sorted({lora["base_model"] for lora in loras} - {""})
+                self._result = {
+                    "categories": categories,
+                    "base_models": base_models,
+                    "loras": loras,
+                }
+            return self._result
+
+    def query(
+        self,
+        category=None,
+        base_model=None,
+        search=None,
+        sort=None,
+        offset=0,
+        limit=0,
+    ):
+        """
+        筛选、排序并分页
+
+        Args:
+            category: 类别（子目录），None 表示全部
+            base_model: 基础模型，None 表示全部
+            search: 在名称、文件名、基础模型中查找（不区分大小写）
+            sort: SORT_FIELDS 中的字段，前缀 "-" 表示降序
+            offset: 偏移量
+            limit: 返回数量，0 表示不限制
+
+        Returns:
+            {"categories", "base_models", "loras", "total", "offset", "limit", "has_more"}
+            categories / base_models 始终基于全部 Lora，用于填充筛选下拉框
+        """
+        data = self.get_data()
+        loras = data["loras"]
+
+        if category:
+            loras = [lora for lora in loras if lora["category"] == category]
+        if base_model:
+            loras = [lora for lora in loras if lora["base_model"] == base_model]
+        if search:
+            search_lower = search.lower()
+            loras = [
+                lora
+                for lora in loras
+                if search_lower in (lora["name"] or "").lower()
+                or search_lower in lora["filename"].lower()
+                or search_lower in (lora["base_model"] or "").lower()
+            ]
+
+        if sort:
+            descending = sort.startswith("-")
+            field = sort.lstrip("-")
+            if field in SORT_FIELDS:
+                loras = sorted(
+                    loras,
+                    key=lambda lora: str(lora.get(field) or "").lower(),
+                    reverse=descending,
+                )
+
+        total = len(loras)
+        end = total if limit <= 0 else min(offset + limit, total)
+        return {
+            "categories": data["categories"],
+            "base_models": data["base_models"],
+            "loras": loras[offset:end],
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "has_more": end < total,
+        }
@@ -0,0 +1,86 @@
+"""
+媒体文件响应 - Lora 预览图/视频、示例图、缓存图共用
+
+使用 aiohttp 的 FileResponse：
+- 直接从磁盘流式发送（支持时使用 sendfile），不把整个文件读入内存
+- 支持 Range 请求，视频可以拖动进度
+- 自动设置 ETag / Last-Modified，并处理 If-None-Match / If-Modified-Since 返回 304
+
+不依赖插件内其他模块，独立脚本（prompt_reader）也可以直接导入
+"""
+
+import os
+import logging
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+VIDEO_TYPES = {
+    ".mp4": "video/mp4",
+    ".avi": "video/avi",
+    ".mov": "video/quicktime",
+    ".mkv": "video/x-matroska",
+    ".webm": "video/webm",
+}
+MEDIA_TYPES = {**IMAGE_TYPES, **VIDEO_TYPES}
+
+# 浏览器缓存 1 小时，过期后凭 ETag 重新验证（未变化时返回 304）
+CACHE_CONTROL = "public, max-age=3600"
+
+
+def resolve_under(root, rel_path):
+    """把相对路径解析为 root 下的绝对路径，越出 root 时返回 None"""
+    root_abs = os.path.abspath(root)
+    full_path = os.path.abspath(os.path.join(root_abs, rel_path.lstrip("/")))
+    if not full_path.startswith(root_abs + os.sep) and full_path != root_abs:
+        return None
+    return full_path
+
+
+def file_response(full_path, content_types=MEDIA_TYPES, cache_control=CACHE_CONTROL):
+    """
+    返回流式文件响应
+
+    Args:
+        full_path: 文件绝对路径
+        content_types: 允许的 {扩展名: Content-Type}
+        cache_control: Cache-Control 头
+    """
+    content_type = content_types.get(os.path.splitext(full_path)[1].lower())
+    if content_type is None:
+        return web.Response(status=403, text="Invalid file type")
+    if not os.path.isfile(full_path):
+        return web.Response(status=404, text="File not found")
+    return web.FileResponse(
+        full_path,
+        headers={"Content-Type": content_type, "Cache-Control": cache_control},
+    )
+
+
+def serve_media(request, root, content_types=MEDIA_TYPES):
+    """
+    处理 ?path=<相对 root 的路径> 形式的媒体请求
+
+    Args:
+        request: aiohttp 请求
+        root: 允许访问的根目录
+        content_types: 允许的 {扩展名: Content-Type}
+    """
+    rel_path = request.query.get("path", "")
+    if not rel_path:
+        return web.Response(status=400, text="Missing path parameter")
+
+    full_path = resolve_under(root, rel_path)
+    if full_path is None:
+        logger.warning(f"Access denied: path not under {root}")
+        return web.Response(status=403, text="Access denied")
+
+    return file_response(full_path, content_types)
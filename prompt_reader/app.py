@@ -31,7 +31,9 @@ try:
         ORJSON_AVAILABLE = False
         JSON_DUMP = json.dumps
         JSON_LOAD = json.loads
-        print("⚠️  orjson version does not support OPT_INDENT_2, falling back to standard json")
+        print(
+            "⚠️  orjson version does not support OPT_INDENT_2, falling back to standard json"
+        )
 except ImportError:
     JSON_DUMP = json.dumps
     JSON_LOAD = json.loads
@@ -41,6 +43,17 @@ except ImportError:
 
 from PIL import Image
 
+import prompt_manage_package  # noqa: F401  注册 prompt_manage 包
+from prompt_manage.fs_watcher import DirectoryWatcher
+from prompt_manage.media_files import IMAGE_TYPES, file_response
+from prompt_manage.downloadScripts.image_metadata import read_image_metadata
+from prompt_manage.search_index import (
+    REFERENCE_FIELD_ALIASES,
+    REFERENCE_FIELD_WEIGHTS,
+    REFERENCE_PREFIX_ONLY_FIELDS,
+    InvertedIndex,
+)
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -70,6 +83,8 @@ class CacheManager:
     def __init__(self, cache_dir: Path):
         self.cache_dir = cache_dir
         self.memory_cache: Dict[str, Any] = {}
+        # 类别 -> (建立索引时的参考列表, 倒排索引)，参考列表被替换时重建
+        self.search_indexes: Dict[str, Any] = {}
 
     def get_cache_file_path(self, category: str) -> Path:
         """获取类别缓存文件路径"""
@@ -109,6 +124,17 @@ class CacheManager:
         """设置内存缓存"""
         self.memory_cache[category] = data
 
+    def get_search_index(self, category: str, references: List[Dict]) -> InvertedIndex:
+        """获取类别的搜索索引（doc_id 为补零的列表下标，排序与列表顺序一致）"""
+        cached = self.search_indexes.get(category)
+        if cached is not None and cached[0] is references:
+            return cached[1]
+        index = InvertedIndex(REFERENCE_FIELD_WEIGHTS)
+        for i, ref in enumerate(references):
+            index.add(f"{i:08d}", ref)
+        self.search_indexes[category] = (references, index)
+        return index
+
     def compute_hash(self, data_list: List[Dict]) -> str:
         """计算数据列表的哈希值（优化版）"""
         if not data_list:
@@ -126,6 +152,35 @@ class CacheManager:
 cache_manager = CacheManager(CACHE_DIR)
 
 
+# ===== 目录监视 =====
+# 监视器运行时内存缓存总是最新的，不必每次请求都统计文件数来验证
+lora_prompts_watcher: Optional[DirectoryWatcher] = None
+
+
+def on_lora_prompts_changed(key: str):
+    """lora_prompts 目录有变化：丢弃内存和磁盘缓存，下次请求重新扫描"""
+    cache_manager.memory_cache.clear()
+    cache_manager.search_indexes.clear()
+    for cache_file in CACHE_DIR.glob("lora_prompts_*.json"):
+        try:
+            cache_file.unlink()
+        except OSError:
+            pass
+
+
+def start_lora_prompts_watcher():
+    global lora_prompts_watcher
+    if os.environ.get("PROMPT_MANAGE_FS_WATCHER", "1") == "0":
+        return
+    try:
+        watcher = DirectoryWatcher()
+        watcher.watch("lora_prompts", str(LORA_PROMPTS_DIR), on_lora_prompts_changed)
+        watcher.start()
+        lora_prompts_watcher = watcher
+    except Exception as e:
+        logger.warning(f"Failed to start directory watcher: {e}")
+
+
 # ===== 图像处理 =====
 
 
@@ -159,24 +214,25 @@ def extract_image_metadata(image_path: Path) -> Dict[str, Any]:
         if metadata:
             return metadata
 
-    # 从图像提取
+    # 从图像提取（只读文件头部，尺寸缺失时才打开图像）
     try:
-        with Image.open(image_path) as img:
-            metadata = {}
-            if hasattr(img, "text"):
-                metadata = img.text.copy()
+        metadata = read_image_metadata(image_path)
+        if "width" not in metadata or "height" not in metadata:
+            with Image.open(image_path) as img:
+                metadata.setdefault("width", img.width)
+                metadata.setdefault("height", img.height)
 
-            return {
-                "prompt": metadata.get("prompt", ""),
-                "negative_prompt": metadata.get("negative_prompt", ""),
-                "steps": metadata.get("steps", ""),
-                "sampler": metadata.get("sampler", ""),
-                "cfg_scale": metadata.get("cfg_scale", ""),
-                "seed": metadata.get("seed", ""),
-                "model": metadata.get("model", ""),
-                "width": metadata.get("width", img.width),
-                "height": metadata.get("height", img.height),
-            }
+        return {
+            "prompt": metadata.get("prompt", ""),
+            "negative_prompt": metadata.get("negative_prompt", ""),
+            "steps": metadata.get("steps", ""),
+            "sampler": metadata.get("sampler", ""),
+            "cfg_scale": metadata.get("cfg_scale", ""),
+            "seed": metadata.get("seed", ""),
+            "model": metadata.get("model", ""),
+            "width": metadata["width"],
+            "height": metadata["height"],
+        }
     except Exception as e:
         logger.warning(f"Error reading metadata from {image_path}: {e}")
         return {}
@@ -185,6 +241,21 @@ def extract_image_metadata(image_path: Path) -> Dict[str, Any]:
 # ===== 扫描函数（优化版）=====
 
 
+def search_references(
+    category_key: str, references: List[Dict], search: str
+) -> List[Dict]:
+    """
+    用倒排索引搜索参考列表，按匹配质量排序
+
+    支持多词 AND、-词 排除和 sampler: / model: 等字段前缀
+    """
+    index = cache_manager.get_search_index(category_key, references)
+    hits = index.search_query(
+        search, REFERENCE_FIELD_ALIASES, prefix_only_fields=REFERENCE_PREFIX_ONLY_FIELDS
+    )
+    return [references[int(doc_id)] for doc_id, _ in hits]
+
+
 def scan_lora_prompts(
     category: Optional[str] = None,
     search: Optional[str] = None,
@@ -210,6 +281,7 @@ def scan_lora_prompts(
 
     # 检查缓存
     cached_data = cache_manager.get_memory_cache(category_key)
+    trusted = cached_data is not None and lora_prompts_watcher is not None
     if cached_data is None:
         cached_data = cache_manager.load_from_disk(category_key)
         if cached_data:
@@ -222,10 +294,15 @@ def scan_lora_prompts(
             scan_dir = LORA_PROMPTS_DIR / category_key
 
         if scan_dir.exists():
-            # 快速统计文件数（只数不读取）
-            file_count = sum(1 for _ in scan_dir.glob("*.png")) + sum(
-                1 for _ in scan_dir.glob("*.jpg")
-            )
+            # 快速统计文件数（只数不读取），监视器维护的内存缓存跳过这一步
+            if trusted:
+                file_count = cached_data.get("total", 0)
+            else:
+                file_count = sum(
+                    1
+                    for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]
+                    for _ in scan_dir.glob(ext)
+                )
 
             if file_count == cached_data.get("total", 0):
                 # 使用缓存
@@ -233,15 +310,9 @@ def scan_lora_prompts(
 
                 # 搜索筛选
                 if search:
-                    search_lower = search.lower()
-                    filtered_references = [
-                        ref
-                        for ref in filtered_references
-                        if (
-                            search_lower in ref["lora_name"].lower()
-                            or search_lower in ref["prompt"].lower()
-                        )
-                    ]
+                    filtered_references = search_references(
+                        category_key, filtered_references, search
+                    )
 
                 # 分页
                 total = len(filtered_references)
@@ -338,15 +409,9 @@ def scan_lora_prompts(
 
     # 搜索筛选
     if search:
-        search_lower = search.lower()
-        filtered_references = [
-            ref
-            for ref in filtered_references
-            if (
-                search_lower in ref["lora_name"].lower()
-                or search_lower in ref["prompt"].lower()
-            )
-        ]
+        filtered_references = search_references(
+            category_key, filtered_references, search
+        )
 
     # 分页
     total = len(filtered_references)
@@ -431,27 +496,8 @@ async def get_image(request: web.Request) -> web.Response:
             logger.error(f"Path validation error: {e}")
             return web.Response(status=403, text="Access denied")
 
-        if not image_path.exists():
-            return web.Response(status=404, text="File not found")
-
-        # 检查文件类型
-        allowed_exts = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
-        if not image_path.suffix.lower() in allowed_exts:
-            return web.Response(status=403, text="Invalid file type")
-
-        # 读取并返回图像
-        with open(image_path, "rb") as f:
-            content = f.read()
-
-        content_type = {
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
-            ".webp": "image/webp",
-        }.get(image_path.suffix.lower(), "image/jpeg")
-
-        return web.Response(body=content, content_type=content_type)
+        # 流式发送，支持 Range 和 304
+        return file_response(str(image_path), IMAGE_TYPES)
 
     except Exception as e:
         logger.error(f"Error serving image: {e}")
@@ -514,6 +560,7 @@ def create_app() -> web.Application:
 async def main(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
     """启动服务器"""
     app = create_app()
+    start_lora_prompts_watcher()
 
     logger.info(f"Starting Prompt Reader server (Ultra Optimized)...")
     logger.info(f"Lora prompts directory: {LORA_PROMPTS_DIR}")
@@ -12,6 +12,9 @@ from pathlib import Path
 from PIL import Image
 from typing import Dict, Any, Optional
 
+import prompt_manage_package  # noqa: F401  注册 prompt_manage 包
+from prompt_manage.downloadScripts.image_metadata import read_image_metadata
+
 # ===== 配置 =====
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent
@@ -22,13 +25,10 @@ LORA_PROMPTS_DIR = PROJECT_ROOT / "prompt_example"
 def extract_metadata_from_image(image_path: Path) -> Optional[Dict[str, Any]]:
     """从图像文件提取 metadata"""
     try:
+        # 获取图像内的 metadata（PNG 文本块 / JPEG XMP，UTF-8 正确解码）
+        metadata = read_image_metadata(image_path)
+
         with Image.open(image_path) as img:
-            metadata = {}
-            
-            # 获取PNG metadata
-            if hasattr(img, "text"):
-                metadata = img.text.copy()
-            
             # 提取常用字段
             result = {
                 "file_name": image_path.name,
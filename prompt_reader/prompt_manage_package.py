@@ -0,0 +1,19 @@
+"""
+把插件目录注册为 prompt_manage 包，供 Prompt Reader 的独立脚本导入插件中的共用模块
+
+插件目录的 __init__.py 依赖 ComfyUI 的 server 模块，独立运行时不能执行它：
+这里只创建包对象并设置 __path__，子模块按包限定的名字导入，
+如 prompt_manage.search_index，不会与同名的已安装模块混淆。
+"""
+
+import sys
+import types
+from pathlib import Path
+
+PACKAGE = "prompt_manage"
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+if PACKAGE not in sys.modules:
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [str(PLUGIN_DIR)]
+    sys.modules[PACKAGE] = package
@@ -0,0 +1,451 @@
+"""
+提示词库存储 - 进程内常驻的提示词数据
+插件加载时读取一次，之后所有请求直接从内存读取；
+通过文件 mtime 检测 UI 之外的修改（手动编辑 prompts.json、更新默认库）
+
+持久化采用 快照 + 追加日志：
+- prompts.json 是快照，只在压缩时整体重写（临时文件 + 原子替换）
+- 每次增删改只向 prompts.journal.jsonl 追加一行记录，写入开销与库大小无关
+- 日志超过阈值或进程退出时折叠进快照；启动时回放 快照 + 日志
+
+每条提示词带稳定的 id，增删改按 id 寻址；库有一个单调递增的版本号，
+客户端可以用 changes_since(version) 只拉取自己没见过的变化；
+name / text / note 维护在倒排索引中，search() 在服务端完成模糊/精确搜索
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+
+from .json_io import (
+    JSON_LOAD,
+    dump_json_line,
+    file_stamp,
+    load_json_file,
+    save_json_file,
+)
+from .search_index import InvertedIndex
+
+logger = logging.getLogger(__name__)
+
+# 日志超过该大小时折叠进快照
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+# 内存中保留的变更记录条数，更早的版本只能全量同步
+CHANGE_LOG_SIZE = 2000
+# 搜索时各字段的权重
+SEARCH_FIELD_WEIGHTS = {"name": 3.0, "note": 1.5, "text": 1.0}
+
+
+def new_prompt_id():
+    """生成新的提示词 id"""
+    return uuid.uuid4().hex
+
+
+def is_subset(user_data, default_data):
+    """
+    检查user_data是否是default_data的子集
+    子集定义：user_data中的所有项都在default_data中存在（根据name判断）
+    """
+    if not isinstance(user_data, list) or not isinstance(default_data, list):
+        return False
+
+    default_names = {item.get("name") for item in default_data}
+
+    for item in user_data:
+        name = item.get("name")
+        if name not in default_names:
+            return False
+
+    return True
+
+
+def sync_prompts(data_file, default_file):
+    """
+    同步prompts.json和prompts_default.json
+    如果prompts.json是prompts_default.json的子集，则更新为最新的default
+    否则不更新
+    """
+    # 确保default文件存在
+    if not os.path.exists(default_file):
+        save_json_file(default_file, [], indent=4)
+
+    # 读取default数据
+    default_data = load_json_file(default_file, [])
+
+    # 如果user文件不存在，创建为default的副本
+    if not os.path.exists(data_file):
+        save_json_file(data_file, default_data, indent=4)
+        return
+
+    # 读取user数据
+    user_data = load_json_file(data_file, [])
+
+    # 检查user_data是否是default_data的子集
+    if is_subset(user_data, default_data):
+        # 如果是子集，同步为最新的default，同名条目沿用原来的 id
+        ids_by_name = {
+            item.get("name"): item["id"] for item in user_data if item.get("id")
+        }
+        used_ids = set()
+        synced = []
+        for item in default_data:
+            item = dict(item)
+            prompt_id = ids_by_name.get(item.get("name"))
+            if prompt_id and prompt_id not in used_ids:
+                item["id"] = prompt_id
+                used_ids.add(prompt_id)
+            synced.append(item)
+        if synced != user_data:
+            save_json_file(data_file, synced, indent=4)
+
+
+def merge_prompt_fields(old, data):
+    """按更新请求合并字段，未给出的字段保留原值"""
+    return {
+        "id": old.get("id"),
+        "name": data.get("name", old.get("name", "")),
+        "direction": data.get("direction", old.get("direction", "无")),
+        "type": data.get("type", old.get("type", "其它")),
+        "note": data.get("note", old.get("note", "")),
+        "text": data.get("text", old.get("text", "")),
+    }
+
+
+class PromptStore:
+    """提示词库内存存储"""
+
+    def __init__(self, data_file: str, default_file: str, journal_file: str = None):
+        """
+        Args:
+            data_file: 用户提示词文件 (prompts.json)
+            default_file: 默认提示词文件 (prompts_default.json)
+            journal_file: 修改日志文件，默认与 data_file 同目录的 prompts.journal.jsonl
+        """
+        self.data_file = data_file
+        self.default_file = default_file
+        self.journal_file = journal_file or (
+            os.path.splitext(data_file)[0] + ".journal.jsonl"
+        )
+        self._lock = threading.RLock()
+        # {id: item}，dict 保持插入顺序，即列表顺序
+        self._items = {}
+        self._data_stamp = None
+        self._default_stamp = None
+        self._journal_size = 0
+        self._loaded = False
+        # 版本号以毫秒时间戳为起点，重启后旧版本号一定落在变更记录之外
+        self.version = 0
+        self._reset_version = 0
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._search_index = InvertedIndex(SEARCH_FIELD_WEIGHTS)
+
+    def load(self):
+        """从磁盘（重新）加载提示词库：回放日志并压缩，再与默认库同步"""
+        with self._lock:
+            # 先把未压缩的日志折叠进快照，再做默认库同步，避免同步判断基于过期数据
+            if os.path.exists(self.journal_file):
+                self._items = self._index_items(self._read_snapshot())
+                replayed = self._replay_journal()
+                if replayed:
+                    logger.info(f"Replayed {replayed} prompt journal records")
+                self._write_snapshot()
+
+            sync_prompts(self.data_file, self.default_file)
+            prompts = self._read_snapshot()
+            missing_ids = any(not item.get("id") for item in prompts)
+            self._items = self._index_items(prompts)
+            if missing_ids or len(self._items) != len(prompts):
+                # 旧数据没有 id，补齐后立即落盘，保证 id 跨重启稳定
+                self._write_snapshot()
+            self._data_stamp = file_stamp(self.data_file)
+            self._default_stamp = file_stamp(self.default_file)
+            self._loaded = True
+            self._rebuild_search_index()
+            self._reset_changes()
+
+    def _read_snapshot(self):
+        data = load_json_file(self.data_file, [])
+        if not isinstance(data, list):
+            logger.warning(f"Invalid prompt library format: {self.data_file}")
+            data = []
+        return data
+
+    @staticmethod
+    def _index_items(prompts):
+        """建立 id -> item 映射，缺失或重复的 id 重新分配"""
+        items = {}
+        for item in prompts:
+            if not isinstance(item, dict):
+                continue
+            prompt_id = item.get("id")
+            if not prompt_id or prompt_id in items:
+                prompt_id = new_prompt_id()
+                item["id"] = prompt_id
+            items[prompt_id] = item
+        return items
+
+    def _replay_journal(self):
+        """把日志记录依次应用到内存数据，返回应用的记录数"""
+        count = 0
+        try:
+            with open(self.journal_file, "rb") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = JSON_LOAD(line)
+                    except Exception:
+                        # 最后一行可能在崩溃时只写了一半
+                        logger.warning("Skipping malformed prompt journal record")
+                        continue
+                    self._apply(record)
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count
+
+    def _apply(self, record):
+        """把一条日志记录应用到内存数据上"""
+        op = record.get("op")
+        prompt_id = record.get("id")
+        if prompt_id is None and "index" in record:
+            # 兼容按索引记录的旧日志
+            index = record["index"]
+            ids = list(self._items)
+            prompt_id = ids[index] if 0 <= index < len(ids) else None
+        if op == "add":
+            item = record["item"]
+            item.setdefault("id", new_prompt_id())
+            self._items[item["id"]] = item
+        elif op == "delete":
+            self._items.pop(prompt_id, None)
+        elif op == "update" and prompt_id in self._items:
+            item = record["item"]
+            item["id"] = prompt_id
+            self._items[prompt_id] = item
+
+    def _write_snapshot(self):
+        """整体写入快照并清空日志"""
+        if not save_json_file(self.data_file, list(self._items.values()), indent=4):
+            return False
+        self._data_stamp = file_stamp(self.data_file)
+        try:
+            os.remove(self.journal_file)
+        except FileNotFoundError:
+            pass
+        self._journal_size = 0
+        return True
+
+    def _append_journal(self, record):
+        """追加一条日志，超过阈值时压缩"""
+        line = dump_json_line(record)
+        with open(self.journal_file, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_size += len(line)
+        if self._journal_size >= JOURNAL_COMPACT_BYTES:
+            self.compact()
+
+    def compact(self):
+        """把日志折叠进快照"""
+        with self._lock:
+            if not self._loaded or not os.path.exists(self.journal_file):
+                return
+            self._write_snapshot()
+
+    def close(self):
+        """进程退出时调用，保证日志被折叠进快照"""
+        self.compact()
+
+    def _refresh_if_changed(self):
+        """文件在 UI 之外被修改时重新加载"""
+        if not self._loaded:
+            self.load()
+            return
+        if (
+            file_stamp(self.data_file) != self._data_stamp
+            or file_stamp(self.default_file) != self._default_stamp
+        ):
+            logger.info("Prompt library changed on disk, reloading")
+            self.load()
+
+    def _rebuild_search_index(self):
+        self._search_index.clear()
+        for prompt_id, item in self._items.items():
+            self._search_index.add(prompt_id, item)
+
+    # ===== 版本与变更记录 =====
+
+    def _reset_changes(self):
+        """整库被替换后清空变更记录，早于此版本的客户端需要全量同步"""
+        self.version = max(self.version + 1, int(time.time() * 1000))
+        self._reset_version = self.version
+        self._changes.clear()
+
+    def _record_change(self, op, prompt_id, item=None):
+        self.version += 1
+        change = {"version": self.version, "op": op, "id": prompt_id}
+        if item is not None:
+            change["item"] = item
+        self._changes.append(change)
+        return change
+
+    def changes_since(self, since):
+        """
+        获取某个版本之后的变化
+
+        Returns:
+            {"version", "full": False, "changes": [...]}，
+            版本过旧无法增量时返回 {"version", "full": True, "prompts": [...]}
+        """
+        with self._lock:
+            self._refresh_if_changed()
+            oldest = self._changes[0]["version"] if self._changes else self.version + 1
+            if (
+                since < self._reset_version
+                or since > self.version
+                or since < oldest - 1
+            ):
+                return {
+                    "version": self.version,
+                    "full": True,
+                    "prompts": list(self._items.values()),
+                }
+            # 同一条提示词只保留最后一次变化
+            latest = {}
+            for change in self._changes:
+                if change["version"] > since:
+                    latest.pop(change["id"], None)
+                    latest[change["id"]] = change
+            return {
+                "version": self.version,
+                "full": False,
+                "changes": list(latest.values()),
+            }
+
+    # ===== 读写接口 =====
+
+    def get_all(self):
+        """获取全部提示词"""
+        with self._lock:
+            self._refresh_if_changed()
+            return list(self._items.values())
+
+    def get(self, prompt_id):
+        """按 id 获取提示词"""
+        with self._lock:
+            self._refresh_if_changed()
+            return self._items.get(prompt_id)
+
+    def id_at(self, index):
+        """把列表索引转换为 id（兼容旧的按索引接口）"""
+        with self._lock:
+            self._refresh_if_changed()
+            if not 0 <= index < len(self._items):
+                return None
+            return list(self._items)[index]
+
+    def replace_all(self, data):
+        """整体替换提示词库（本身就是全量写入，直接写快照）"""
+        with self._lock:
+            self._items = self._index_items(
+                list(data) if isinstance(data, list) else []
+            )
+            self._write_snapshot()
+            self._rebuild_search_index()
+            self._reset_changes()
+
+    def add(self, item):
+        """追加一条提示词，返回变更记录"""
+        with self._lock:
+            self._refresh_if_changed()
+            item = dict(item)
+            item["id"] = new_prompt_id()
+            self._items[item["id"]] = item
+            self._search_index.add(item["id"], item)
+            self._append_journal({"op": "add", "item": item})
+            return self._record_change("upsert", item["id"], item)
+
+    def delete(self, prompt_id):
+        """按 id 删除提示词，返回变更记录，不存在时返回 None"""
+        with self._lock:
+            self._refresh_if_changed()
+            if prompt_id not in self._items:
+                return None
+            del self._items[prompt_id]
+            self._search_index.remove(prompt_id)
+            self._append_journal({"op": "delete", "id": prompt_id})
+            return self._record_change("delete", prompt_id)
+
+    def update(self, prompt_id, data):
+        """按 id 更新提示词，未给出的字段保留原值；返回变更记录，不存在时返回 None"""
+        with self._lock:
+            self._refresh_if_changed()
+            old = self._items.get(prompt_id)
+            if old is None:
+                return None
+            item = merge_prompt_fields(old, data)
+            self._items[prompt_id] = item
+            self._search_index.add(prompt_id, item)
+            self._append_journal({"op": "update", "id": prompt_id, "item": item})
+            return self._record_change("upsert", prompt_id, item)
+
+    def search(
+        self,
+        query="",
+        mode="fuzzy",
+        prompt_type=None,
+        direction=None,
+        offset=0,
+        limit=50,
+    ):
+        """
+        服务端搜索提示词
+
+        Args:
+            query: 查询串，为空时按列表顺序返回全部（仍应用类型/方向筛选）
+            mode: "fuzzy" 或 "exact"
+            prompt_type: 按 type 筛选
+            direction: 按 direction 筛选
+            offset: 偏移量
+            limit: 返回数量，0 表示不限制
+
+        Returns:
+            {"results", "total", "offset", "limit", "has_more", "version"}
+        """
+        with self._lock:
+            self._refresh_if_changed()
+            if prompt_type or direction:
+                allowed = [
+                    prompt_id
+                    for prompt_id, item in self._items.items()
+                    if (not prompt_type or item.get("type", "其它") == prompt_type)
+                    and (not direction or item.get("direction", "无") == direction)
+                ]
+            else:
+                allowed = None
+
+            if query and query.strip():
+                position = {prompt_id: i for i, prompt_id in enumerate(self._items)}
+                hits = self._search_index.search(query, mode, allowed)
+                # 同分按列表顺序
+                hits.sort(key=lambda hit: (-hit[1], position[hit[0]]))
+                ids = [prompt_id for prompt_id, _ in hits]
+            else:
+                ids = allowed if allowed is not None else list(self._items)
+
+            total = len(ids)
+            end = total if limit <= 0 else min(offset + limit, total)
+            return {
+                "results": [self._items[prompt_id] for prompt_id in ids[offset:end]],
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "has_more": end < total,
+                "version": self.version,
+            }
@@ -0,0 +1,707 @@
+"""
+参考图索引 - 持久化、增量更新的示例图列表（prompt_example/）
+
+索引保存在 cache/reference_index.json，按图片相对路径记录图片和同名 JSON 的
+mtime/size 以及生成的记录，每次刷新时：
+- 目录 mtime 未变：不重新列目录，也不 stat 其中的文件
+- 目录 mtime 变化：重新列目录，只重新读取新增或 mtime/size 变化的图片
+- 收到目录监视器的变化通知（可能是原地修改的文件）：stat 所有已知文件
+插件写入的图片和 JSON 都是先写临时文件再重命名，会更新所在目录的 mtime。
+
+搜索使用内存中的倒排索引（第一次搜索时建立，之后随记录增量更新），
+支持多词 AND、-词 排除和 sampler: / model: 等字段前缀，按匹配质量排序。
+
+记录变化后重新生成列表时，同时算出每条记录的分面取值（采样器、模型、步数、CFG、
+分辨率分组、Lora 名称）；查询时按分面筛选、统计各取值的数量，并可按添加时间、
+分辨率或名称排序。
+
+每条记录带有由内容（提示词、Lora 名称、生成参数和图片文件大小）算出的 id，
+目录增删其它文件或图片移到其它类别时不变，可以用 get_by_ids() 直接查找。
+内容完全相同的多张图片（如复制到其它类别）中，最早的一张保留这个 id，
+其余的在后面加上由相对路径算出的后缀。
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from .json_io import load_json_file, save_json_file
+from .search_index import (
+    REFERENCE_FIELD_ALIASES,
+    REFERENCE_FIELD_WEIGHTS,
+    REFERENCE_PREFIX_ONLY_FIELDS,
+    InvertedIndex,
+)
+from .downloadScripts.image_metadata import read_image_metadata
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 3
+# 缓存的搜索结果和查询结果数量
+SEARCH_CACHE_SIZE = 16
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+SIDECAR_EXT = ".json"
+
+# 同名 JSON 中读取的字段及默认值
+SIDECAR_FIELDS = {
+    "prompt": "",
+    "negative_prompt": "",
+    "steps": "",
+    "sampler": "",
+    "cfg_scale": "",
+    "seed": "",
+    "model": "",
+    "width": 0,
+    "height": 0,
+    "lora_name": "",
+}
+
+# 分面字段，resolution 为按像素数和方向分组的分辨率（见 resolution_bucket）
+FACET_FIELDS = ("sampler", "model", "steps", "cfg_scale", "resolution", "lora_name")
+# 按数值归一化的分面字段（7、"7"、7.0 视为同一个取值）
+NUMERIC_FACETS = ("steps", "cfg_scale")
+# 每个分面最多返回的取值数量（已选中的取值总会返回）
+FACET_VALUE_LIMIT = 50
+# 分辨率分组的边长步长
+RESOLUTION_BUCKET_STEP = 128
+# 排序方式：添加时间（新的在前）、分辨率（大的在前）、名称
+SORT_KEYS = ("date", "resolution", "name")
+
+
+# 参与计算记录 id 的字段
+ID_FIELDS = (
+    "lora_name",
+    "prompt",
+    "negative_prompt",
+    "seed",
+    "steps",
+    "sampler",
+    "cfg_scale",
+    "model",
+    "width",
+    "height",
+)
+
+
+def reference_id(record, image_size):
+    """
+    由记录内容和图片文件大小算出的稳定 id（不含类别和路径）
+
+    参数相同、图片不同（如换了 metadata 中没有记录的模型）的两张图片文件大小几乎
+    不会相同；完全相同的副本由 ReferenceIndex 加后缀区分
+    """
+    content = json.dumps(
+        [record.get(field, "") for field in ID_FIELDS] + [image_size],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def resolution_bucket(width, height):
+    """
+    分辨率分组：按像素数折算的边长（取整到 RESOLUTION_BUCKET_STEP）加方向
+
+    如 1024x1024 -> "1024 square"，832x1216 -> "1024 portrait"，尺寸未知时返回空字符串
+    """
+    width, height = _to_int(width), _to_int(height)
+    if width <= 0 or height <= 0:
+        return ""
+    side = round((width * height) ** 0.5 / RESOLUTION_BUCKET_STEP)
+    side = max(side, 1) * RESOLUTION_BUCKET_STEP
+    if max(width, height) <= min(width, height) * 1.1:
+        orientation = "square"
+    else:
+        orientation = "portrait" if height > width else "landscape"
+    return f"{side} {orientation}"
+
+
+def facet_values(record):
+    """记录的分面取值 {分面: 取值}，没有取值的分面不出现"""
+    values = {}
+    for field in FACET_FIELDS:
+        if field == "resolution":
+            value = resolution_bucket(record.get("width"), record.get("height"))
+        else:
+            value = str(record.get(field) or "").strip()
+            if value and field in NUMERIC_FACETS:
+                try:
+                    value = f"{float(value):g}"
+                except ValueError:
+                    pass
+        if value:
+            values[field] = value
+    return values
+
+
+def read_reference_metadata(image_path, json_path=None):
+    """读取一张示例图的 metadata：优先同名 JSON，没有或读取失败时读图像内的 metadata"""
+    metadata = {}
+    if json_path:
+        json_metadata = load_json_file(json_path, None)
+        if json_metadata:
+            metadata = {
+                field: json_metadata.get(field, default)
+                for field, default in SIDECAR_FIELDS.items()
+            }
+
+    if not metadata:
+        # 读取图像内的 metadata（只读文件头部）
+        metadata = read_image_metadata(image_path)
+        # 获取图像尺寸（如果metadata中没有）
+        if "width" not in metadata or "height" not in metadata:
+            with Image.open(image_path) as img:
+                metadata["width"] = img.width
+                metadata["height"] = img.height
+    return metadata
+
+
+class ReferenceIndex:
+    """持久化的参考图索引"""
+
+    def __init__(self, example_dir: str, comfyui_root: str, index_file: str):
+        """
+        Args:
+            example_dir: 示例图目录
+            comfyui_root: ComfyUI 根目录（用于生成图片 URL）
+            index_file: 索引文件路径
+        """
+        self.example_dir = os.path.normpath(example_dir)
+        self.comfyui_root = os.path.normpath(comfyui_root)
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        # 保护随 get_data() 结果缓存的搜索和查询结果（query() 在线程池中并发执行）
+        self._cache_lock = threading.Lock()
+        # rel_dir -> {"mtime": ns, "subdirs": [...], "images": [...], "sidecars": [...]}
+        self._dirs = {}
+        # rel_path -> {"stamp": [...], "record": {...} 或 None（没有提示词）}
+        self._entries = {}
+        # 已重新列出、其中的文件还没有处理的目录
+        self._pending_dirs = set()
+        self._loaded = False
+        self._dirty = False
+        self._result = None
+        # 搜索索引（doc_id 为图片相对路径），第一次搜索时建立
+        self._search = InvertedIndex(REFERENCE_FIELD_WEIGHTS)
+        self._search_ready = False
+        # 由目录监视器维护时，只有收到变化通知后才重新扫描
+        self.watched = False
+        self._stale = True
+
+    def mark_stale(self):
+        """目录有变化，下次 get_data() 时 stat 所有文件"""
+        self._stale = True
+
+    # ===== 索引读写 =====
+
+    def _load_index(self):
+        data = load_json_file(self.index_file, None)
+        if (
+            isinstance(data, dict)
+            and data.get("version") == INDEX_VERSION
+            and data.get("example_dir") == self.example_dir
+        ):
+            self._dirs = data.get("dirs", {})
+            self._entries = data.get("entries", {})
+        self._loaded = True
+
+    def _save_index(self):
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        save_json_file(
+            self.index_file,
+            {
+                "version": INDEX_VERSION,
+                "example_dir": self.example_dir,
+                "dirs": self._dirs,
+                "entries": self._entries,
+            },
+        )
+
+    # ===== 扫描 =====
+
+    def _abs_path(self, rel_path):
+        if rel_path == ".":
+            return self.example_dir
+        return os.path.join(self.example_dir, *rel_path.split("/"))
+
+    @staticmethod
+    def _join(rel_dir, name):
+        return name if rel_dir == "." else f"{rel_dir}/{name}"
+
+    @staticmethod
+    def _list_dir(abs_dir, mtime):
+        """列出目录中的子目录、图片和图片的同名 JSON"""
+        subdirs = []
+        images = []
+        stems = set()
+        with os.scandir(abs_dir) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                        continue
+                except OSError:
+                    continue
+                stem, ext = os.path.splitext(entry.name)
+                ext = ext.lower()
+                if ext in IMAGE_EXTS:
+                    images.append(entry.name)
+                elif ext == SIDECAR_EXT:
+                    stems.add(stem)
+        sidecars = [name for name in images if os.path.splitext(name)[0] in stems]
+        return {
+            "mtime": mtime,
+            "subdirs": sorted(subdirs),
+            "images": sorted(images),
+            "sidecars": sorted(sidecars),
+        }
+
+    @staticmethod
+    def _stamp(image_path, json_path):
+        """图片和同名 JSON 的 [mtime_ns, size, json_mtime_ns, json_size]"""
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        stamp = [st.st_mtime_ns, st.st_size, 0, 0]
+        if json_path:
+            try:
+                json_st = os.stat(json_path)
+                stamp[2:] = [json_st.st_mtime_ns, json_st.st_size]
+            except OSError:
+                pass
+        return stamp
+
+    def _build_record(self, image_path, json_path, file, category):
+        """读取 metadata 生成列表记录，没有提示词时返回 None"""
+        metadata = read_reference_metadata(image_path, json_path)
+        prompt = metadata.get("prompt", "")
+        if not prompt:
+            return None
+
+        rel_path = os.path.relpath(image_path, self.comfyui_root)
+        record = {
+            "lora_name": metadata.get("lora_name") or file,
+            "category": category,
+            "image_url": "/prompt_manage/example/image?path="
+            + rel_path.replace("\\", "/"),
+            "prompt": prompt,
+            "negative_prompt": metadata.get("negative_prompt", ""),
+            "width": metadata.get("width", 0),
+            "height": metadata.get("height", 0),
+            "steps": metadata.get("steps", ""),
+            "sampler": metadata.get("sampler", ""),
+            "cfg_scale": metadata.get("cfg_scale", ""),
+            "seed": metadata.get("seed", ""),
+            "model": metadata.get("model", ""),
+        }
+        record["id"] = reference_id(record, os.path.getsize(image_path))
+        return record
+
+    def _scan_dirs(self):
+        """
+        只 stat 目录，mtime 变化的目录重新列出，返回是否有变化
+
+        重新列出的目录记入 _pending_dirs，其中的文件由 refresh() 处理
+        """
+        if not self._loaded:
+            self._load_index()
+
+        changed = False
+        seen_dirs = set()
+        stack = ["."]
+
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = self._abs_path(rel_dir)
+            try:
+                mtime = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+
+            info = self._dirs.get(rel_dir)
+            if info is None or info.get("mtime") != mtime:
+                try:
+                    info = self._list_dir(abs_dir, mtime)
+                except OSError as e:
+                    logger.warning(f"Error listing example directory {abs_dir}: {e}")
+                    continue
+                self._dirs[rel_dir] = info
+                self._pending_dirs.add(rel_dir)
+                changed = True
+            seen_dirs.add(rel_dir)
+            stack.extend(self._join(rel_dir, sub) for sub in reversed(info["subdirs"]))
+
+        for rel_dir in set(self._dirs) - seen_dirs:
+            del self._dirs[rel_dir]
+            self._pending_dirs.discard(rel_dir)
+            changed = True
+        return changed
+
+    def refresh(self, deep=False):
+        """
+        增量刷新索引，返回是否有变化
+
+        Args:
+            deep: 为 True 时 stat 所有已知文件（发现原地修改），
+                否则只 stat 目录，mtime 未变的目录整个跳过
+        """
+        changed = self._scan_dirs()
+        seen_entries = set()
+
+        for rel_dir, info in self._dirs.items():
+            dir_changed = rel_dir in self._pending_dirs
+            abs_dir = self._abs_path(rel_dir)
+            category = "root" if rel_dir == "." else rel_dir
+            sidecars = set(info["sidecars"])
+
+            for file in info["images"]:
+                rel_path = self._join(rel_dir, file)
+                entry = self._entries.get(rel_path)
+                if entry is not None and not dir_changed and not deep:
+                    seen_entries.add(rel_path)
+                    continue
+
+                image_path = os.path.join(abs_dir, file)
+                json_path = (
+                    os.path.splitext(image_path)[0] + SIDECAR_EXT
+                    if file in sidecars
+                    else None
+                )
+                stamp = self._stamp(image_path, json_path)
+                if stamp is None:
+                    continue
+                seen_entries.add(rel_path)
+                if entry is not None and entry["stamp"] == stamp:
+                    continue
+
+                try:
+                    record = self._build_record(image_path, json_path, file, category)
+                except Exception as e:
+                    # 记录为空，文件修改后再重新读取
+                    logger.warning(f"Error reading image {image_path}: {e}")
+                    record = None
+                self._set_entry(rel_path, {"stamp": stamp, "record": record})
+                changed = True
+        self._pending_dirs.clear()
+
+        for rel_path in set(self._entries) - seen_entries:
+            self._set_entry(rel_path, None)
+            changed = True
+
+        if changed:
+            self._dirty = True
+            self._result = None
+        return changed
+
+    def _set_entry(self, rel_path, entry):
+        """更新或删除（entry 为 None）一条记录，同步搜索索引"""
+        if entry is None:
+            del self._entries[rel_path]
+        else:
+            self._entries[rel_path] = entry
+        if self._search_ready:
+            if entry is not None and entry["record"] is not None:
+                self._search.add(rel_path, entry["record"])
+            else:
+                self._search.remove(rel_path)
+
+    def _ensure_search_index(self):
+        if not self._search_ready:
+            for rel_path, entry in self._entries.items():
+                if entry["record"] is not None:
+                    self._search.add(rel_path, entry["record"])
+            self._search_ready = True
+
+    def get_data(self):
+        """获取全部参考图记录，只重新读取有变化的文件"""
+        with self._lock:
+            if not os.path.exists(self.example_dir):
+                return {
+                    "categories": [],
+                    "references": [],
+                    "records": {},
+                    "facets": {},
+                    "mtimes": {},
+                    "ids": {},
+                }
+
+            try:
+                if self._stale or not self.watched:
+                    deep = self._stale
+                    self._stale = False
+                    self.refresh(deep)
+            except Exception as e:
+                logger.error(f"Error scanning for prompt reference: {e}")
+
+            if self._dirty:
+                self._save_index()
+                self._dirty = False
+
+            if self._result is None:
+                records = {
+                    key: self._entries[key]["record"]
+                    for key in sorted(self._entries)
+                    if self._entries[key]["record"] is not None
+                }
+                ids = self._assign_ids(records)
+                references = list(records.values())
+                self._result = {
+                    "categories": sorted({ref["category"] for ref in references}),
+                    "references": references,
+                    "records": records,
+                    # 分面取值和图片 mtime（按添加时间排序）
+                    "facets": {
+                        key: facet_values(record) for key, record in records.items()
+                    },
+                    "mtimes": {key: self._entries[key]["stamp"][0] for key in records},
+                    # id -> 记录 key
+                    "ids": ids,
+                }
+            return self._result
+
+    def _assign_ids(self, records):
+        """
+        区分 id 相同的记录（内容完全相同的副本），返回 {id: 记录 key}
+
+        最早的一张（图片 mtime 最小，相同时按路径）保留原 id，其余的记录替换为
+        加了路径后缀的副本，不修改索引中保存的记录
+        """
+        groups = {}
+        for key, record in records.items():
+            groups.setdefault(record["id"], []).append(key)
+
+        ids = {}
+        for ref_id, keys in groups.items():
+            if len(keys) > 1:
+                keys.sort(key=lambda key: (self._entries[key]["stamp"][0], key))
+                for key in keys[1:]:
+                    suffix = hashlib.sha1(key.encode("utf-8")).hexdigest()[:6]
+                    unique_id = f"{ref_id}-{suffix}"
+                    records[key] = dict(records[key], id=unique_id)
+                    ids[unique_id] = key
+            ids[ref_id] = keys[0]
+        return ids
+
+    def categories(self):
+        """
+        类别名称和每个类别的参考图数量，只 stat 和列出目录，不打开图片和 JSON
+
+        已读取过的图片按是否有提示词计数，还没有读取的图片按目录列表计数
+
+        Returns:
+            [{"name": 类别, "count": 数量}]
+        """
+        with self._lock:
+            if not os.path.exists(self.example_dir):
+                return []
+            try:
+                if self._stale or not self.watched:
+                    self._scan_dirs()
+            except Exception as e:
+                logger.error(f"Error scanning example directories: {e}")
+
+            categories = []
+            for rel_dir, info in self._dirs.items():
+                count = 0
+                for file in info["images"]:
+                    entry = self._entries.get(self._join(rel_dir, file))
+                    if entry is None or entry["record"] is not None:
+                        count += 1
+                if count:
+                    name = "root" if rel_dir == "." else rel_dir
+                    categories.append({"name": name, "count": count})
+            categories.sort(key=lambda c: c["name"])
+            return categories
+
+    def _cache_get(self, data, name, key):
+        """
+        读取随 get_data() 结果缓存的搜索或查询结果，没有时返回 None
+
+        最近的结果缓存在 get_data() 的结果中，翻页时不再重新计算，记录变化后失效
+        """
+        with self._cache_lock:
+            cache = data.get(name)
+            if cache is None or key not in cache:
+                return None
+            cache.move_to_end(key)
+            return cache[key]
+
+    def _cache_put(self, data, name, key, value):
+        """保存结果，每种最多保留 SEARCH_CACHE_SIZE 个最近使用的"""
+        with self._cache_lock:
+            cache = data.setdefault(name, OrderedDict())
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > SEARCH_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    def _search_keys(self, data, search):
+        """按匹配质量排序的搜索结果（记录 key 列表）"""
+        keys = self._cache_get(data, "searches", search)
+        if keys is None:
+            with self._lock:
+                self._ensure_search_index()
+                hits = self._search.search_query(
+                    search,
+                    REFERENCE_FIELD_ALIASES,
+                    prefix_only_fields=REFERENCE_PREFIX_ONLY_FIELDS,
+                )
+            records = data["records"]
+            keys = [key for key, _ in hits if key in records]
+            self._cache_put(data, "searches", search, keys)
+        return keys
+
+    @staticmethod
+    def _facet_list(counts, selected):
+        """取值按数量从多到少排列，最多 FACET_VALUE_LIMIT 个，已选中的取值总会保留"""
+        values = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        shown = values[:FACET_VALUE_LIMIT]
+        shown_values = {value for value, _ in shown}
+        shown.extend(
+            (value, counts.get(value, 0))
+            for value in sorted(selected)
+            if value not in shown_values
+        )
+        return [{"value": value, "count": count} for value, count in shown]
+
+    def _select(self, data, category, search, filters, sort):
+        """
+        筛选、排序并统计分面，结果随 get_data() 的结果按查询条件缓存
+
+        同一分面内的多个取值为"或"，不同分面之间为"与"。每个分面的数量按除该分面
+        以外的其它条件统计，选中一个取值后同一分面的其它取值仍显示可选数量。
+
+        Returns:
+            (记录 key 列表, {分面: [{"value", "count"}]})
+        """
+        cache_key = (
+            category,
+            search,
+            tuple(sorted((field, tuple(sorted(v))) for field, v in filters.items())),
+            sort,
+        )
+        cached = self._cache_get(data, "queries", cache_key)
+        if cached is not None:
+            return cached
+
+        records = data["records"]
+        keys = self._search_keys(data, search) if search else list(records)
+        if category:
+            keys = [key for key in keys if records[key]["category"] == category]
+
+        facets = data["facets"]
+        counts = {field: {} for field in FACET_FIELDS}
+        selected = []
+        for key in keys:
+            values = facets[key]
+            missed = [
+                field
+                for field, allowed in filters.items()
+                if values.get(field) not in allowed
+            ]
+            if not missed:
+                selected.append(key)
+                fields = values
+            elif len(missed) == 1 and missed[0] in values:
+                # 只有一个分面不满足：只计入该分面的数量
+                fields = missed
+            else:
+                continue
+            for field in fields:
+                field_counts = counts[field]
+                value = values[field]
+                field_counts[value] = field_counts.get(value, 0) + 1
+
+        if sort == "date":
+            mtimes = data["mtimes"]
+            selected.sort(key=lambda key: mtimes[key], reverse=True)
+        elif sort == "resolution":
+            selected.sort(
+                key=lambda key: _to_int(records[key]["width"])
+                * _to_int(records[key]["height"]),
+                reverse=True,
+            )
+        elif sort == "name":
+            selected.sort(key=lambda key: str(records[key]["lora_name"]).casefold())
+
+        result = (
+            selected,
+            {
+                field: self._facet_list(counts[field], filters.get(field, ()))
+                for field in FACET_FIELDS
+            },
+        )
+        self._cache_put(data, "queries", cache_key, result)
+        return result
+
+    def query(
+        self, category=None, search=None, offset=0, limit=200, filters=None, sort=None
+    ):
+        """
+        筛选、排序并分页
+
+        Args:
+            category: 类别（子目录），None 表示全部
+            search: 搜索查询（见 InvertedIndex.search_query），有搜索时按匹配质量排序
+            offset: 偏移量
+            limit: 返回数量，0 表示只返回类别、分面和总数
+            filters: 分面筛选 {分面: [取值]}，分面见 FACET_FIELDS
+            sort: 排序方式（见 SORT_KEYS），None 表示按路径（有搜索时按匹配质量）
+
+        Returns:
+            {"categories", "references", "facets", "total", "offset", "limit", "has_more"}
+            categories 始终基于全部参考图
+        """
+        data = self.get_data()
+        filters = {
+            field: set(values)
+            for field, values in (filters or {}).items()
+            if field in FACET_FIELDS and values
+        }
+        if sort not in SORT_KEYS:
+            sort = None
+        keys, facets = self._select(data, category, search, filters, sort)
+
+        records = data["records"]
+        total = len(keys)
+        end = min(offset + max(limit, 0), total)
+        return {
+            "categories": data["categories"],
+            "references": [records[key] for key in keys[offset:end]],
+            "facets": facets,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "has_more": end < total,
+        }
+
+    def get_by_ids(self, ids):
+        """
+        按 id 批量查找记录，每个 id 为一次字典查找
+
+        Returns:
+            {"references": 按请求顺序排列的记录, "missing": 找不到的 id}
+        """
+        data = self.get_data()
+        records = data["records"]
+        references = []
+        missing = []
+        for ref_id in dict.fromkeys(ids):
+            key = data["ids"].get(ref_id)
+            if key is None:
+                missing.append(ref_id)
+            else:
+                references.append(records[key])
+        return {"references": references, "missing": missing}
@@ -0,0 +1,433 @@
+"""
+倒排索引 - 提示词库与参考图共用的内存搜索索引
+
+- 分词：英文/数字按单词切分，中日韩文字按单字切分，全部转为小写
+- exact 模式：整个查询串必须作为子串出现（与前端原有的 includes 语义一致），
+  先用倒排表和三元组表缩小候选集，再逐条校验
+- fuzzy 模式：每个查询词都要命中（AND），允许前缀、子串和拼写错误
+  （三元组相似度 / 编辑距离），按命中质量和字段权重排序
+- 查询语法（search_query）：在 fuzzy 的基础上支持 -词 排除和 字段:词 限定字段，
+  可以指定只在写了字段前缀时才匹配的字段（如参考图的反向提示词）
+
+不依赖插件内其他模块，独立脚本（prompt_reader）也可以直接导入
+"""
+
+import re
+from collections import defaultdict
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 英文单词 / 数字 或 单个中日韩字符
+TOKEN_RE = re.compile(r"[0-9a-z_]+|[぀-ヿ㐀-鿿豈-﫿]")
+
+# 模糊匹配时词的最低相似度
+FUZZY_MIN_SIMILARITY = 0.3
+
+# 参考图搜索的字段和权重
+REFERENCE_FIELD_WEIGHTS = {
+    "lora_name": 3.0,
+    "prompt": 2.0,
+    "model": 1.5,
+    "sampler": 1.0,
+    "negative_prompt": 0.5,
+}
+# 查询中的字段前缀，例如 "sampler:euler"、"-neg:blurry"
+REFERENCE_FIELD_ALIASES = {
+    "lora": "lora_name",
+    "lora_name": "lora_name",
+    "prompt": "prompt",
+    "model": "model",
+    "sampler": "sampler",
+    "neg": "negative_prompt",
+    "negative": "negative_prompt",
+    "negative_prompt": "negative_prompt",
+}
+# 只在写了字段前缀时才匹配的字段：大多数示例图的反向提示词都有 nsfw、blurry 等词，
+# 不加前缀的 "-nsfw" 应该排除正向提示词中的 nsfw，而不是排除这些图片
+REFERENCE_PREFIX_ONLY_FIELDS = ("negative_prompt",)
+
+
+def tokenize(text) -> List[str]:
+    """切分为小写词列表"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def parse_query(
+    query: str, field_aliases: Dict[str, str]
+) -> List[Tuple[bool, Optional[str], str]]:
+    """
+    解析查询语法：空格分隔，-词 表示排除，字段:词 只在该字段中匹配
+
+    Args:
+        query: 查询串，例如 "girl -nsfw sampler:euler"
+        field_aliases: {前缀: 字段名}，不在其中的前缀按普通文本处理
+
+    Returns:
+        [(是否排除, 字段名或 None, 词)]
+    """
+    terms = []
+    for part in query.split():
+        exclude = part.startswith("-") and len(part) > 1
+        if exclude:
+            part = part[1:]
+        field = None
+        prefix, sep, rest = part.partition(":")
+        if sep and prefix.lower() in field_aliases:
+            field = field_aliases[prefix.lower()]
+            part = rest
+        for token in tokenize(part):
+            terms.append((exclude, field, token))
+    return terms
+
+
+def trigrams(token: str) -> set:
+    """词的三元组（两端补空格，短词也能产生三元组）"""
+    padded = f" {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """带上限的编辑距离，超过 limit 时提前返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            value = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)
+            )
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class InvertedIndex:
+    """按字段加权的倒排索引"""
+
+    def __init__(self, field_weights: Dict[str, float]):
+        """
+        Args:
+            field_weights: {字段名: 权重}，只索引这些字段
+        """
+        self.field_weights = field_weights
+        # token -> {doc_id: 权重}
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        # 三元组 -> 词表中的 token
+        self._trigrams: Dict[str, set] = defaultdict(set)
+        # doc_id -> {字段: 该字段的 token 集合}（删除和限定字段查询时使用）
+        self._doc_fields: Dict[str, Dict[str, Set[str]]] = {}
+        # doc_id -> 各字段小写文本（exact 模式校验子串）
+        self._doc_text: Dict[str, Dict[str, str]] = {}
+
+    def __len__(self):
+        return len(self._doc_fields)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_fields
+
+    def clear(self):
+        self._postings.clear()
+        self._trigrams.clear()
+        self._doc_fields.clear()
+        self._doc_text.clear()
+
+    def add(self, doc_id: str, fields: Dict[str, object]):
+        """添加或替换一个文档"""
+        if doc_id in self._doc_fields:
+            self.remove(doc_id)
+
+        weights: Dict[str, float] = defaultdict(float)
+        texts = {}
+        field_tokens = {}
+        for field, weight in self.field_weights.items():
+            value = fields.get(field)
+            if not value:
+                continue
+            text = str(value).lower()
+            texts[field] = text
+            field_tokens[field] = set(TOKEN_RE.findall(text))
+            for token in field_tokens[field]:
+                weights[token] += weight
+
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if not postings:
+                for gram in trigrams(token):
+                    self._trigrams[gram].add(token)
+            postings[doc_id] = weight
+
+        self._doc_fields[doc_id] = field_tokens
+        self._doc_text[doc_id] = texts
+
+    def remove(self, doc_id: str):
+        """删除一个文档"""
+        field_tokens = self._doc_fields.pop(doc_id, None)
+        self._doc_text.pop(doc_id, None)
+        if not field_tokens:
+            return
+        for token in set().union(*field_tokens.values()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[token]
+                for gram in trigrams(token):
+                    grams = self._trigrams.get(gram)
+                    if grams is not None:
+                        grams.discard(token)
+                        if not grams:
+                            del self._trigrams[gram]
+
+    # ===== 词表匹配 =====
+
+    def _vocab_containing(self, fragment: str) -> Iterable[str]:
+        """词表中包含 fragment 的所有 token"""
+        if len(fragment) >= 3:
+            token_sets = []
+            for i in range(len(fragment) - 2):
+                tokens = self._trigrams.get(fragment[i : i + 3])
+                if not tokens:
+                    return []
+                token_sets.append(tokens)
+            # 从最小的集合开始求交集
+            token_sets.sort(key=len)
+            candidates = set(token_sets[0])
+            for tokens in token_sets[1:]:
+                candidates &= tokens
+                if not candidates:
+                    return []
+            return [t for t in candidates if fragment in t]
+        return [t for t in self._postings if fragment in t]
+
+    def _fuzzy_vocab(
+        self, term: str, typo_fallback: bool = False
+    ) -> List[Tuple[str, float]]:
+        """
+        模糊匹配词表，返回 [(token, 匹配质量 0~1)]
+
+        Args:
+            typo_fallback: 为 True 时只在没有完整、前缀和子串匹配时才查找拼写错误
+        """
+        matches: Dict[str, float] = {}
+        if term in self._postings:
+            matches[term] = 1.0
+
+        # 前缀 / 子串
+        for token in self._vocab_containing(term):
+            if token == term:
+                continue
+            quality = 0.8 if token.startswith(term) else 0.6
+            matches[token] = max(matches.get(token, 0), quality)
+
+        # 拼写错误：三元组相似度 + 编辑距离
+        if len(term) >= 3 and not (typo_fallback and matches):
+            term_grams = trigrams(term)
+            counts: Dict[str, int] = defaultdict(int)
+            for gram in term_grams:
+                for token in self._trigrams.get(gram, ()):
+                    counts[token] += 1
+            limit = 1 if len(term) <= 5 else 2
+            for token, shared in counts.items():
+                if token in matches:
+                    continue
+                similarity = shared / len(term_grams | trigrams(token))
+                if similarity < FUZZY_MIN_SIMILARITY:
+                    continue
+                if edit_distance(term, token, limit) <= limit:
+                    matches[token] = 0.5 * similarity + 0.2
+        return list(matches.items())
+
+    # ===== 查询 =====
+
+    def search(
+        self,
+        query: str,
+        mode: str = "fuzzy",
+        candidates: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        搜索文档
+
+        Args:
+            query: 查询串
+            mode: "fuzzy" 或 "exact"
+            candidates: 限定在这些 doc_id 中搜索（已按其他条件筛选时使用）
+
+        Returns:
+            [(doc_id, score)]，按 score 降序
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        allowed = set(candidates) if candidates is not None else None
+
+        if mode == "exact":
+            return self._search_exact(query.lower().strip(), terms, allowed)
+        return self._search_fuzzy(terms, allowed)
+
+    def _search_exact(self, phrase, terms, allowed):
+        docs = None
+        for term in terms:
+            matched = set()
+            for token in self._vocab_containing(term):
+                matched.update(self._postings[token])
+            docs = matched if docs is None else docs & matched
+            if not docs:
+                return []
+        if allowed is not None:
+            docs &= allowed
+
+        results = []
+        for doc_id in docs:
+            score = 0.0
+            for field, text in self._doc_text[doc_id].items():
+                if phrase in text:
+                    weight = self.field_weights[field]
+                    # 整个字段完全相同 / 以查询开头的排在前面
+                    if text == phrase:
+                        weight *= 3
+                    elif text.startswith(phrase):
+                        weight *= 2
+                    score += weight
+            if score > 0:
+                results.append((doc_id, score))
+        results.sort(key=lambda r: -r[1])
+        return results
+
+    def _search_fuzzy(self, terms, allowed):
+        scores = self._score_terms([(None, term) for term in terms], allowed)
+        results = list(scores.items())
+        results.sort(key=lambda r: -r[1])
+        return results
+
+    def _unqualified_weight(self, doc_id, token, weight, skip_fields) -> float:
+        """不限定字段的词在文档中的权重，去掉 skip_fields 中的字段"""
+        doc_fields = self._doc_fields[doc_id]
+        for field in skip_fields:
+            if token in doc_fields.get(field, ()):
+                weight -= self.field_weights[field]
+        return weight if weight > 1e-9 else 0.0
+
+    def _score_terms(
+        self, terms, allowed, typo_fallback=False, skip_fields=()
+    ) -> Dict[str, float]:
+        """
+        每个 (字段, 词) 都要命中（AND），返回 {doc_id: 分数}
+
+        先处理命中文档最少的词，之后的词只在已有的候选中查找；
+        不限定字段的词不在 skip_fields 中匹配
+        """
+        matched_terms = []
+        for field, term in dict.fromkeys(terms):
+            vocab = self._fuzzy_vocab(term, typo_fallback)
+            if not vocab:
+                return {}
+            size = sum(len(self._postings[token]) for token, _ in vocab)
+            matched_terms.append((size, field, vocab))
+        matched_terms.sort(key=lambda t: t[0])
+
+        scores = None
+        for _, field, vocab in matched_terms:
+            term_scores: Dict[str, float] = {}
+            for token, quality in vocab:
+                postings = self._postings[token]
+                if scores is not None and len(scores) < len(postings):
+                    docs = [(d, postings[d]) for d in scores if d in postings]
+                else:
+                    docs = postings.items()
+                if allowed is not None:
+                    docs = [(d, w) for d, w in docs if d in allowed]
+                if field is not None:
+                    weight = self.field_weights[field]
+                    docs = [
+                        (d, weight)
+                        for d, _ in docs
+                        if token in self._doc_fields[d].get(field, ())
+                    ]
+                elif skip_fields:
+                    docs = [
+                        (d, self._unqualified_weight(d, token, w, skip_fields))
+                        for d, w in docs
+                    ]
+                    docs = [(d, w) for d, w in docs if w]
+                token_scores = {d: quality * w for d, w in docs}
+                if not term_scores:
+                    term_scores = token_scores
+                    continue
+                for doc_id, value in token_scores.items():
+                    if value > term_scores.get(doc_id, 0):
+                        term_scores[doc_id] = value
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc_id: score + term_scores[doc_id]
+                    for doc_id, score in scores.items()
+                    if doc_id in term_scores
+                }
+            if not scores:
+                return {}
+        return scores or {}
+
+    def search_query(
+        self,
+        query: str,
+        field_aliases: Optional[Dict[str, str]] = None,
+        candidates: Optional[Iterable[str]] = None,
+        prefix_only_fields: Iterable[str] = (),
+    ) -> List[Tuple[str, float]]:
+        """
+        按查询语法搜索（见 parse_query）
+
+        普通词和限定字段的词按 fuzzy 模式匹配（有完整或前缀匹配时不再查找拼写错误），
+        都要命中；排除词按完整的词匹配。只有排除词时返回其余所有文档（分数为 0）。
+
+        Args:
+            query: 查询串
+            field_aliases: {前缀: 字段名}
+            candidates: 限定在这些 doc_id 中搜索
+            prefix_only_fields: 只在写了字段前缀时才匹配的字段，
+                不加前缀的词（包括排除词）不在这些字段中匹配
+
+        Returns:
+            [(doc_id, score)]，按 score 降序，分数相同时按 doc_id 排序
+        """
+        terms = parse_query(query, field_aliases or {})
+        if not terms:
+            return []
+        allowed = set(candidates) if candidates is not None else None
+        include = [(field, term) for exclude, field, term in terms if not exclude]
+
+        skip_fields = tuple(prefix_only_fields)
+        excluded = set()
+        for exclude, field, term in terms:
+            if not exclude:
+                continue
+            for doc_id, weight in self._postings.get(term, {}).items():
+                if field is not None:
+                    if term in self._doc_fields[doc_id].get(field, ()):
+                        excluded.add(doc_id)
+                elif self._unqualified_weight(doc_id, term, weight, skip_fields):
+                    excluded.add(doc_id)
+
+        if not include:
+            docs = allowed if allowed is not None else self._doc_fields
+            return [(doc_id, 0.0) for doc_id in sorted(docs) if doc_id not in excluded]
+
+        scores = self._score_terms(
+            include, allowed, typo_fallback=True, skip_fields=skip_fields
+        )
+        if excluded:
+            scores = {d: v for d, v in scores.items() if d not in excluded}
+        # 先按 doc_id 排序，再按分数稳定排序
+        results = sorted(scores.items())
+        results.sort(key=itemgetter(1), reverse=True)
+        return results
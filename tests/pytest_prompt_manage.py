@@ -0,0 +1,27 @@
+"""
+测试用的 pytest 插件（在 pyproject.toml 中通过 -p 加载）
+
+插件的 __init__.py 依赖 ComfyUI 的 server 模块，测试时不执行它：
+- 插件目录按普通目录收集，pytest 不会把它当作包导入
+- 插件目录注册为 prompt_manage 包，测试直接导入各个子模块，如 prompt_manage.search_index
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "prompt_manage"
+
+if PACKAGE not in sys.modules:
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [PLUGIN_DIR]
+    sys.modules[PACKAGE] = package
+
+
+def pytest_collect_directory(path, parent):
+    if str(path) == PLUGIN_DIR:
+        return pytest.Dir.from_parent(parent, path=path)
+    return None
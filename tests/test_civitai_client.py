@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from prompt_manage.downloadScripts.civitai_client import CivitaiClient, TokenBucket
+from prompt_manage.downloadScripts.response_cache import ResponseCache
+from prompt_manage.downloadScripts.retry_policy import MAX_RETRY_AFTER
+
+KNOWN = {"a" * 64: 1, "b" * 64: 2}
+MISSING = "c" * 64
+
+
+def version(model_hash):
+    return {
+        "id": KNOWN[model_hash],
+        "files": [{"hashes": {"SHA256": model_hash.upper()}}],
+    }
+
+
+class StubCivitai:
+    """本地的 CivitAI API 替身，bulk 为批量接口的行为："ok"、"object" 或 HTTP 状态码"""
+
+    def __init__(self, bulk="ok", retry_after=None):
+        self.bulk = bulk
+        self.retry_after = retry_after
+        self.requests = []
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/model-versions/by-hash", self.by_hashes)
+        app.router.add_get("/model-versions/by-hash/{hash}", self.by_hash)
+        return app
+
+    async def by_hashes(self, request):
+        hashes = await request.json()
+        self.requests.append(("POST", len(hashes)))
+        if self.bulk == "ok":
+            return web.json_response([version(h) for h in hashes if h in KNOWN])
+        if self.bulk == "object":
+            return web.json_response({"error": "Internal error"})
+        return web.json_response({"error": "unavailable"}, status=self.bulk)
+
+    async def by_hash(self, request):
+        model_hash = request.match_info["hash"]
+        self.requests.append(("GET", model_hash))
+        if self.retry_after is not None:
+            return web.json_response(
+                {"error": "Too many requests"},
+                status=429,
+                headers={"Retry-After": self.retry_after},
+            )
+        if model_hash in KNOWN:
+            return web.json_response(version(model_hash))
+        return web.json_response({"error": "Model not found"}, status=404)
+
+
+def lookup(tmp_path, stub, hash_batches, method="get_models_by_hashes"):
+    """启动替身服务，依次用 method 查询每组 hash，返回每次的结果和客户端"""
+
+    async def run():
+        runner = web.AppRunner(stub.app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        client = CivitaiClient()
+        client.base_url = f"http://127.0.0.1:{port}"
+        client.rate_limiter = TokenBucket(1000, 1000)
+        client.response_cache = ResponseCache(str(tmp_path), 3600, 3600)
+        try:
+            query = getattr(client, method)
+            results = [await query(h) for h in hash_batches]
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return results, client
+
+    return asyncio.run(run())
+
+
+def test_bulk_lookup_found_and_missing_are_cached(tmp_path):
+    stub = StubCivitai()
+    hashes = ["A" * 64, "b" * 64, MISSING]
+    (first, second), client = lookup(tmp_path, stub, [hashes, hashes])
+
+    assert first["a" * 64] == (version("a" * 64), None)
+    assert first["b" * 64][0]["id"] == 2
+    assert first[MISSING][0] is None
+    assert second == first
+    # 一个批量请求，第二次全部来自响应缓存
+    assert stub.requests == [("POST", 3)]
+    assert client.bulk_lookup_supported
+
+
+def test_non_list_body_falls_back_to_single_lookups(tmp_path):
+    stub = StubCivitai(bulk="object")
+    (result,), client = lookup(tmp_path, stub, [["a" * 64, MISSING]])
+
+    assert result["a" * 64][0]["id"] == 1
+    assert result[MISSING][0] is None
+    assert sorted(r[0] for r in stub.requests) == ["GET", "GET", "POST"]
+    assert client.bulk_lookup_supported
+
+
+def test_missing_endpoint_disables_bulk_lookup(tmp_path):
+    stub = StubCivitai(bulk=404)
+    (first, second), client = lookup(
+        tmp_path, stub, [["a" * 64, MISSING], ["b" * 64, "d" * 64]]
+    )
+
+    assert first["a" * 64][0]["id"] == 1
+    assert second["b" * 64][0]["id"] == 2
+    assert not client.bulk_lookup_supported
+    assert [r[0] for r in stub.requests].count("POST") == 1
+
+
+def test_bad_request_only_falls_back_for_that_batch(tmp_path):
+    stub = StubCivitai(bulk=400)
+    (result,), client = lookup(tmp_path, stub, [["a" * 64, MISSING]])
+
+    assert result["a" * 64][0]["id"] == 1
+    assert client.bulk_lookup_supported
+
+
+def test_long_retry_after_is_not_waited_for(tmp_path):
+    stub = StubCivitai(retry_after="3600")
+    start = time.monotonic()
+    (result,), client = lookup(tmp_path, stub, ["a" * 64], "get_model_by_hash")
+
+    assert result == (None, "API错误: HTTP 429")
+    assert stub.requests == [("GET", "a" * 64)]
+    assert time.monotonic() - start < 5
+    # 其它请求最多暂停 MAX_RETRY_AFTER 秒
+    paused = client.rate_limiter._paused_until - time.monotonic()
+    assert 0 < paused <= MAX_RETRY_AFTER
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from prompt_manage.downloadScripts.example_downloader import (
+    DownloadError,
+    ExampleDownloader,
+)
+from prompt_manage.downloadScripts.retry_policy import MAX_RETRY_AFTER, retry_delay
+
+
+def test_retry_delay_caps_retry_after():
+    assert retry_delay({"Retry-After": "5"}, 0, 1.0) == 5
+    assert retry_delay({"Retry-After": str(int(MAX_RETRY_AFTER) + 1)}, 0, 1.0) is None
+    assert retry_delay({}, 2, 1.0) == 4
+    assert retry_delay(None, 0, 0.5) == 0.5
+
+
+async def serve(retry_after, status=429):
+    """启动一个总是返回 status 和 Retry-After 的本地服务，返回 (runner, url)"""
+
+    async def handler(request):
+        return web.Response(status=status, headers={"Retry-After": retry_after})
+
+    app = web.Application()
+    app.router.add_get("/image.png", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/image.png"
+
+
+def test_long_retry_after_fails_the_item():
+    async def run():
+        runner, url = await serve("3600")
+        done = []
+        try:
+            await ExampleDownloader().run(
+                [{"url": url}], lambda item, content: None, lambda *a: done.append(a)
+            )
+        finally:
+            await runner.cleanup()
+        return done
+
+    start = time.monotonic()
+    [(item, error)] = asyncio.run(asyncio.wait_for(run(), 10))
+    assert "HTTP 429" in error
+    assert time.monotonic() - start < 5
+
+
+def test_cancel_stops_waiting_for_retry():
+    async def run():
+        runner, url = await serve("30", status=503)
+        cancelled = False
+        done = []
+
+        async def cancel_soon():
+            nonlocal cancelled
+            await asyncio.sleep(0.2)
+            cancelled = True
+
+        try:
+            await asyncio.gather(
+                ExampleDownloader().run(
+                    [{"url": url}],
+                    lambda item, content: None,
+                    lambda *a: done.append(a),
+                    lambda: cancelled,
+                ),
+                cancel_soon(),
+            )
+        finally:
+            await runner.cleanup()
+        return done
+
+    start = time.monotonic()
+    # 等待重试时被取消的条目不算完成
+    assert asyncio.run(asyncio.wait_for(run(), 10)) == []
+    assert time.monotonic() - start < 5
+
+
+def test_fetch_raises_after_retries():
+    async def run():
+        runner, url = await serve("0", status=500)
+        try:
+            async with aiohttp.ClientSession() as session:
+                await ExampleDownloader(retries=1).fetch(session, url)
+        finally:
+            await runner.cleanup()
+
+    with pytest.raises(DownloadError, match="HTTP 500"):
+        asyncio.run(run())
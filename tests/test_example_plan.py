@@ -0,0 +1,81 @@
+import io
+import json
+import os
+
+from PIL import Image
+
+from prompt_manage.downloadScripts.download_manifest import (
+    DONE,
+    DOWNLOADING,
+    FAILED,
+    DownloadManifest,
+    save_item_atomically,
+)
+from prompt_manage.downloadScripts.example_plan import plan_manifest_items
+
+
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def write_lora_metadata(lora_dir, name, count):
+    """写入一个 Lora 的 .metadata.json，包含 count 张带提示词的示例图"""
+    images = [
+        {"url": f"https://example.com/{name}/{i}.jpeg", "meta": {"prompt": f"p{i}"}}
+        for i in range(count)
+    ]
+    path = os.path.join(lora_dir, f"{name}.metadata.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"model_name": name, "civitai": {"images": images}}, f)
+
+
+def test_save_item_atomically_uses_actual_format(tmp_path):
+    item = {
+        "save_path": str(tmp_path / "style" / "lora_0.png"),
+        "metadata": {"prompt": "1girl"},
+    }
+    saved = save_item_atomically(item, jpeg_bytes())
+
+    assert saved == str(tmp_path / "style" / "lora_0.jpg")
+    assert item["file"] == saved
+    assert sorted(os.listdir(tmp_path / "style")) == ["lora_0.jpg", "lora_0.json"]
+    with open(tmp_path / "style" / "lora_0.json", encoding="utf-8") as f:
+        assert json.load(f)["prompt"] == "1girl"
+
+
+def test_plan_manifest_items_skips_done_and_existing_files(tmp_path):
+    lora_dir = str(tmp_path / "loras")
+    output_dir = str(tmp_path / "out")
+    os.makedirs(lora_dir)
+    write_lora_metadata(lora_dir, "lora", 3)
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")
+    manifest = DownloadManifest(manifest_path).load()
+
+    items, total, skipped = plan_manifest_items(manifest, lora_dir, output_dir)
+    assert (len(items), total, skipped) == (3, 3, 0)
+
+    # 第一张完成，第二张失败，第三张在清单之外已经下载过
+    manifest.mark(items[0]["save_path"], DOWNLOADING)
+    save_item_atomically(items[0], jpeg_bytes())
+    manifest.mark(items[0]["save_path"], DONE, file=items[0]["file"])
+    manifest.mark(items[1]["save_path"], DOWNLOADING)
+    manifest.mark(items[1]["save_path"], FAILED, "HTTP 500")
+    manifest.close()
+    manifest = DownloadManifest(manifest_path).load()
+    save_item_atomically(dict(items[2]), jpeg_bytes())
+
+    replanned, total, skipped = plan_manifest_items(manifest, lora_dir, output_dir)
+    assert [item["save_path"] for item in replanned] == [items[1]["save_path"]]
+    assert (total, skipped) == (3, 2)
+    assert manifest.get(items[2]["save_path"])["state"] == DONE
+
+    # 继续时只取清单中未完成的条目，不重新扫描
+    os.remove(os.path.join(lora_dir, "lora.metadata.json"))
+    resumed, total, skipped = plan_manifest_items(
+        manifest, lora_dir, output_dir, resume=True
+    )
+    assert [item["save_path"] for item in resumed] == [items[1]["save_path"]]
+    assert (total, skipped) == (3, 2)
+    manifest.close()
@@ -0,0 +1,44 @@
+import io
+
+from PIL import Image
+
+from prompt_manage.downloadScripts.image_metadata import (
+    _png_chunk,
+    embed_metadata,
+    insert_png_text,
+    read_metadata_bytes,
+)
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_png_round_trips_non_ascii_values():
+    metadata = {
+        "ascii": "1girl, beach",
+        "latin1": "Ã©",
+        "cjk": "一个女孩，海滩",
+    }
+    data, fmt = embed_metadata(png_bytes(), metadata)
+    assert fmt == "png"
+    assert read_metadata_bytes(data) == metadata
+    # 写入的仍是合法 PNG
+    assert Image.open(io.BytesIO(data)).size == (4, 4)
+
+
+def test_legacy_mojibake_text_chunk_is_repaired():
+    data = png_bytes()
+    # 旧版本把 UTF-8 字节按 Latin-1 写进 tEXt
+    legacy = _png_chunk(b"tEXt", b"prompt\x00" + "女孩".encode("utf-8"))
+    end = data.index(b"IDAT") - 4
+    data = data[:end] + legacy + data[end:]
+    assert read_metadata_bytes(data)["prompt"] == "女孩"
+
+
+def test_existing_text_chunks_are_replaced():
+    data = insert_png_text(png_bytes(), {"prompt": "old", "seed": "1"})
+    data = insert_png_text(data, {"prompt": "new"})
+    assert read_metadata_bytes(data) == {"prompt": "new", "seed": "1"}
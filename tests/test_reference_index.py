@@ -0,0 +1,259 @@
+import json
+import os
+import shutil
+import sys
+import threading
+
+import pytest
+from PIL import Image
+
+from prompt_manage import reference_index
+from prompt_manage.reference_index import ReferenceIndex
+
+
+def write_reference(example_dir, rel_path, **metadata):
+    """写入一张示例图和同名 JSON"""
+    image_path = os.path.join(example_dir, rel_path)
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    Image.new("RGB", (8, 8)).save(image_path)
+    metadata.setdefault("prompt", f"prompt of {rel_path}")
+    json_path = os.path.splitext(image_path)[0] + ".json"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+    return image_path
+
+
+@pytest.fixture
+def example_dir(tmp_path):
+    path = tmp_path / "ComfyUI" / "custom_nodes" / "pm" / "prompt_example"
+    path.mkdir(parents=True)
+    return str(path)
+
+
+def make_index(example_dir):
+    comfyui_root = os.path.dirname(os.path.dirname(os.path.dirname(example_dir)))
+    index_file = os.path.join(os.path.dirname(example_dir), "reference_index.json")
+    return ReferenceIndex(example_dir, comfyui_root, index_file)
+
+
+def test_concurrent_queries_share_result_caches(example_dir):
+    for i in range(40):
+        write_reference(
+            example_dir, f"c{i % 4}/img{i}.png", lora_name=f"L{i}x", sampler=f"s{i % 3}"
+        )
+    index = make_index(example_dir)
+    index.get_data()
+    errors = []
+
+    def run(worker):
+        try:
+            for i in range(600):
+                # 不同的查询条件远多于缓存容量，缓存会不断淘汰
+                n = (worker * 7 + i) % 40
+                result = index.query(
+                    category=f"c{n % 4}",
+                    search=f"l{n}x",
+                    filters={"sampler": [f"s{n % 3}"]},
+                    limit=5,
+                )
+                assert result["total"] == 1
+        except Exception as e:
+            errors.append(e)
+
+    # 频繁切换线程，让竞争更容易出现
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=run, args=(w,)) for w in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+
+
+def test_identical_copies_get_distinct_ids(example_dir):
+    params = dict(prompt="1girl, beach", lora_name="L", seed=1, steps=20)
+    original = write_reference(example_dir, "b/original.png", **params)
+    os.utime(original, ns=(1, 1))
+    write_reference(example_dir, "a/copy.png", **params)
+    index = make_index(example_dir)
+
+    references = index.query()["references"]
+    ids = [ref["id"] for ref in references]
+    assert len(set(ids)) == 2
+    by_id = {ref["id"]: ref for ref in references}
+    for ref_id in ids:
+        [found] = index.get_by_ids([ref_id])["references"]
+        assert found is by_id[ref_id]
+
+    # 最早的一张保留不带后缀的 id
+    [original_ref] = [ref for ref in references if ref["category"] == "b"]
+    assert "-" not in original_ref["id"]
+
+
+def count_reads(monkeypatch):
+    """统计打开图片或 JSON 读取 metadata 的次数"""
+    reads = []
+    read = reference_index.read_reference_metadata
+
+    def counting_read(image_path, json_path=None):
+        reads.append(image_path)
+        return read(image_path, json_path)
+
+    monkeypatch.setattr(reference_index, "read_reference_metadata", counting_read)
+    return reads
+
+
+def touch_dir(path):
+    """推进目录 mtime，避免增删文件发生在同一个时钟刻度内时 mtime 不变"""
+    mtime = os.stat(path).st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_reload_does_not_reread_unchanged_files(example_dir, monkeypatch):
+    reads = count_reads(monkeypatch)
+    write_reference(example_dir, "a/one.png")
+    write_reference(example_dir, "b/two.png")
+    assert make_index(example_dir).query()["total"] == 2
+    assert len(reads) == 2
+
+    # 新实例从索引文件加载，文件没有变化时不再打开
+    reads.clear()
+    index = make_index(example_dir)
+    assert index.query()["total"] == 2
+    assert reads == []
+
+    write_reference(example_dir, "a/three.png")
+    touch_dir(os.path.join(example_dir, "a"))
+    index.mark_stale()
+    assert index.query()["total"] == 3
+    assert reads == [os.path.join(example_dir, "a", "three.png")]
+
+
+def test_in_place_edit_is_read_when_stale(example_dir):
+    image_path = write_reference(example_dir, "a/one.png", sampler="euler")
+    index = make_index(example_dir)
+    index.watched = True
+    assert index.query()["references"][0]["sampler"] == "euler"
+
+    # 原地修改不改变目录 mtime，只有标记为 stale 后 stat 文件时才能发现
+    write_reference(example_dir, "a/one.png", sampler="dpmpp_2m")
+    json_path = os.path.splitext(image_path)[0] + ".json"
+    mtime = os.stat(json_path).st_mtime_ns + 1_000_000_000
+    os.utime(json_path, ns=(mtime, mtime))
+    assert index.query()["references"][0]["sampler"] == "euler"
+    index.mark_stale()
+    assert index.query()["references"][0]["sampler"] == "dpmpp_2m"
+
+
+def test_deleted_files_leave_the_index(example_dir):
+    write_reference(example_dir, "a/one.png")
+    image_path = write_reference(example_dir, "a/two.png", lora_name="zebra")
+    index = make_index(example_dir)
+    assert index.query()["total"] == 2
+    assert index.query(search="zebra")["total"] == 1
+
+    os.remove(image_path)
+    os.remove(os.path.splitext(image_path)[0] + ".json")
+    touch_dir(os.path.join(example_dir, "a"))
+    result = index.query()
+    assert [ref["lora_name"] for ref in result["references"]] == ["one.png"]
+    assert index.query(search="zebra")["total"] == 0
+
+    shutil.rmtree(os.path.join(example_dir, "a"))
+    touch_dir(example_dir)
+    assert index.query()["total"] == 0
+
+
+def test_categories_count_listed_and_read_images(example_dir, monkeypatch):
+    reads = count_reads(monkeypatch)
+    write_reference(example_dir, "root.png")
+    write_reference(example_dir, "a/one.png")
+    write_reference(example_dir, "a/two.png")
+    write_reference(example_dir, "a/empty.png", prompt="")
+    write_reference(example_dir, "b/c/deep.png")
+    os.makedirs(os.path.join(example_dir, "d"))
+    index = make_index(example_dir)
+
+    # 还没有读取的图片按目录列表计数，不打开任何文件
+    expected = [
+        {"name": "a", "count": 3},
+        {"name": "b/c", "count": 1},
+        {"name": "root", "count": 1},
+    ]
+    assert index.categories() == expected
+    assert reads == []
+
+    # 读取后没有提示词的图片不再计入
+    index.get_data()
+    expected[0]["count"] = 2
+    assert index.categories() == expected
+
+
+def facet_counts(result, field):
+    return {item["value"]: item["count"] for item in result["facets"][field]}
+
+
+def test_facets_or_within_and_across_with_disjunctive_counts(example_dir):
+    for name, sampler, model in [
+        ("a", "euler", "m1"),
+        ("b", "euler", "m2"),
+        ("c", "dpm", "m1"),
+        ("d", "dpm", "m2"),
+        ("e", "ddim", "m1"),
+    ]:
+        write_reference(example_dir, f"{name}.png", sampler=sampler, model=model)
+    index = make_index(example_dir)
+
+    def names(result):
+        return sorted(ref["lora_name"] for ref in result["references"])
+
+    # 同一分面内为"或"
+    result = index.query(filters={"sampler": ["euler", "dpm"]})
+    assert names(result) == ["a.png", "b.png", "c.png", "d.png"]
+    # 本分面的数量不受本分面的选择影响，其它分面按筛选结果统计
+    assert facet_counts(result, "sampler") == {"euler": 2, "dpm": 2, "ddim": 1}
+    assert facet_counts(result, "model") == {"m1": 2, "m2": 2}
+
+    # 不同分面之间为"与"
+    result = index.query(filters={"sampler": ["euler", "dpm"], "model": ["m1"]})
+    assert names(result) == ["a.png", "c.png"]
+    assert facet_counts(result, "sampler") == {"euler": 1, "dpm": 1, "ddim": 1}
+    assert facet_counts(result, "model") == {"m1": 2, "m2": 2}
+
+    # 没有匹配的已选取值仍然列出，数量为 0
+    result = index.query(filters={"sampler": ["heun"]})
+    assert result["total"] == 0
+    assert facet_counts(result, "sampler") == {
+        "euler": 2,
+        "dpm": 2,
+        "ddim": 1,
+        "heun": 0,
+    }
+
+
+def test_get_by_ids_keeps_request_order_and_reports_missing(example_dir):
+    for name in ("a", "b", "c"):
+        write_reference(example_dir, f"{name}.png", prompt=f"prompt {name}")
+    index = make_index(example_dir)
+    ids = {ref["prompt"]: ref["id"] for ref in index.query()["references"]}
+
+    result = index.get_by_ids(
+        [ids["prompt c"], "unknown", ids["prompt a"], ids["prompt c"]]
+    )
+    assert [ref["prompt"] for ref in result["references"]] == ["prompt c", "prompt a"]
+    assert result["missing"] == ["unknown"]
+
+    # id 不依赖路径：移动到其它目录后仍能找到
+    os.makedirs(os.path.join(example_dir, "moved"))
+    for ext in (".png", ".json"):
+        os.rename(
+            os.path.join(example_dir, "b" + ext),
+            os.path.join(example_dir, "moved", "b" + ext),
+        )
+    touch_dir(example_dir)
+    [ref] = index.get_by_ids([ids["prompt b"]])["references"]
+    assert ref["category"] == "moved"
@@ -0,0 +1,71 @@
+from prompt_manage.search_index import (
+    REFERENCE_FIELD_ALIASES,
+    REFERENCE_FIELD_WEIGHTS,
+    REFERENCE_PREFIX_ONLY_FIELDS,
+    InvertedIndex,
+    parse_query,
+)
+
+
+def make_index(docs):
+    index = InvertedIndex(REFERENCE_FIELD_WEIGHTS)
+    for doc_id, fields in docs.items():
+        index.add(doc_id, fields)
+    return index
+
+
+def search(index, query):
+    hits = index.search_query(
+        query, REFERENCE_FIELD_ALIASES, prefix_only_fields=REFERENCE_PREFIX_ONLY_FIELDS
+    )
+    return [doc_id for doc_id, _ in hits]
+
+
+def test_unqualified_exclusion_ignores_negative_prompt():
+    index = make_index(
+        {
+            "beach": {"prompt": "1girl, beach", "negative_prompt": "nsfw"},
+            "lewd": {"prompt": "1girl, nsfw", "negative_prompt": "blurry"},
+        }
+    )
+    assert search(index, "1girl -nsfw") == ["beach"]
+    assert search(index, "1girl -neg:nsfw") == ["lewd"]
+
+
+def test_unqualified_term_ignores_negative_prompt():
+    index = make_index(
+        {
+            "a": {"prompt": "1girl, beach", "negative_prompt": "blurry"},
+            "b": {"prompt": "blurry background", "negative_prompt": ""},
+        }
+    )
+    assert search(index, "blurry") == ["b"]
+    assert sorted(search(index, "neg:blurry")) == ["a"]
+
+
+def test_parse_query_exclusions_and_field_prefixes():
+    terms = parse_query(
+        "Girl -nsfw sampler:Euler_a -neg:blurry foo:bar - lora:",
+        REFERENCE_FIELD_ALIASES,
+    )
+    assert terms == [
+        (False, None, "girl"),
+        (True, None, "nsfw"),
+        (False, "sampler", "euler_a"),
+        (True, "negative_prompt", "blurry"),
+        # 未知前缀按普通文本处理
+        (False, None, "foo"),
+        (False, None, "bar"),
+    ]
+
+
+def test_field_prefix_limits_matches_to_that_field():
+    index = make_index(
+        {
+            "a": {"prompt": "euler landscape", "sampler": "dpmpp_2m"},
+            "b": {"prompt": "portrait", "sampler": "euler"},
+        }
+    )
+    assert search(index, "sampler:euler") == ["b"]
+    assert sorted(search(index, "euler")) == ["a", "b"]
+    assert search(index, "-sampler:euler") == ["a"]
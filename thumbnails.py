@@ -0,0 +1,192 @@
+"""
+缩略图缓存 - Lora / 参考图网格使用的小图
+
+- 缓存文件按内容寻址：sha1(源文件路径 | mtime | size | 宽度 | 格式)，
+  源文件修改后自然生成新的缩略图，旧文件由 LRU 淘汰
+- 缩放在独立线程池中用 Pillow 完成，不阻塞事件循环；同一缩略图的并发请求只生成一次
+- 缓存总大小超过预算时按最近访问时间淘汰（命中时更新文件 mtime，重启后顺序仍然有效）
+
+不依赖插件内其他模块，独立脚本（prompt_reader）也可以直接导入
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 宽度向上取整到这些档位，避免任意宽度把缓存撑爆
+THUMBNAIL_WIDTHS = (128, 256, 384, 512, 768, 1024)
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+THUMBNAIL_TYPES = {".webp": "image/webp", ".jpeg": "image/jpeg", ".png": "image/png"}
+# 高度上限为宽度的倍数（超长图只保留缩放后的上部比例）
+MAX_ASPECT = 3
+
+
+def normalize_width(width) -> Optional[int]:
+    """把请求的宽度取整到档位，无效时返回 None"""
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return None
+    if width <= 0:
+        return None
+    for step in THUMBNAIL_WIDTHS:
+        if width <= step:
+            return step
+    return THUMBNAIL_WIDTHS[-1]
+
+
+class ThumbnailCache:
+    """磁盘缩略图缓存"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, workers: int = 2):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限
+            workers: 缩放线程数
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="PromptManageThumb"
+        )
+        self._lock = threading.Lock()
+        # 缓存文件路径 -> 大小，按最近访问排序
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    # ===== LRU =====
+
+    def _load(self):
+        """启动后第一次使用时扫描缓存目录，按 mtime 恢复访问顺序"""
+        files = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    if name.endswith(".tmp"):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((st.st_mtime, path, st.st_size))
+        files.sort()
+        for _, path, size in files:
+            self._entries[path] = size
+            self._total += size
+        self._loaded = True
+
+    def _touch(self, path):
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _add(self, path, size):
+        with self._lock:
+            self._total += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_path, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+    # ===== 生成 =====
+
+    def _cache_path(self, source, stamp, width, fmt):
+        key = hashlib.sha1(
+            f"{source}|{stamp[0]}|{stamp[1]}|{width}|{fmt}".encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+
+    def _render(self, source, target, width, fmt):
+        with Image.open(source) as img:
+            # JPEG 可以在解码时直接降采样，大图快很多
+            img.draft("RGB", (width, width * MAX_ASPECT))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((width, width * MAX_ASPECT), Image.Resampling.LANCZOS)
+
+            if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.{threading.get_ident()}.tmp"
+            save_kwargs = {"quality": 80} if fmt in ("webp", "jpeg") else {}
+            img.save(tmp_path, THUMBNAIL_FORMATS[fmt], **save_kwargs)
+        os.replace(tmp_path, target)
+        return os.path.getsize(target)
+
+    def _get_or_create(self, source, width, fmt):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        target = self._cache_path(source, (st.st_mtime_ns, st.st_size), width, fmt)
+        if os.path.exists(target):
+            self._touch(target)
+            return target
+        try:
+            size = self._render(source, target, width, fmt)
+        except Exception as e:
+            logger.warning(f"Failed to create thumbnail for {source}: {e}")
+            return None
+        self._add(target, size)
+        return target
+
+    async def get(self, source: str, width, fmt: str = "webp") -> Optional[str]:
+        """
+        获取缩略图路径，生成失败（无法解码等）时返回 None
+
+        Args:
+            source: 源图片绝对路径
+            width: 请求的宽度（取整到 THUMBNAIL_WIDTHS）
+            fmt: webp / jpeg / png
+        """
+        width = normalize_width(width)
+        fmt = (fmt or "webp").lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if width is None or fmt not in THUMBNAIL_FORMATS:
+            return None
+
+        key = f"{source}|{width}|{fmt}"
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._pool, self._get_or_create, source, width, fmt
+            )
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
@@ -5,6 +5,15 @@ let translations = {};
 // ===== API 和全局常量 =====
 const API_BASE = "/prompt_manage";
 const LORA_API_BASE = "/prompt_manage/lora";
+// 列表视图需要的字段，notes（CivitAI 完整描述）在详细模式下按类别再加载
+const LORA_LIST_FIELDS = "id,name,base_model,filename,category,trigger_words,preview_url,path";
+// 网格卡片使用的缩略图宽度（卡片约 180px，按 2 倍像素密度取）
+const THUMBNAIL_WIDTH = 384;
+
+// 图片接口地址加上缩略图参数
+function thumbnailUrl(url, width = THUMBNAIL_WIDTH) {
+    return `${url}&w=${width}&format=webp`;
+}
 
 // ===== 全局变量 =====
 let currentLang = localStorage.getItem("promptLang") || "zh";
@@ -15,7 +24,11 @@ let currentLang_inner = currentLang;
 // 提示词库变量
 let prompts = [];
 let selectedIndexes = [];
-let editingIndex = -1;
+let editingId = null;
+let promptVersion = 0;  // 服务端提示词库版本号，用于增量同步
+let promptSearchIds = null;  // 服务端搜索结果（按相关度排序的 id），null 表示未搜索
+let promptSearchTimer = null;
+let promptSearchSeq = 0;
 let detailMode = false;
 let savedTypeFilterValue;
 
@@ -30,10 +43,11 @@ let loraDataLoaded = false;  // 标志Lora数据是否已加载
 // 提示词参考变量
 let referenceData = [];
 let referenceCategories = [];
+let referenceCategoryCounts = {};  // {类别: 参考图数量}
 let referenceSearchText = "";
 let referenceDataLoaded = false;
 let currentRightTab = "generator";
-let referenceSelectedIndexes = [];  // 保存提示词参考的选择状态
+let referenceSelectedIds = [];  // 保存提示词参考的选择状态（参考图记录的 id）
 // 分页加载相关变量
 let referencePageSize = 100;  // 每次加载100张
 let referenceCurrentPage = 0;  // 当前页码
@@ -41,6 +55,11 @@ let referenceTotalCount = 0;  // 总数量
 let referenceHasMore = true;  // 是否还有更多数据
 let referenceLoadingMore = false;  // 是否正在加载更多
 let referenceLoadedItemsCount = 0;  // 已加载的项目数量
+const REFERENCE_FACET_FIELDS = ["sampler", "model", "steps", "cfg_scale", "resolution", "lora_name"];
+const REFERENCE_SORT_KEYS = ["", "date", "resolution", "name"];
+let referenceFacetFilters = {};  // {分面: 选中的取值}
+let referenceFacets = {};  // 服务端返回的分面数量 {分面: [{value, count}]}
+let referenceSort = "";  // 排序方式（空字符串为默认顺序）
 
 
 // 加载翻译和LLM模板
@@ -686,11 +705,73 @@ function restoreLeftTabState() {
 
 // 加载数据
 async function loadPrompts() {
-    const res = await fetch(API_BASE + "/get", { method: "POST" });
-    prompts = await res.json();
+    const res = await fetch(`${API_BASE}/changes?since=0`, { method: "GET" });
+    const data = await res.json();
+    prompts = data.prompts || [];
+    promptVersion = data.version;
     renderList();
 }
 
+// 增量同步：只拉取 promptVersion 之后的变化（包括其他标签页的修改）
+async function syncPromptChanges() {
+    const res = await fetch(`${API_BASE}/changes?since=${promptVersion}`, { method: "GET" });
+    const data = await res.json();
+    if (data.full) {
+        prompts = data.prompts || [];
+    } else {
+        applyPromptChanges(data.changes);
+    }
+    promptVersion = data.version;
+    searchPrompts(document.getElementById("searchInput").value);
+}
+
+// 把变更记录应用到本地列表
+function applyPromptChanges(changes) {
+    changes.forEach(change => {
+        const idx = prompts.findIndex(p => p.id === change.id);
+        if (change.op === "delete") {
+            if (idx !== -1) prompts.splice(idx, 1);
+        } else if (idx !== -1) {
+            prompts[idx] = change.item;
+        } else {
+            prompts.push(change.item);
+        }
+    });
+}
+
+// 处理增删改接口的返回：版本号连续时直接应用，否则说明有其他修改，走增量同步
+async function applyMutationResult(changes, version) {
+    if (version === promptVersion + changes.length) {
+        applyPromptChanges(changes);
+        promptVersion = version;
+        searchPrompts(document.getElementById("searchInput").value);
+    } else {
+        await syncPromptChanges();
+    }
+}
+
+// 服务端搜索（倒排索引，支持模糊/精确），结果只包含 id，条目从本地列表取
+async function searchPrompts(query) {
+    const seq = ++promptSearchSeq;
+    if (!query.trim()) {
+        promptSearchIds = null;
+        renderList(query);
+        return;
+    }
+    const params = new URLSearchParams({
+        q: query,
+        mode: document.getElementById("searchMode").value,
+        limit: 0,
+        fields: "id"
+    });
+    const res = await fetch(`${API_BASE}/search?${params.toString()}`, { method: "GET" });
+    const data = await res.json();
+    // 输入过程中已经发出了更新的搜索
+    if (seq !== promptSearchSeq) return;
+    promptSearchIds = data.results.map(item => item.id);
+    renderList(query);
+}
+
 // 渲染列表
 function renderList(filter = "") {
     const list = document.getElementById("promptList");
@@ -706,14 +787,15 @@ function renderList(filter = "") {
         list.classList.remove("detail-mode");
     }
 
-    prompts.forEach((item, idx) => {
-        const mode = document.getElementById("searchMode").value;
-        const text = `${item.name} ${item.note || ""} ${item.text}`.toLowerCase();
-        const query = filter.toLowerCase();
-        const match = mode === "exact" ? text.includes(query) && query : text.includes(query);
+    // 有搜索词时按服务端返回的相关度顺序显示
+    let visibleIndexes = prompts.map((_, idx) => idx);
+    if (filter && promptSearchIds !== null) {
+        const indexById = new Map(prompts.map((item, idx) => [item.id, idx]));
+        visibleIndexes = promptSearchIds.map(id => indexById.get(id)).filter(idx => idx !== undefined);
+    }
 
-        // 检查文本匹配
-        if (filter && !match) return;
+    visibleIndexes.forEach(idx => {
+        const item = prompts[idx];
 
         // 检查类型筛选
         const itemType = item.type || "其它";
@@ -779,7 +861,13 @@ function updateButtonVisibility() {
 
 // 搜索
 document.getElementById("searchInput").addEventListener("input", e => {
-    renderList(e.target.value);
+    clearTimeout(promptSearchTimer);
+    promptSearchTimer = setTimeout(() => searchPrompts(e.target.value), 150);
+});
+
+// 切换搜索模式
+document.getElementById("searchMode").addEventListener("change", () => {
+    searchPrompts(document.getElementById("searchInput").value);
 });
 
 // 类型筛选
@@ -808,7 +896,7 @@ function editSelected() {
 
     const idx = selectedIndexes[0];
     const item = prompts[idx];
-    editingIndex = idx;
+    editingId = item.id;
 
     // 填充表单
     document.getElementById("newName").value = item.name;
@@ -832,7 +920,7 @@ document.getElementById("editBtn").onclick = editSelected;
 // 取消编辑
 function cancelEdit() {
     const t = translations[currentLang];
-    editingIndex = -1;
+    editingId = null;
 
     // 清空表单
     document.getElementById("newName").value = "";
@@ -865,11 +953,12 @@ document.getElementById("addBtn").onclick = async () => {
     const t = translations[currentLang];
     if (!name || !text) return alert(t.alert_required);
 
-    await fetch(API_BASE + "/add", {
+    const res = await fetch(API_BASE + "/prompt/add", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ name, direction, type, note, text })
     });
+    const data = await res.json();
 
     document.getElementById("newName").value = "";
     document.getElementById("newDirection").value = "无";
@@ -877,7 +966,7 @@ document.getElementById("addBtn").onclick = async () => {
     document.getElementById("newNote").value = "";
     document.getElementById("newText").value = "";
     selectedIndexes = [];
-    loadPrompts();
+    await applyMutationResult([{ op: "upsert", id: data.item.id, item: data.item }], data.version);
 };
 
 // 确认编辑
@@ -890,11 +979,12 @@ document.getElementById("confirmEditBtn").onclick = async () => {
     const t = translations[currentLang];
     if (!name || !text) return alert(t.alert_required);
 
-    await fetch(API_BASE + "/update", {
+    const res = await fetch(API_BASE + "/prompt/update", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ index: editingIndex, name, direction, type, note, text })
+        body: JSON.stringify({ id: editingId, name, direction, type, note, text })
     });
+    const data = await res.json();
 
     document.getElementById("newName").value = "";
     document.getElementById("newDirection").value = "无";
@@ -903,7 +993,12 @@ document.getElementById("confirmEditBtn").onclick = async () => {
     document.getElementById("newText").value = "";
     cancelEdit();
     selectedIndexes = [];
-    loadPrompts();
+    if (res.ok) {
+        await applyMutationResult([{ op: "upsert", id: data.item.id, item: data.item }], data.version);
+    } else {
+        // 条目已被其他标签页删除
+        await syncPromptChanges();
+    }
 };
 
 // 删除（支持批量删除）
@@ -920,19 +1015,19 @@ function deleteSelected() {
         return;
     }
 
-    // 按从大到小的顺序删除，避免索引错乱
-    const sortedIndexes = [...selectedIndexes].sort((a, b) => b - a);
+    // 按 id 批量删除，不受其他标签页修改导致的索引变化影响
+    const ids = selectedIndexes.map(idx => prompts[idx].id);
 
-    Promise.all(sortedIndexes.map(idx =>
-        fetch(API_BASE + "/delete", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ index: idx })
-        })
-    )).then(() => {
-        selectedIndexes = [];
-        loadPrompts();
-    });
+    fetch(API_BASE + "/prompt/delete", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ids })
+    })
+        .then(res => res.json())
+        .then(data => {
+            selectedIndexes = [];
+            return applyMutationResult(data.deleted.map(id => ({ op: "delete", id })), data.version);
+        });
 }
 
 // 删除按钮事件
@@ -1170,11 +1265,11 @@ llmGenerateBtn.onclick = async () => {
 
     // 获取右侧提示词参考中选中的示例
     let referenceExamples = "";
-    if (referenceSelectedIndexes.length > 0) {
+    if (referenceSelectedIds.length > 0) {
         try {
             // 从后端获取选中的提示词参考数据
             const params = new URLSearchParams();
-            referenceSelectedIndexes.forEach(id => params.append("ids", id));
+            referenceSelectedIds.forEach(id => params.append("ids", id));
             const res = await fetch(`${API_BASE}/reference/get_by_ids?${params.toString()}`, { method: "GET" });
             if (res.ok) {
                 const data = await res.json();
@@ -1225,7 +1320,7 @@ llmCopyBtn.onclick = () => {
 async function loadLoraData() {
     try {
         console.log("[PromptManage] Starting to load Lora data from:", LORA_API_BASE + "/list");
-        const res = await fetch(LORA_API_BASE + "/list", { method: "GET" });
+        const res = await fetch(`${LORA_API_BASE}/list?fields=${LORA_LIST_FIELDS}`, { method: "GET" });
         console.log("[PromptManage] Fetch response status:", res.status, res.statusText);
 
         if (!res.ok) {
@@ -1299,11 +1394,44 @@ function updateLoraCategories() {
     });
 }
 
+// 详细模式下按类别加载 notes，加载完成后重新渲染
+let loraNotesLoading = new Set();
+async function ensureLoraNotes(category = "") {
+    const missing = loraData.some(item => item.notes === undefined && (!category || item.category === category));
+    if (!missing || loraNotesLoading.has(category)) return;
+
+    loraNotesLoading.add(category);
+    try {
+        const params = new URLSearchParams({ fields: "id,notes" });
+        if (category) params.append("category", category);
+        const res = await fetch(`${LORA_API_BASE}/list?${params.toString()}`, { method: "GET" });
+        if (!res.ok) return;
+        const data = await res.json();
+        const notesById = new Map((data.loras || []).map(lora => [lora.id, lora.notes || ""]));
+        loraData.forEach(item => {
+            if (item.notes === undefined && (!category || item.category === category)) {
+                item.notes = notesById.get(item.id) || "";
+            }
+        });
+        if (loraDetailMode && document.getElementById("loraCategory").value === category) {
+            renderLoraList(category);
+        }
+    } catch (err) {
+        console.error("[PromptManage] Error loading lora notes:", err);
+    } finally {
+        loraNotesLoading.delete(category);
+    }
+}
+
 // 渲染Lora列表
 function renderLoraList(category = "") {
     const list = document.getElementById("loraList");
     list.innerHTML = "";
 
+    if (loraDetailMode) {
+        ensureLoraNotes(category);
+    }
+
     // 根据详细模式更新容器类
     if (loraDetailMode) {
         list.classList.add("detail-mode");
@@ -1366,7 +1494,7 @@ function renderLoraList(category = "") {
                                 alt="${item.name}" muted preload="metadata"></video>` + textContent;
                 } else {
                     // 图片文件
-                    innerHTML = `<img src="${item.preview_url}" alt="${item.name}">` + textContent;
+                    innerHTML = `<img src="${thumbnailUrl(item.preview_url)}" alt="${item.name}" loading="lazy">` + textContent;
                 }
             } else {
                 innerHTML = textContent;
@@ -1416,38 +1544,75 @@ document.getElementById("loraDeselectBtn").addEventListener("click", () => {
     renderLoraList(document.getElementById("loraCategory").value);
 });
 
+// Lora联网更新任务（后台执行，轮询进度；更新中再次点击按钮可取消）
+let loraRefreshTaskId = null;
+
 // Lora联网更新按钮 - 现在支持从CivitAI获取模型
 document.getElementById("loraRefreshBtn").addEventListener("click", async () => {
     const t = translations[currentLang];
     const btn = document.getElementById("loraRefreshBtn");
 
-    // 禁用按钮并显示加载状态
-    btn.disabled = true;
+    if (loraRefreshTaskId) {
+        // 正在更新，则取消任务
+        try {
+            await fetch(`/prompt_manage/lora/refresh-cancel?task_id=${loraRefreshTaskId}`, {
+                method: "POST"
+            });
+        } catch (err) {
+            console.error("[PromptManage] Cancel Lora refresh error:", err);
+        }
+        return;
+    }
+
+    // 显示加载状态
     const originalText = btn.textContent;
     btn.textContent = "⏳ 更新中...";
+    btn.disabled = true;
 
     try {
-        // 调用后端API进行更新
+        // 提交后台更新任务
         const response = await fetch("/prompt_manage/lora/refresh?mode=all");
         const result = await response.json();
+        btn.disabled = false;
+        if (!result.success) {
+            alert(t.lora_refresh_failed || `更新失败: ${result.message}`);
+            return;
+        }
+        if (!result.task_id) {
+            alert(result.message);
+            return;
+        }
 
-        if (result.success) {
-            // 更新成功，重新加载Lora数据
-            alert(t.lora_refresh_success || result.message);
-            await loadLoraData();
-            // 恢复之前选中的类别
-            const categorySelect = document.getElementById("loraCategory");
-            const savedCategory = localStorage.getItem("loraCategory") || "";
-            categorySelect.value = savedCategory;
-            renderLoraList(savedCategory);
+        // 轮询任务进度，直到结束
+        loraRefreshTaskId = result.task_id;
+        let status;
+        do {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const statusResponse = await fetch(`/prompt_manage/lora/refresh-status?task_id=${loraRefreshTaskId}`);
+            status = await statusResponse.json();
+            if (status.status === "running") {
+                btn.textContent = `⏳ ${status.progress}% (${status.completed}/${status.total})`;
+            }
+        } while (status.status === "running");
+
+        if (status.status === "completed") {
+            alert(t.lora_refresh_success || status.message);
         } else {
-            alert(t.lora_refresh_failed || `更新失败: ${result.message}`);
+            alert(status.message || t.lora_refresh_failed);
         }
+        // 重新加载Lora数据
+        await loadLoraData();
+        // 恢复之前选中的类别
+        const categorySelect = document.getElementById("loraCategory");
+        const savedCategory = localStorage.getItem("loraCategory") || "";
+        categorySelect.value = savedCategory;
+        renderLoraList(savedCategory);
     } catch (err) {
         console.error("[PromptManage] Lora refresh error:", err);
         alert(t.lora_refresh_error || "更新过程中出错，请检查浏览器控制台");
     } finally {
         // 恢复按钮状态
+        loraRefreshTaskId = null;
         btn.disabled = false;
         btn.textContent = originalText;
     }
@@ -1549,19 +1714,72 @@ function updateLoraText() {
     textArea.value = text;
 }
 
+// 服务端目录变化后重新拉取Lora列表，保留当前选中的类别
+async function refreshLoraData() {
+    try {
+        const res = await fetch(`${LORA_API_BASE}/list?fields=${LORA_LIST_FIELDS}`, { method: "GET" });
+        if (!res.ok) return;
+        const data = await res.json();
+        loraData = data.loras || [];
+        loraCategories = data.categories || [];
+
+        const categorySelect = document.getElementById("loraCategory");
+        const selected = categorySelect.value;
+        updateLoraCategories();
+        categorySelect.value = loraCategories.includes(selected) ? selected : "";
+        renderLoraList(categorySelect.value);
+    } catch (err) {
+        console.error("[PromptManage] Error refreshing lora data:", err);
+    }
+}
+
+// ===== 目录变化推送 =====
+// 服务端监视 Lora 和示例图目录，变化时通过 ComfyUI 的 websocket 推送事件
+function connectChangeEvents() {
+    const protocol = location.protocol === "https:" ? "wss" : "ws";
+    let socket;
+    try {
+        socket = new WebSocket(`${protocol}://${location.host}/ws`);
+    } catch (err) {
+        console.warn("[PromptManage] Change events unavailable:", err);
+        return;
+    }
+
+    socket.addEventListener("message", (event) => {
+        if (typeof event.data !== "string") return;
+        let msg;
+        try {
+            msg = JSON.parse(event.data);
+        } catch (err) {
+            return;
+        }
+        if (msg.type === "prompt_manage.lora_changed") {
+            if (loraDataLoaded) refreshLoraData();
+        } else if (msg.type === "prompt_manage.reference_changed") {
+            referenceDataLoaded = false;
+            if (currentRightTab === "reference") {
+                loadReferenceData();
+            }
+        }
+    });
+
+    // 断线后稍后重连（ComfyUI 重启等）
+    socket.addEventListener("close", () => {
+        setTimeout(connectChangeEvents, 5000);
+    });
+}
+
+connectChangeEvents();
+
 // ===== 提示词参考功能 =====
 
 // 加载提示词参考数据（只加载类别列表）
 async function loadReferenceData() {
     try {
-        console.log("[PromptManage] Starting to load reference categories from:", API_BASE + "/reference/list");
-
-        // 先获取类别列表（offset=0, limit=0 只返回类别和数据哈希）
-        const params = new URLSearchParams();
-        params.append("offset", "0");
-        params.append("limit", "0");
+        console.log("[PromptManage] Starting to load reference categories from:", API_BASE + "/reference/categories");
 
-        const res = await fetch(`${API_BASE}/reference/list?${params.toString()}`, { method: "GET" });
+        // 只获取类别和数量（服务端只列目录，不读取图片）
+        const res = await fetch(`${API_BASE}/reference/categories`, { method: "GET" });
         console.log("[PromptManage] Fetch response status:", res.status, res.statusText);
 
         if (!res.ok) {
@@ -1574,7 +1792,8 @@ async function loadReferenceData() {
         const data = await res.json();
         console.log("[PromptManage] Received reference data:", data);
 
-        referenceCategories = data.categories || [];
+        referenceCategories = (data.categories || []).map(cat => cat.name);
+        referenceCategoryCounts = Object.fromEntries((data.categories || []).map(cat => [cat.name, cat.count]));
 
         console.log(`[PromptManage] Loaded ${referenceCategories.length} categories:`, referenceCategories);
 
@@ -1582,7 +1801,7 @@ async function loadReferenceData() {
         referenceDataLoaded = true;
 
         // 恢复选中状态
-        restoreReferenceSelectedIndexes();
+        restoreReferenceSelectedIds();
 
         // 直接更新UI，不等待翻译加载
         updateReferenceCategories();
@@ -1629,26 +1848,78 @@ function updateReferenceCategories() {
         referenceCategories.forEach(cat => {
             const option = document.createElement("option");
             option.value = cat;
-            option.textContent = cat;
+            option.textContent = referenceCategoryCounts[cat] !== undefined ? `${cat} (${referenceCategoryCounts[cat]})` : cat;
             categorySelect.appendChild(option);
         });
     }
 }
 
+// 更新分面筛选和排序下拉框（分面数量来自当前查询的第一页）
+function updateReferenceFacetControls() {
+    const t = translations[currentLang] || {};
+    const container = document.getElementById("referenceFacets");
+    if (!container) return;
+    container.innerHTML = "";
+
+    REFERENCE_FACET_FIELDS.forEach(field => {
+        const values = referenceFacets[field] || [];
+        if (values.length === 0 && !referenceFacetFilters[field]) return;
+
+        const select = document.createElement("select");
+        select.className = "search-mode";
+        const label = t[`reference_facet_${field}`] || field;
+        select.innerHTML = `<option value="">${label}: ${t.reference_category_all || "全部"}</option>`;
+        values.forEach(item => {
+            const option = document.createElement("option");
+            option.value = item.value;
+            option.textContent = `${item.value} (${item.count})`;
+            select.appendChild(option);
+        });
+        select.value = referenceFacetFilters[field] || "";
+        select.addEventListener("change", (e) => {
+            if (e.target.value) {
+                referenceFacetFilters[field] = e.target.value;
+            } else {
+                delete referenceFacetFilters[field];
+            }
+            renderReferenceList(document.getElementById("referenceCategory").value);
+        });
+        container.appendChild(select);
+    });
+
+    const sortSelect = document.createElement("select");
+    sortSelect.className = "search-mode";
+    REFERENCE_SORT_KEYS.forEach(key => {
+        const option = document.createElement("option");
+        option.value = key;
+        option.textContent = t[`reference_sort_${key || "default"}`] || key || "默认排序";
+        sortSelect.appendChild(option);
+    });
+    sortSelect.value = referenceSort;
+    sortSelect.addEventListener("change", (e) => {
+        referenceSort = e.target.value;
+        renderReferenceList(document.getElementById("referenceCategory").value);
+    });
+    container.appendChild(sortSelect);
+}
+
 // 保存提示词参考的选中状态到 localStorage
-function saveReferenceSelectedIndexes() {
-    localStorage.setItem("referenceSelectedIndexes", JSON.stringify(referenceSelectedIndexes));
+function saveReferenceSelectedIds() {
+    localStorage.setItem("referenceSelectedIds", JSON.stringify(referenceSelectedIds));
 }
 
 // 从 localStorage 恢复提示词参考的选中状态
-function restoreReferenceSelectedIndexes() {
-    const saved = localStorage.getItem("referenceSelectedIndexes");
+function restoreReferenceSelectedIds() {
+    // 旧版本按数组下标保存的选择，目录变化后会错位，不再使用
+    localStorage.removeItem("referenceSelectedIndexes");
+    const saved = localStorage.getItem("referenceSelectedIds");
     if (saved) {
         try {
-            referenceSelectedIndexes = JSON.parse(saved);
+            const ids = JSON.parse(saved);
+            referenceSelectedIds = Array.isArray(ids) ? ids.filter(id => typeof id === "string") : [];
         } catch (e) {
-            console.error("[PromptManage] Failed to parse referenceSelectedIndexes:", e);
-            referenceSelectedIndexes = [];
+            console.error("[PromptManage] Failed to parse referenceSelectedIds:", e);
+            referenceSelectedIds = [];
         }
     }
 }
@@ -1657,7 +1928,7 @@ function restoreReferenceSelectedIndexes() {
 function updateReferenceDeselectButton() {
     const deselectBtn = document.getElementById("referenceDeselectBtn");
     if (deselectBtn) {
-        deselectBtn.style.display = referenceSelectedIndexes.length > 0 ? "inline-block" : "none";
+        deselectBtn.style.display = referenceSelectedIds.length > 0 ? "inline-block" : "none";
     }
 }
 
@@ -1695,6 +1966,12 @@ async function loadMoreReferenceItems(category = "") {
     if (referenceSearchText) {
         params.append("search", referenceSearchText);
     }
+    for (const [field, value] of Object.entries(referenceFacetFilters)) {
+        params.append(field, value);
+    }
+    if (referenceSort) {
+        params.append("sort", referenceSort);
+    }
     params.append("offset", referenceLoadedItemsCount);
     params.append("limit", referencePageSize);
 
@@ -1713,6 +1990,8 @@ async function loadMoreReferenceItems(category = "") {
         // 更新总数量和加载状态
         if (referenceLoadedItemsCount === 0) {
             referenceTotalCount = data.total || 0;
+            referenceFacets = data.facets || {};
+            updateReferenceFacetControls();
         }
         referenceHasMore = data.has_more || false;
 
@@ -1723,7 +2002,7 @@ async function loadMoreReferenceItems(category = "") {
         for (const item of items) {
             const div = document.createElement("div");
             // 检查是否已选中
-            const isSelected = referenceSelectedIndexes.includes(item.id);
+            const isSelected = referenceSelectedIds.includes(item.id);
             div.className = "reference-item" + (isSelected ? " selected" : "");
 
             // 创建名称和类别的容器
@@ -1740,7 +2019,7 @@ async function loadMoreReferenceItems(category = "") {
             if (item.image_url) {
                 const t = translations[currentLang] || {};
                 const loadFailedText = encodeURIComponent(t.load_failed || "加载失败");
-                innerHTML += `<img src="${item.image_url}" alt="${item.lora_name}" loading="lazy" onerror="this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22180%22 height=%22180%22%3E%3Crect fill=%22%23ccc%22 width=%22180%22 height=%22180%22/%3E%3Ctext fill=%22%23666%22 x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 dy=%22.3em%22%3E${loadFailedText}%3C/text%3E%3C/svg%3E'">`;
+                innerHTML += `<img src="${thumbnailUrl(item.image_url)}" alt="${item.lora_name}" loading="lazy" onerror="this.src='data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22180%22 height=%22180%22%3E%3Crect fill=%22%23ccc%22 width=%22180%22 height=%22180%22/%3E%3Ctext fill=%22%23666%22 x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 dy=%22.3em%22%3E${loadFailedText}%3C/text%3E%3C/svg%3E'">`;
             }
 
             // 文字内容部分
@@ -1757,15 +2036,15 @@ async function loadMoreReferenceItems(category = "") {
             // 点击事件：处理多选逻辑
             div.onclick = () => {
                 // 多选逻辑：点击一次选中，再点击取消
-                if (referenceSelectedIndexes.includes(item.id)) {
-                    referenceSelectedIndexes = referenceSelectedIndexes.filter(id => id !== item.id);
+                if (referenceSelectedIds.includes(item.id)) {
+                    referenceSelectedIds = referenceSelectedIds.filter(id => id !== item.id);
                     div.classList.remove("selected");
                 } else {
-                    referenceSelectedIndexes.push(item.id);
+                    referenceSelectedIds.push(item.id);
                     div.classList.add("selected");
                 }
                 // 持久化保存选中状态
-                saveReferenceSelectedIndexes();
+                saveReferenceSelectedIds();
                 // 更新取消选择按钮的显示状态
                 updateReferenceDeselectButton();
             };
@@ -2076,8 +2355,8 @@ document.getElementById("downloadLoraImagesBtn").addEventListener("click", downl
 
 // 提示词参考取消选择按钮事件
 document.getElementById("referenceDeselectBtn").addEventListener("click", () => {
-    referenceSelectedIndexes = [];
-    saveReferenceSelectedIndexes();
+    referenceSelectedIds = [];
+    saveReferenceSelectedIds();
     updateReferenceDeselectButton();
     // 重新渲染当前列表以更新选中状态
     const categorySelect = document.getElementById("referenceCategory");